@@ -0,0 +1,69 @@
+"""Measures the latency of a chatty "send key, then send message" flow, when
+  opening a connection per request versus keeping one connection open.
+
+Usage: python -m benchmarks.bench_connections [engine] [iterations]
+"""
+import sys
+import time
+import statistics
+
+from benchmarks import utils
+
+
+def chat_flow(handler, sender_id: int, receiver_id: int) -> None:
+    from protocol.packets.request.requests import PublicKeyRequest, \
+        PopMessagesRequest
+    from protocol.packets.request.messages import SendSymmetricKeyRequest, \
+        SendMessageRequest
+
+    handler.handle(PublicKeyRequest(), {
+        'sender_client_id': sender_id, 'requested_client_id': receiver_id})
+    handler.handle(SendSymmetricKeyRequest(), {
+        'sender_client_id': sender_id, 'receiver_client_id': receiver_id,
+        'content': b'k' * 128})
+    handler.handle(SendMessageRequest(), {
+        'sender_client_id': sender_id, 'receiver_client_id': receiver_id,
+        'content': b'm' * 64})
+    handler.handle(PopMessagesRequest(), {'sender_client_id': receiver_id})
+
+
+def main() -> None:
+    from clientapp.handler import ClientHandler
+
+    engine = sys.argv[1] if len(sys.argv) > 1 else 'threading'
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    utils.setup_django()
+    server, port = utils.start_server(engine)
+    sender_id, receiver_id = utils.register_clients(port, 2)
+
+    for persistent in (False, True):
+        handler = ClientHandler('127.0.0.1', port)
+        if not persistent:
+            # emulates a connection per request
+            handle = handler.handle
+
+            def handler_handle(*args):
+                try:
+                    return handle(*args)
+                finally:
+                    handler.close()
+            handler.handle = handler_handle
+
+        latencies = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            chat_flow(handler, sender_id, receiver_id)
+            latencies.append(time.perf_counter() - start)
+        handler.close()
+        latencies.sort()
+        name = 'persistent' if persistent else 'connection per request'
+        print(utils.format_row(f'{engine} {name}', {
+            'flow p50 ms': statistics.median(latencies) * 1000,
+            'flow p99 ms': latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        }))
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+"""Compares the threading and asyncio server engines under many concurrent
+  clients polling for messages.
+
+Usage: python -m benchmarks.bench_engines [concurrent clients] [seconds]
+"""
+import sys
+
+from benchmarks import utils
+
+
+def pop_messages_request(client_id: int):
+    from protocol.packets.request.requests import PopMessagesRequest
+    return PopMessagesRequest(), {'sender_client_id': client_id}
+
+
+def main() -> None:
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    processes = 4
+    threads = max(concurrency // processes, 1)
+
+    utils.setup_django()
+    for engine in ('threading', 'asyncio'):
+        server, port = utils.start_server(engine)
+        client_ids = utils.register_clients(port, 20)
+        result = utils.run_load(
+            port, pop_messages_request, client_ids,
+            processes=processes, threads=threads, duration=duration,
+        )
+        print(utils.format_row(f'{engine} x{processes * threads}', result))
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
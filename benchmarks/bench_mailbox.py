@@ -0,0 +1,87 @@
+"""Compares SQLite's default journaling with the tuned profile of
+  MESSAGEU_SQLITE_PRAGMAS, under clients pushing messages while others pop
+  their messages concurrently.
+
+Each profile is served from a fresh database, in a separate process.
+
+Usage: python -m benchmarks.bench_mailbox [engine] [seconds]
+"""
+import sys
+import threading
+import multiprocessing
+
+from benchmarks import utils
+
+# SQLite's defaults
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'DELETE',
+    'synchronous': 'FULL',
+    'mmap_size': 0,
+    'cache_size': -2000,
+    'temp_store': 'DEFAULT',
+}
+
+CLIENTS = 20
+CONTENT_SIZE = 1024
+
+
+def push_request(client_id: int):
+    import random
+    from protocol.packets.request.messages import SendMessageRequest
+
+    return SendMessageRequest(), {
+        'sender_client_id': client_id,
+        'receiver_client_id': random.randint(1, CLIENTS),
+        'content': b'M' * CONTENT_SIZE,
+    }
+
+
+def pop_request(client_id: int):
+    from protocol.packets.request.requests import PopMessagesRequest
+    return PopMessagesRequest(), {'sender_client_id': client_id}
+
+
+def _run_profile(profile: str, engine: str, duration: float, results) -> None:
+    """Runs in a separate process, so each profile configures Django anew."""
+    from django.conf import settings
+
+    utils.setup_django()
+    if profile == 'default':
+        settings.MESSAGEU_SQLITE_PRAGMAS = DEFAULT_PRAGMAS
+        # connections opened by migrating already ran the tuned pragmas
+        from django.db import connection
+        connection.close()
+    server, port = utils.start_server(engine)
+    client_ids = utils.register_clients(port, CLIENTS)
+
+    push = {}
+    pusher = threading.Thread(target=lambda: push.update(utils.run_load(
+        port, push_request, client_ids,
+        processes=2, threads=8, duration=duration)))
+    pusher.start()
+    # a popper per client, as clients pop their own messages
+    pop = utils.run_load(
+        port, pop_request, client_ids,
+        processes=1, threads=CLIENTS, duration=duration)
+    pusher.join()
+    results.put((profile, push, pop))
+
+
+def main() -> None:
+    engine = sys.argv[1] if len(sys.argv) > 1 else 'threading'
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    for profile in ('default', 'tuned'):
+        process = context.Process(
+            target=_run_profile, args=(profile, engine, duration, results))
+        process.start()
+        profile, push, pop = results.get()
+        process.join()
+        print(utils.format_row(f'{engine} {profile} push', push))
+        print(utils.format_row(f'{engine} {profile} pop', pop))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""Compares a thread per connection with the bounded worker pool, under a
+  reconnect storm: many clients opening a connection per request.
+
+Usage: python -m benchmarks.bench_pool [concurrent clients] [seconds]
+"""
+import sys
+import time
+import threading
+
+from benchmarks import utils
+
+
+def list_clients_request(client_id: int):
+    from protocol.packets.request.requests import ListClientsRequest
+    return ListClientsRequest(), {'sender_client_id': client_id}
+
+
+def _sample_threads(peak: list, stop: threading.Event) -> None:
+    while not stop.wait(0.05):
+        peak[0] = max(peak[0], threading.active_count())
+
+
+def main() -> None:
+    from serverapp.metrics import metrics
+
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    processes = 4
+    threads = max(concurrency // processes, 1)
+
+    utils.setup_django()
+    for engine in ('threading-unbounded', 'threading'):
+        server, port = utils.start_server(engine)
+        client_ids = utils.register_clients(port, 20)
+        metrics.reset()
+        peak, stop = [threading.active_count()], threading.Event()
+        sampler = threading.Thread(target=_sample_threads, args=(peak, stop))
+        sampler.start()
+        result = utils.run_load(
+            port, list_clients_request, client_ids,
+            processes=processes, threads=threads, duration=duration,
+            reconnect=True, backoff=0.1,
+        )
+        stop.set()
+        sampler.join()
+        result['peak threads'] = peak[0]
+        snapshot = metrics.snapshot()
+        if 'queue_wait_count' in snapshot:
+            result['rejected'] = snapshot.get('connections_rejected', 0)
+            result['wait ms'] = snapshot['queue_wait_mean'] * 1000
+            result['max wait ms'] = snapshot['queue_wait_max'] * 1000
+        print(utils.format_row(f'{engine} x{processes * threads}', result))
+        server.shutdown()
+        server.server_close()
+        time.sleep(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""Compares serving from a single process with pre-forked processes sharing
+  the port, under many concurrent clients listing the clients.
+
+The load is CPU-bound packing and unpacking, so the processes only help with
+  spare cores: the clients run on the same machine.
+
+Usage: python -m benchmarks.bench_prefork [engine] [processes] [seconds]
+"""
+import os
+import sys
+
+from benchmarks import utils
+
+
+def list_clients_request(client_id: int):
+    from protocol.packets.request.requests import ListClientsRequest
+    return ListClientsRequest(), {'sender_client_id': client_id}
+
+
+def main() -> None:
+    engine = sys.argv[1] if len(sys.argv) > 1 else 'threading'
+    processes = int(sys.argv[2]) if len(sys.argv) > 2 \
+        else max(os.cpu_count() // 2, 2)
+    duration = float(sys.argv[3]) if len(sys.argv) > 3 else 10
+
+    db_dir = utils.setup_django()
+    for server_processes in (1, processes):
+        supervisor, port = utils.start_prefork_server(
+            engine, server_processes, db_dir)
+        client_ids = utils.register_clients(port, 20)
+        result = utils.run_load(
+            port, list_clients_request, client_ids,
+            processes=4, threads=16, duration=duration,
+        )
+        print(utils.format_row(
+            f'{engine} x{server_processes} processes', result))
+        supervisor.terminate()
+        supervisor.join()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""Compares inserting each pushed message in a transaction of its own with
+  group commits (see MESSAGEU_GROUP_COMMIT_*), under clients pushing messages
+  concurrently.
+
+Each profile is served from a fresh database, in a separate process.
+
+Usage: python -m benchmarks.bench_pushes [engine] [seconds]
+"""
+import sys
+import multiprocessing
+
+from benchmarks import utils
+from benchmarks.bench_mailbox import CLIENTS, push_request
+
+# commit interval and batch size
+PROFILES = {
+    'single': (0, 1),
+    'group': (0, 256),
+    'group 5ms': (0.005, 256),
+}
+
+
+def _run_profile(profile: str, engine: str, duration: float, results) -> None:
+    """Runs in a separate process, so each profile configures Django anew."""
+    from django.conf import settings
+
+    utils.setup_django()
+    settings.MESSAGEU_GROUP_COMMIT_INTERVAL, \
+        settings.MESSAGEU_GROUP_COMMIT_BATCH_SIZE = PROFILES[profile]
+    server, port = utils.start_server(engine)
+    client_ids = utils.register_clients(port, CLIENTS)
+    push = utils.run_load(
+        port, push_request, client_ids,
+        processes=2, threads=16, duration=duration)
+    results.put((profile, push))
+
+
+def main() -> None:
+    engine = sys.argv[1] if len(sys.argv) > 1 else 'threading'
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    for profile in PROFILES:
+        process = context.Process(
+            target=_run_profile, args=(profile, engine, duration, results))
+        process.start()
+        profile, push = results.get()
+        process.join()
+        print(utils.format_row(f'{engine} {profile}', push))
+
+
+if __name__ == '__main__':
+    main()
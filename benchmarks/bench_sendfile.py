@@ -0,0 +1,88 @@
+"""Compares the server CPU time spent delivering large file messages kept in
+  the database with those kept as blobs, which are sent by the kernel with
+  sendfile.
+
+Each mode is served from a fresh database, in a separate process. Files are
+  pushed by that process, and popped by another one - only the server CPU
+  time while popping is measured.
+
+Usage: python -m benchmarks.bench_sendfile [engine] [file MiB] [total MiB]
+"""
+import os
+import sys
+import time
+import multiprocessing
+
+from benchmarks import utils
+
+FILES_PER_POP = 8
+
+
+def _pop(args) -> int:
+    """Runs in a client process. Returns the size of the popped contents."""
+    port, client_id = args
+    from clientapp.handler import ClientHandler
+    from protocol.packets.request.requests import PopMessagesRequest
+
+    fields = ClientHandler('127.0.0.1', port).handle(
+        PopMessagesRequest(), {'sender_client_id': client_id})
+    return sum(len(row[-1]) for row in fields['messages'])
+
+
+def _run_mode(
+        mode: str, engine: str, file_size: int, total_size: int, results,
+) -> None:
+    """Runs in a separate process, so each mode configures Django anew."""
+    from django.conf import settings
+    from clientapp.handler import ClientHandler
+    from protocol.packets.request.messages import SendFileRequest
+
+    utils.setup_django()
+    if mode == 'database':
+        settings.MESSAGEU_BLOB_THRESHOLD = total_size
+    server, port = utils.start_server(engine)
+    sender_id, receiver_id = utils.register_clients(port, 2)
+    sender = ClientHandler('127.0.0.1', port)
+    content = os.urandom(file_size)
+
+    context = multiprocessing.get_context('spawn')
+    cpu = wall = delivered = 0
+    with context.Pool(1) as pool:
+        while delivered < total_size:
+            for _ in range(FILES_PER_POP):
+                sender.handle(SendFileRequest(), {
+                    'sender_client_id': sender_id,
+                    'receiver_client_id': receiver_id,
+                    'content': content,
+                })
+            cpu_started, wall_started = time.process_time(), time.monotonic()
+            delivered += pool.apply(_pop, ((port, receiver_id), ))
+            cpu += time.process_time() - cpu_started
+            wall += time.monotonic() - wall_started
+    results.put((mode, {
+        'GB': delivered / 10 ** 9,
+        'cpu s/GB': cpu / (delivered / 10 ** 9),
+        'wall s/GB': wall / (delivered / 10 ** 9),
+    }))
+
+
+def main() -> None:
+    engine = sys.argv[1] if len(sys.argv) > 1 else 'threading'
+    file_size = int(float(sys.argv[2]) * 2 ** 20) if len(sys.argv) > 2 \
+        else 2 ** 23
+    total_size = int(float(sys.argv[3]) * 2 ** 20) if len(sys.argv) > 3 \
+        else 2 ** 30
+
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    for mode in ('database', 'blob'):
+        process = context.Process(target=_run_mode, args=(
+            mode, engine, file_size, total_size, results))
+        process.start()
+        mode, result = results.get()
+        process.join()
+        print(utils.format_row(f'{engine} {mode}', result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""Compares the message stores (see MESSAGEU_MESSAGE_STORE) under clients
+  pushing messages while others pop their messages concurrently: the
+  database, and memory - with and without its append-only log.
+
+Each store is served from a fresh database, in a separate process.
+
+Usage: python -m benchmarks.bench_stores [engine] [seconds]
+"""
+import os
+import sys
+import threading
+import multiprocessing
+
+from benchmarks import utils
+from benchmarks.bench_mailbox import CLIENTS, push_request, pop_request
+
+STORES = ('django', 'memory', 'memory+log')
+
+
+def _run_store(store: str, engine: str, duration: float, results) -> None:
+    """Runs in a separate process, so each store is configured anew."""
+    from django.conf import settings
+
+    db_dir = utils.setup_django()
+    settings.MESSAGEU_MESSAGE_STORE, _, log = store.partition('+')
+    if log:
+        settings.MESSAGEU_MESSAGE_LOG = os.path.join(db_dir, 'messages.log')
+    server, port = utils.start_server(engine)
+    client_ids = utils.register_clients(port, CLIENTS)
+
+    push = {}
+    pusher = threading.Thread(target=lambda: push.update(utils.run_load(
+        port, push_request, client_ids,
+        processes=2, threads=8, duration=duration)))
+    pusher.start()
+    # a popper per client, as clients pop their own messages
+    pop = utils.run_load(
+        port, pop_request, client_ids,
+        processes=1, threads=CLIENTS, duration=duration)
+    pusher.join()
+    results.put((store, push, pop))
+
+
+def main() -> None:
+    engine = sys.argv[1] if len(sys.argv) > 1 else 'threading'
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    for store in STORES:
+        process = context.Process(
+            target=_run_store, args=(store, engine, duration, results))
+        process.start()
+        store, push, pop = results.get()
+        process.join()
+        print(utils.format_row(f'{engine} {store} push', push))
+        print(utils.format_row(f'{engine} {store} pop', pop))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""Compares the latency of requests over loopback TCP and over a Unix domain
+  socket, for clients on the same host as the server.
+
+Usage: python -m benchmarks.bench_transports [concurrent clients] [seconds]
+"""
+import os
+import sys
+
+from benchmarks import utils
+
+
+def public_key_request(client_id: int):
+    from protocol.packets.request.requests import PublicKeyRequest
+    return PublicKeyRequest(), {
+        'sender_client_id': client_id, 'requested_client_id': client_id}
+
+
+def main() -> None:
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    processes = min(concurrency, 4)
+    threads = max(concurrency // processes, 1)
+
+    db_dir = utils.setup_django()
+    for engine in ('threading', 'asyncio'):
+        unix_path = os.path.join(db_dir, f'{engine}.sock')
+        server, port = utils.start_server(engine, unix_path=unix_path)
+        client_ids = utils.register_clients(port, 20)
+        for transport, host in (('tcp', '127.0.0.1'),
+                                ('unix', f'unix:{unix_path}')):
+            result = utils.run_load(
+                port, public_key_request, client_ids,
+                processes=processes, threads=threads, duration=duration,
+                host=host,
+            )
+            print(utils.format_row(
+                f'{engine} {transport} x{processes * threads}', result))
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
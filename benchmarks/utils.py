@@ -0,0 +1,251 @@
+"""Helpers shared by the benchmark scripts.
+
+The server runs in the benchmark process against a temporary SQLite database,
+  while the load is generated by separate client processes, so the clients do
+  not compete with the server over the GIL."""
+import os
+import sys
+import time
+import socket
+import pathlib
+import tempfile
+import threading
+import statistics
+import multiprocessing
+from typing import Callable, Dict, List, Tuple, Optional
+
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parent.parent))
+
+
+def setup_django(db_dir: str = None) -> str:
+    """Configures Django to use a fresh SQLite database (and blobs directory),
+      and migrates it. Returns the database directory."""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'serverdb.settings')
+    from django.conf import settings
+
+    if db_dir is None:
+        db_dir = tempfile.mkdtemp(prefix='messageu-bench-')
+    settings.DATABASES['default']['NAME'] = os.path.join(db_dir, 'server.db')
+    settings.MESSAGEU_BLOB_DIR = os.path.join(db_dir, 'blobs')
+
+    import django
+    django.setup()
+
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+    return db_dir
+
+
+def _listen_unix(unix_path: str) -> socket.socket:
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(unix_path)
+    sock.listen(128)
+    return sock
+
+
+def start_server(
+        engine: str, unix_path: Optional[str] = None,
+) -> Tuple[object, int]:
+    """Starts a server with the given engine on a free port in a background
+      thread, also listening on a Unix domain socket at `unix_path` if given
+      (threading and asyncio engines). Returns the server and its port."""
+    from django.conf import settings
+    from serverapp.lastseen import last_seen
+
+    last_seen.start(settings.MESSAGEU_LAST_SEEN_INTERVAL)
+    if engine == 'threading':
+        from serverapp.handler import ServerHandler
+        from serverapp.poolserver import PooledTCPServer, PooledUnixListener
+
+        server = PooledTCPServer(
+            ('127.0.0.1', 0), ServerHandler,
+            workers=settings.MESSAGEU_WORKERS,
+            queue_size=settings.MESSAGEU_ACCEPT_QUEUE_SIZE,
+        )
+        port = server.server_address[1]
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        if unix_path is not None:
+            listener = PooledUnixListener(_listen_unix(unix_path), server)
+            threading.Thread(
+                target=listener.serve_forever, daemon=True).start()
+    elif engine == 'threading-unbounded':
+        # the server before the worker pool: a thread per connection
+        import socketserver
+        from serverapp.handler import ServerHandler
+
+        socketserver.ThreadingTCPServer.request_queue_size = 1024
+        server = socketserver.ThreadingTCPServer(
+            ('127.0.0.1', 0), ServerHandler)
+        port = server.server_address[1]
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    elif engine == 'asyncio':
+        from serverapp.asyncserver import AsyncServer
+
+        server = AsyncServer(
+            ('127.0.0.1', 0),
+            executor_workers=settings.MESSAGEU_EXECUTOR_WORKERS,
+            unix_socket=unix_path and _listen_unix(unix_path),
+        )
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        server.started.wait()
+        port = server.server_address[1]
+    else:
+        raise ValueError(f"Unknown engine {engine!r}")
+    return server, port
+
+
+def _serve_prefork(db_dir: str, engine: str, port: int, processes: int):
+    """Runs in the supervisor process of start_prefork_server."""
+    setup_django(db_dir)
+    from django.conf import settings
+    from serverapp.prefork import PreforkSupervisor
+
+    def serve() -> None:
+        from serverapp.lastseen import last_seen
+
+        last_seen.start(settings.MESSAGEU_LAST_SEEN_INTERVAL)
+        if engine == 'threading':
+            from serverapp.handler import ServerHandler
+            from serverapp.poolserver import PooledTCPServer
+
+            PooledTCPServer(
+                ('127.0.0.1', port), ServerHandler,
+                workers=settings.MESSAGEU_WORKERS,
+                queue_size=settings.MESSAGEU_ACCEPT_QUEUE_SIZE,
+                reuse_port=True,
+            ).serve_forever()
+        else:
+            from serverapp.asyncserver import AsyncServer
+
+            AsyncServer(
+                ('127.0.0.1', port),
+                executor_workers=settings.MESSAGEU_EXECUTOR_WORKERS,
+                reuse_port=True,
+            ).serve_forever()
+
+    PreforkSupervisor(serve, processes).serve_forever()
+
+
+def start_prefork_server(
+        engine: str, processes: int, db_dir: str,
+) -> Tuple[multiprocessing.Process, int]:
+    """Starts `processes` forked servers with the given engine on a free port,
+      supervised by a separate process using the database in `db_dir`.
+    Returns the supervisor process and the port. Terminating the supervisor
+      stops the servers."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    context = multiprocessing.get_context('spawn')
+    supervisor = context.Process(
+        target=_serve_prefork, args=(db_dir, engine, port, processes))
+    supervisor.start()
+
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port)).close()
+            return supervisor, port
+        except ConnectionRefusedError:
+            if time.monotonic() > deadline:
+                supervisor.terminate()
+                raise
+            time.sleep(0.1)
+
+
+def register_clients(
+        port: int, count: int, host: str = '127.0.0.1',
+) -> List[int]:
+    from clientapp.handler import ClientHandler
+    from protocol.packets.request.requests import RegisterRequest
+
+    handler = ClientHandler(host, port)
+    client_ids = []
+    for idx in range(count):
+        fields = handler.handle(RegisterRequest(), {
+            'client_name': f'bench-{idx}-{time.monotonic_ns()}',
+            'public_key': 'K' * 160,
+        })
+        client_ids.append(fields['new_client_id'])
+    return client_ids
+
+
+def _client_worker(args) -> Tuple[List[float], int]:
+    """Runs in a client process: `threads` threads each repeatedly send the
+      request built by `make_request` for `duration` seconds, reconnecting
+      for every request if `reconnect`, and sleeping `backoff` seconds after
+      a failed request.
+    Returns the latencies of all successful requests, and the count of failed
+      ones."""
+    host, port, threads, duration, client_ids, make_request, reconnect, \
+        backoff = args
+    from clientapp.handler import ClientHandler
+
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def loop(thread_idx: int) -> None:
+        nonlocal errors
+        handler = ClientHandler(host, port)
+        client_id = client_ids[thread_idx % len(client_ids)]
+        local_latencies = []
+        local_errors = 0
+        while time.monotonic() < deadline:
+            request, fields = make_request(client_id)
+            start = time.perf_counter()
+            try:
+                handler.handle(request, fields)
+            except (OSError, RuntimeError):
+                local_errors += 1
+                time.sleep(backoff)
+                continue
+            finally:
+                if reconnect:
+                    handler.close()
+            local_latencies.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local_latencies)
+            errors += local_errors
+
+    workers = [threading.Thread(target=loop, args=(idx, ))
+               for idx in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return latencies, errors
+
+
+def run_load(
+        port: int, make_request: Callable, client_ids: List[int],
+        processes: int, threads: int, duration: float,
+        reconnect: bool = False, backoff: float = 0, host: str = '127.0.0.1',
+) -> Dict[str, float]:
+    """Generates load from `processes` * `threads` concurrent clients,
+      connecting to `host` (or a `unix:<path>` address).
+    Returns throughput, failures and latency percentiles (in milliseconds)."""
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(processes) as pool:
+        results = pool.map(_client_worker, [
+            (host, port, threads, duration, client_ids, make_request,
+             reconnect, backoff)
+            for _ in range(processes)])
+    latencies = sorted(
+        latency for latencies, _ in results for latency in latencies)
+    errors = sum(errors for _, errors in results)
+    if not latencies:
+        return {'requests/s': 0.0, 'errors/s': errors / duration}
+    return {
+        'requests/s': len(latencies) / duration,
+        'errors/s': errors / duration,
+        'p50 ms': statistics.median(latencies) * 1000,
+        'p99 ms': latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+def format_row(name: str, result: Dict[str, float]) -> str:
+    values = '  '.join(f'{key}={value:9.2f}' for key, value in result.items())
+    return f'{name:<24} {values}'
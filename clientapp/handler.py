@@ -1,21 +1,83 @@
+import select
+import socket
 import logging
+from typing import Optional, List
 
+from common.exceptions import ConnectionClosedError, PacketBaseValueError
+from common.framing import FrameReader, send_buffers
 from common.utils import FieldsValues
 from common.handlerbase import HandlerBase
 from protocol.packets.request.base import Request
 from protocol.packets.response.base import Response
-from protocol.packets.response.responses import ALL_RESPONSES
 
 
 class ClientHandler(HandlerBase):
+    """Sends requests to the server over a kept-open connection.
+
+    The server is reached over TCP at `host` and `port`, or - when `host` is
+      a `unix:<path>` address - over the Unix domain socket at that path,
+      skipping the loopback TCP stack for a server on the same host.
+
+    Requests are sent in `version` of the protocol. If None, the highest
+      version supported by both the server and the client is negotiated upon
+      the first request.
+
+    Class Attributes:
+      UNIX_PREFIX: Prefix of Unix domain socket addresses.
+    """
 
     SOCKET_TIMEOUT = 5
+    UNIX_PREFIX = 'unix:'
 
     logger = logging.getLogger(__name__)
 
-    def __init__(self, host: str, port: int):
+    def __init__(
+            self, host: str, port: Optional[int] = None,
+            version: Optional[int] = None,
+    ):
         self.host = host
         self.port = port
+        self.version = version
+        self._socket: Optional[socket.socket] = None
+        self._frames: Optional[FrameReader] = None
+
+    def _open_socket(self) -> socket.socket:
+        if not self.host.startswith(ClientHandler.UNIX_PREFIX):
+            self.logger.debug(f"Connecting to {self.host}:{self.port}")
+            return socket.create_connection(
+                (self.host, self.port), timeout=ClientHandler.SOCKET_TIMEOUT)
+
+        self.logger.debug(f"Connecting to {self.host}")
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(ClientHandler.SOCKET_TIMEOUT)
+        try:
+            sock.connect(self.host[len(ClientHandler.UNIX_PREFIX):])
+        except BaseException:
+            sock.close()
+            raise
+        return sock
+
+    def _connect(self) -> socket.socket:
+        """Returns the open connection to server, opening it if needed."""
+        if self._socket is None:
+            self._socket = self._open_socket()
+            self._frames = FrameReader(self._socket)
+        return self._socket
+
+    def close(self) -> None:
+        """Closes the connection to server, if open."""
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+            self._frames = None
+
+    def _closed_by_server(self) -> bool:
+        """Whether the kept-open connection was closed by the server (e.g.
+          once idle), so a request sent over it would be lost. Nothing is
+          expected from the server between requests, so a readable connection
+          is closed - or broken."""
+        readable, _, _ = select.select([self._socket], [], [], 0)
+        return bool(readable)
 
     def _request_to_response(self, request: Request) -> Response:
         """Maps the sent request from client to the expected response from
@@ -23,44 +85,92 @@ class ClientHandler(HandlerBase):
 
         Note the server response with PushMessageResponse to all
         PushMessageRequests."""
-        from itertools import dropwhile
-        from protocol.packets.request.messages import PushMessageRequest
+        if not isinstance(request, Request) or request.RESPONSE is None:
+            raise PacketBaseValueError(
+                request, "Not a concrete request, no response is expected.")
+        return request.RESPONSE()
+
+    def _send_and_expect(
+            self, request_buffers: List[bytes], request: Request,
+            version: int,
+    ) -> FieldsValues:
+        sock = self._connect()
+        send_buffers(sock, request_buffers)
+        response = self._request_to_response(request)
+        p_type, fields = self._expect_packet(self._frames, response, version)
+        return fields
+
+    def negotiate_version(self) -> int:
+        """Probes the protocol versions the server supports, and returns the
+          highest one the client supports too.
+
+        The probe is sent in the default version. Servers predating it answer
+          with an error, and then the default version is returned."""
+        from protocol.packets.request.requests import VersionRequest
 
-        if isinstance(request, PushMessageRequest):
-            response_type_name = 'PushMessageResponse'
-        else:
-            response_type_name = \
-                request.__class__.__name__.replace('Request', 'Response')
-        response_type = next(dropwhile(
-            lambda response_t: response_t.__name__ != response_type_name,
-            ALL_RESPONSES,
-        ))
+        try:
+            fields = self._handle(VersionRequest(), {}, Request.VERSION)
+        except RuntimeError:
+            return Request.VERSION
+        return min(fields['max_version'], max(Request.VERSIONS))
 
-        return response_type()
+    def protocol_version(self) -> int:
+        """Returns the protocol version requests are sent in, negotiating it
+          upon first use."""
+        if self.version is None:
+            self.version = self.negotiate_version()
+            self.logger.debug(f"Negotiated protocol version {self.version}.")
+        return self.version
 
     def handle(
             self, request: Request, fields_to_pack: FieldsValues,
+    ) -> FieldsValues:
+        """Sends a request to server and expects a response, in the
+          negotiated protocol version."""
+        return self._handle(request, fields_to_pack, self.protocol_version())
+
+    def _handle(
+            self, request: Request, fields_to_pack: FieldsValues,
+            version: int,
     ) -> FieldsValues:
         """Sends a request to server and expects a response.
 
-        Opens a connection to server, sends a request with the fields to pack,
+        Sends a request with the fields to pack over the connection to server,
           waits for a specific response from the server (according to the
           request).
+        The connection is kept open for the next requests. If the server
+          already closed it (e.g. after being idle), reconnects before
+          sending. If it fails once the request was sent, reconnects and
+          resends once only an IDEMPOTENT request - others might have been
+          served already.
         If there was no timeout, unpacks the response, and returns it's fields
-          values. Otherwise, propagates the timeout error."""
-        import socket
+          values. Otherwise, closes the connection and propagates the timeout
+          error."""
         from common.packer import Packer
 
         self.logger.debug(
             f"request: {request}, fields_to_pack: {fields_to_pack}")
-        request_bytes = Packer(request).pack(**fields_to_pack)
-
-        socket.setdefaulttimeout(ClientHandler.SOCKET_TIMEOUT)
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-            sock.connect((self.host, self.port))
-            sock.send(request_bytes)
-
-            response = self._request_to_response(request)
-            p_type, fields = self._expect_packet(sock, response)
-
-        return fields
+        request_buffers = \
+            Packer(request, version).pack_buffers(**fields_to_pack)
+
+        if self._socket is not None and self._closed_by_server():
+            self.logger.debug("Connection was closed by server, reconnecting.")
+            self.close()
+        reused_connection = self._socket is not None
+        try:
+            return self._send_and_expect(request_buffers, request, version)
+        except (ConnectionClosedError, ConnectionResetError,
+                BrokenPipeError):
+            self.close()
+            if not reused_connection or not request.IDEMPOTENT:
+                raise
+        except Exception:
+            self.close()
+            raise
+
+        self.logger.debug("Connection was lost, resending.")
+        try:
+            return self._send_and_expect(request_buffers, request, version)
+        except Exception:
+            self.close()
+            raise
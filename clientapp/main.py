@@ -20,8 +20,12 @@ class ClientApp:
     AES_256_KEY_BYTES = 32
     AES_IV = b''.zfill(AES_256_BLOCK_BYTES)
 
-    server_host: str
-    server_port: int
+    # budget of a single page of popped messages
+    POP_MAX_MESSAGES = 64
+    POP_MAX_MESSAGES_SIZE = 2 ** 20
+
+    server_host: str  # or a `unix:<path>` address
+    server_port: Optional[int]
 
     client_ids_to_public_keys: Dict[int, bytes]
     client_ids_to_aes_keys: Dict[int, bytes]
@@ -35,7 +39,8 @@ class ClientApp:
 
     @classmethod
     def _read_server_host_and_port(cls) -> None:
-        """Tries reading the host and port from SERVER_FILENAME.
+        """Tries reading the host and port from SERVER_FILENAME, or a
+          `unix:<path>` address of a server on the same host.
         If fails, raises a ClientAppException."""
         try:
             with open(ClientApp.SERVER_FILENAME, 'r') as file:
@@ -45,8 +50,15 @@ class ClientApp:
                 f"Could not read server info file "
                 f"{ClientApp.SERVER_FILENAME}: {e}.")
 
+        address = content.strip()
+        if address.startswith(ClientHandler.UNIX_PREFIX):
+            if len(address) == len(ClientHandler.UNIX_PREFIX):
+                raise ClientAppException(f"Invalid format: {content!s}.")
+            cls.server_host, cls.server_port = address, None
+            return
+
         try:
-            cls.server_host, server_port = content.strip().split(':')
+            cls.server_host, server_port = address.split(':')
             cls.server_port = int(server_port)
         except Exception:
             raise ClientAppException(f"Invalid format: {content!s}.")
@@ -136,7 +148,6 @@ class ClientApp:
     def _list_clients(self) -> str:
         """Sends a request for registered clients.
         Formats the returned clients response in a table."""
-        from protocol.fields.payload import Clients
         from protocol.packets.request.requests import ListClientsRequest
 
         request = ListClientsRequest()
@@ -147,15 +158,8 @@ class ClientApp:
         if not clients:
             return 'No clients registered yet.'
 
-        # the response length is validated in Packer/Unpacker, so we expect
-        #  that len(clients) % fields_count == 0, so it can be popped
-        #  accordingly.
-        fields_count = len(Clients().fields)
-        assert len(clients) % fields_count == 0
         client_strings = []
-        for idx in range(len(clients) // fields_count):
-            client_id = clients[idx * fields_count]
-            client_name = clients[idx * fields_count + 1]
+        for client_id, client_name in clients:
             client_strings.append(f'{str(client_id).ljust(10)} {client_name}')
         return '\n'.join(client_strings)
 
@@ -351,34 +355,41 @@ class ClientApp:
                f"{receiver_client_id}."
 
     def _pop_messages(self) -> str:
-        """Tries sending a PopMessagesRequest, and returns a string of the
-          received messages."""
-        from protocol.packets.request.requests import PopMessagesRequest
-        from protocol.fields.message import Messages
+        """Tries sending PopMessagesPageRequests until no messages are left,
+          and returns a string of the received messages.
+
+        Servers predating the version probe predate PopMessagesPageRequest
+          too, so on version 2 all messages are popped by a single
+          PopMessagesRequest."""
+        from protocol.packets.request.base import Request
+        from protocol.packets.request.requests import PopMessagesRequest, \
+            PopMessagesPageRequest
         from protocol.packets.request.messages import GetSymmetricKeyRequest, \
             SendSymmetricKeyRequest, SendMessageRequest
 
-        request = PopMessagesRequest()
         fields_to_pack = {'sender_client_id': self.client_id}
-        response_fields = self.handler.handle(request, fields_to_pack)
+        if self.handler.protocol_version() > Request.VERSION:
+            request = PopMessagesPageRequest()
+            fields_to_pack['max_messages'] = ClientApp.POP_MAX_MESSAGES
+            fields_to_pack['max_messages_size'] = \
+                ClientApp.POP_MAX_MESSAGES_SIZE
+        else:
+            request = PopMessagesRequest()
+        # each page is received well within the socket timeout
+        messages = []
+        has_more_messages = True
+        while has_more_messages:
+            response_fields = self.handler.handle(request, fields_to_pack)
+            messages.extend(response_fields['messages'])
+            has_more_messages = response_fields.get('has_more_messages', 0)
 
         # check any messages exist
-        messages = response_fields['messages']
         self.logger.debug(f"Popped messages: {messages}")
         if len(messages) == 0:
             return "You don't have any unread messages."
 
         messages_strings = []
-        assert len(messages) % len(Messages().fields) == 0
-        fields_count = len(Messages().fields)
-
-        # every iteration goes over one message
-        for idx in range(len(messages) // fields_count):
-            # extract needed fields from sequence
-            from_client_id = messages[idx * fields_count]
-            message_type = messages[idx * fields_count + 2]
-            content = messages[idx * fields_count + 4]
-
+        for from_client_id, _, message_type, _, content in messages:
             # append message to user according to the message type
             if message_type == GetSymmetricKeyRequest.MESSAGE_TYPE:
                 content = "Request for symmetric key"
@@ -526,6 +537,7 @@ class ClientApp:
                 selected_option = None
 
             if selected_option == 0:
+                self.handler.close()
                 print("Bye!")
                 return
 
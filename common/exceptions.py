@@ -1,3 +1,5 @@
+import socket
+
 from django.core.exceptions import ValidationError
 
 
@@ -42,8 +44,31 @@ class UnpackerValueError(ValueError):
         super(UnpackerValueError, self).__init__(f"{packet!s:}: {message}")
 
 
+class PayloadTooLargeError(ValueError):
+    """Raised when a packet declares a payload larger than allowed."""
+    pass
+
+
 class FieldBaseValueError(ValueError):
     """Raised when validation of field base fails."""
 
     def __init__(self, field, message: str):
         super(FieldBaseValueError, self).__init__(f"{field!s:}: {message}")
+
+
+class ConnectionClosedError(ConnectionError):
+    """Raised when the peer closed the connection before sending a packet."""
+    pass
+
+
+class IncompleteFrameError(ConnectionError):
+    """Raised when the peer closed the connection in the middle of a packet."""
+    pass
+
+
+class DeadlineExceededError(socket.timeout):
+    """Raised when the peer did not send a frame before its deadline."""
+
+    def __init__(self, deadline_name: str, message: str):
+        super(DeadlineExceededError, self).__init__(message)
+        self.deadline_name = deadline_name
@@ -0,0 +1,210 @@
+import time
+import socket
+import logging
+from collections import deque
+from typing import BinaryIO, Sequence, Optional, Union
+
+from common.exceptions import ConnectionClosedError, IncompleteFrameError, \
+    DeadlineExceededError
+
+
+# maximal count of buffers passed to a single sendmsg call (IOV_MAX on Linux)
+MAX_SEND_BUFFERS = 1024
+
+
+class FileRegion:
+    """A region of a file to send among buffers (see send_buffers), e.g. a
+      message content kept as a blob. Its bytes are sent by the kernel with
+      sendfile where available, without being read into Python."""
+
+    __slots__ = ('file', 'offset', 'size')
+
+    def __init__(self, file: BinaryIO, offset: int, size: int):
+        self.file = file
+        self.offset = offset
+        self.size = size
+
+    def __len__(self) -> int:
+        return self.size
+
+
+def _send_memory_buffers(
+        sock: socket.socket, buffers: Sequence[bytes],
+) -> None:
+    if not hasattr(sock, 'sendmsg'):
+        for buffer in buffers:
+            sock.sendall(buffer)
+        return
+
+    views = deque(memoryview(buffer).cast('B') for buffer in buffers
+                  if len(buffer))
+    while views:
+        sent = sock.sendmsg(
+            [views[idx] for idx in range(min(len(views), MAX_SEND_BUFFERS))])
+        # drop the sent buffers, and the sent part of a partly sent one
+        while sent:
+            view_size = len(views[0])
+            if sent < view_size:
+                views[0] = views[0][sent:]
+                break
+            sent -= view_size
+            views.popleft()
+
+
+def _send_file_region(sock: socket.socket, region: FileRegion) -> None:
+    sent = sock.sendfile(region.file, region.offset, region.size)
+    if sent != region.size:
+        raise ValueError(f"File ended after {sent} of the {region.size} "
+                         f"bytes to send.")
+
+
+def send_buffers(
+        sock: socket.socket, buffers: Sequence[Union[bytes, FileRegion]],
+) -> None:
+    """Sends the buffers in order, without joining them into a single bytes
+      object: they are written with sendmsg (scatter-gather) until all their
+      bytes are sent. Where sendmsg is not available, sends each buffer with
+      sendall. FileRegions among the buffers are sent with socket.sendfile.
+    """
+    memory_buffers = []
+    for buffer in buffers:
+        if isinstance(buffer, FileRegion):
+            _send_memory_buffers(sock, memory_buffers)
+            memory_buffers = []
+            _send_file_region(sock, buffer)
+        else:
+            memory_buffers.append(buffer)
+    _send_memory_buffers(sock, memory_buffers)
+
+
+class Deadline:
+    """Time by which the reads of a frame must complete, whatever rate the
+      peer sends it at.
+
+    A deadline created with start=False is started by the first bytes read,
+      so waiting for the peer to start sending is bounded by the socket
+      timeout alone (e.g. an idle connection waiting for its next request).
+    """
+
+    __slots__ = ('name', 'seconds', 'started')
+
+    def __init__(self, name: str, seconds: float, start: bool = True):
+        self.name = name
+        self.seconds = seconds
+        self.started: Optional[float] = time.monotonic() if start else None
+
+    def start(self) -> None:
+        if self.started is None:
+            self.started = time.monotonic()
+
+    def remaining(self) -> float:
+        """Returns the seconds left. Once none are, raises a
+          DeadlineExceededError."""
+        remaining = self.started + self.seconds - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceededError(
+                self.name, f"The {self.name} deadline of {self.seconds:g} "
+                           f"seconds exceeded.")
+        return remaining
+
+
+class FrameReader:
+    """Reads exact-length frames from a connection into a reusable buffer.
+
+    A frame arriving across several TCP segments is read by looping recv_into
+      until its declared size is filled. The frame is handed out as a
+      memoryview of the buffer, without copying, and is only valid until the
+      next read.
+
+    Class Attributes:
+      INITIAL_BUFFER_SIZE: Size of the buffer allocated for a connection.
+      MAX_RETAINED_BUFFER_SIZE: Frames larger than that are read into a one-off
+        buffer, so a single large payload does not pin its memory for the rest
+        of the connection.
+    """
+
+    INITIAL_BUFFER_SIZE = 4096
+    MAX_RETAINED_BUFFER_SIZE = 1 << 20
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, sock: socket.socket):
+        self.socket = sock
+        self._buffer = bytearray(FrameReader.INITIAL_BUFFER_SIZE)
+        # the socket timeout, bounding each recv - also with a deadline
+        self._timeout = sock.gettimeout()
+
+    def _recv_into(
+            self, view: memoryview, size: int, deadline: Optional[Deadline],
+    ) -> int:
+        if deadline is None or deadline.started is None:
+            count = self.socket.recv_into(view, size)
+            if deadline is not None and count:
+                deadline.start()
+            return count
+
+        remaining = deadline.remaining()
+        if self._timeout is not None:
+            remaining = min(remaining, self._timeout)
+        self.socket.settimeout(remaining)
+        try:
+            return self.socket.recv_into(view, size)
+        except socket.timeout:
+            deadline.remaining()
+            raise
+        finally:
+            # sends are bounded by the socket timeout, not by the deadline
+            self.socket.settimeout(self._timeout)
+
+    def _buffer_for(self, size: int) -> bytearray:
+        if size <= len(self._buffer):
+            return self._buffer
+        if size > FrameReader.MAX_RETAINED_BUFFER_SIZE:
+            return bytearray(size)
+        self._buffer = bytearray(
+            min(max(size, 2 * len(self._buffer)),
+                FrameReader.MAX_RETAINED_BUFFER_SIZE))
+        return self._buffer
+
+    def read_exactly(
+            self, size: int, deadline: Optional[Deadline] = None,
+    ) -> memoryview:
+        """Reads exactly `size` bytes.
+        If the peer closes the connection before sending any of them, raises a
+          ConnectionClosedError. If it closes it in the middle, raises an
+          IncompleteFrameError. If they are not received by `deadline`, raises
+          a DeadlineExceededError."""
+        view = memoryview(self._buffer_for(size))[:size]
+        received = 0
+        while received < size:
+            count = self._recv_into(
+                view[received:], size - received, deadline)
+            if count == 0 and received == 0:
+                raise ConnectionClosedError("Connection closed by peer.")
+            if count == 0:
+                raise IncompleteFrameError(
+                    f"Connection closed by peer after {received} of {size} "
+                    f"bytes.")
+            received += count
+        return view
+
+    def copy_to_file(
+            self, file: BinaryIO, size: int,
+            deadline: Optional[Deadline] = None,
+    ) -> None:
+        """Reads exactly `size` bytes into `file`, through the reusable buffer.
+        The memory used is bounded by the buffer, whatever the size is. If the
+          peer closes the connection in the middle, raises an
+          IncompleteFrameError, and if it is slower than `deadline`, a
+          DeadlineExceededError."""
+        view = memoryview(self._buffer)
+        received = 0
+        while received < size:
+            count = self._recv_into(
+                view, min(size - received, len(view)), deadline)
+            if count == 0:
+                raise IncompleteFrameError(
+                    f"Connection closed by peer after {received} of {size} "
+                    f"bytes.")
+            file.write(view[:count])
+            received += count
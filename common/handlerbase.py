@@ -1,71 +1,91 @@
 import abc
 import logging
-from typing import Type, Tuple, Union, Iterator
+from typing import Type, Tuple, Union, Optional
 
 from common.utils import FieldsValues
+from common.framing import FrameReader, Deadline
 from common.exceptions import FieldBaseValueError, PacketBaseValueError, \
-    UnpackerValueError
+    UnpackerValueError, ConnectionClosedError, IncompleteFrameError
 from common.unpacker import Unpacker
-from protocol.fields.base import Int
 from protocol.packets.base import PacketBase
 from protocol.packets.request.base import Request
-from protocol.packets.request.requests import ALL_REQUESTS
-from protocol.packets.request.messages import PushMessageRequest, \
-    ALL_REQUEST_MESSAGES
+from protocol.packets.request.messages import PushMessageRequest
+# packet types register their codes upon definition
+from protocol.packets.request.requests import ALL_REQUESTS  # noqa: F401
 from protocol.packets.response.base import Response
-from protocol.packets.response.responses import ALL_RESPONSES, \
-    PushMessageResponse
 
 
 class HandlerBase(metaclass=abc.ABCMeta):
 
     logger = logging.getLogger(__name__)
 
-    def get_packet_type_by_code(self, code: int) -> Type[PacketBase]:
-        """Tries to find te packet associated with the code in the header.
+    def get_packet_type_by_code(
+            self, code: int, packet: PacketBase = PacketBase,
+    ) -> Type[PacketBase]:
+        """Returns the packet type associated with the code in the header,
+          out of the types of the expected packet.
         If fails, raises a PacketBaseValueError."""
-        for packet in ALL_REQUESTS + ALL_RESPONSES:
-            if code == packet.CODE:
-                return packet
-        raise FieldBaseValueError(Int, "Unexpected code {code}!")
+        return packet.type_by_code(code)
 
     def get_packet_type_by_message_type(
             self, message_type: int,
-    ) -> Type[Union[PushMessageRequest, PushMessageResponse]]:
-        """Tries to find te packet associated with the message type from the
+    ) -> Type[PushMessageRequest]:
+        """Returns the packet type associated with the message type from the
           message payload.
         If fails, raises a PacketBaseValueError."""
-        from protocol.fields.message import MessageType
+        return PushMessageRequest.type_by_message_type(message_type)
 
-        for packet in ALL_REQUEST_MESSAGES + (PushMessageResponse, ):
-            if message_type == packet.CODE:
-                return packet
-
-        raise FieldBaseValueError(
-            MessageType(), f"Unexpected message type {message_type}!")
-
-    def _expect_packet(
-            self, socket, packet: Union[Request, Response],
-    ) -> Tuple[PacketBase, FieldsValues]:
-        self.logger.debug(f"Expecting packet: {packet}.")
-        header = socket.recv(packet.HEADER_LENGTH)
-        unpacker = Unpacker(packet)
+    def _unpack_header(
+            self, header: bytes, packet: Union[Request, Response],
+            version: Optional[int] = None,
+    ) -> Tuple[Unpacker, FieldsValues]:
+        """Unpacks the header in the protocol version, or - if None - in the
+          version it declares."""
+        unpacker = Unpacker(packet, version)
         try:
             header_fields = unpacker.unpack_header(header)
         except (UnpackerValueError, FieldBaseValueError) as e:
             raise RuntimeError(f"Server responded with general error: {e!r}")
+        return unpacker, header_fields
 
+    def _unpack_payload(
+            self, unpacker: Unpacker, header_fields: FieldsValues,
+            received_payload: Union[bytes, memoryview],
+    ) -> Tuple[PacketBase, FieldsValues]:
         code = header_fields['code']
-        packet_concrete_type = self.get_packet_type_by_code(code)()
-        payload_size = header_fields['payload_size']
+        packet_concrete_type = \
+            self.get_packet_type_by_code(code, type(unpacker.packet))()
 
-        received_payload = socket.recv(payload_size)
         self.logger.debug(f"received {len(received_payload)} bytes")
-        payload_iter = iter(received_payload)
         unpacker.packet = packet_concrete_type
-        payload_fields = unpacker.unpack_payload(payload_iter)
+        payload_fields = unpacker.unpack_payload(received_payload)
         header_fields.update(payload_fields)
-        payload = bytes(payload_iter)
-        assert payload == b'', f"Did not read all the payload ({len(payload)})"
 
         return packet_concrete_type, header_fields
+
+    def _read_payload(
+            self, frames: FrameReader, size: int,
+            deadline: Optional[Deadline] = None,
+    ) -> memoryview:
+        """Reads payload bytes following a header already read."""
+        try:
+            return frames.read_exactly(size, deadline)
+        except ConnectionClosedError:
+            raise IncompleteFrameError(
+                "Connection closed by peer before sending the payload.")
+
+    def _expect_packet(
+            self, frames: FrameReader, packet: Union[Request, Response],
+            version: Optional[int] = None,
+    ) -> Tuple[PacketBase, FieldsValues]:
+        """Reads a whole packet in the protocol version from the connection.
+
+        The header view is unpacked before reading the payload, as both are
+          read into the same reusable buffer."""
+        self.logger.debug(f"Expecting packet: {packet}.")
+        header = frames.read_exactly(packet.HEADER_LENGTH)
+        unpacker, header_fields = self._unpack_header(header, packet, version)
+
+        received_payload = \
+            self._read_payload(frames, header_fields['payload_size'])
+        return self._unpack_payload(unpacker, header_fields, received_payload)
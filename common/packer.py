@@ -1,48 +1,129 @@
 import logging
-from typing import Tuple
+from itertools import chain
+from typing import Tuple, Iterable, Iterator, List, Optional
 
 from common.utils import FieldsValues
+from common.exceptions import PackerValueError
 from protocol.packets.base import PacketBase
-from protocol.fields.base import FieldBase
+from protocol.fields.base import FieldBase, Compound
+from protocol.fields.codec import StructCodec
 
 
 class Packer:
+    """Packs a packet in its default protocol version, or in `version` (e.g.
+      the version the peer used)."""
 
     logger = logging.getLogger(__name__)
 
-    def __init__(self, packet: PacketBase):
+    def __init__(self, packet: PacketBase, version: Optional[int] = None):
         self.packet = packet
+        if version is None:
+            self.schema = packet.schema
+        else:
+            self.schema = packet.schema_of_version(version)
 
-    def _update_field_to_size_field(
-            self, field_name: str, field_length: int,
-            fields_to_pack: FieldsValues,
-    ) -> None:
-        for field_to_pack in fields_to_pack:
-            if field_to_pack.name == field_name + '_size':
-                field_to_pack.value = field_length
-
-    def _pack_fields(
+    def _pack_dynamic_fields(
             self, fields: Tuple[FieldBase], kwargs: FieldsValues,
-    ) -> bytes:
-        fields_bytes = []
+    ) -> List[bytes]:
+        """Packs fields of non-fixed length, and sets the values of their
+          size fields (unless given explicitly)."""
+        fields_buffers = []
         for field in reversed(fields):
             name = field.name
             field_value = kwargs.pop(name, field.value)
-            field_bytes = field.pack(field_value)
-            self._update_field_to_size_field(name, len(field_bytes), fields)
-            fields_bytes.append(field_bytes)
-        return b''.join(reversed(fields_bytes))
+            field_buffers = field.pack_buffers(field_value)
+            kwargs.setdefault(name + '_size', _buffers_size(field_buffers))
+            fields_buffers.append(field_buffers)
+        return [buffer for field_buffers in reversed(fields_buffers)
+                for buffer in field_buffers]
+
+    def _pack_fields(
+            self, codec: StructCodec, kwargs: FieldsValues,
+    ) -> List[bytes]:
+        # dynamic fields come last, but are packed first for their sizes
+        dynamic_buffers = []
+        if codec.dynamic_fields:
+            dynamic_buffers = \
+                self._pack_dynamic_fields(codec.dynamic_fields, kwargs)
+        return [codec.pack(codec.pop_values(kwargs))] + dynamic_buffers
 
-    def _pack_payload(self, kwargs: FieldsValues) -> bytes:
-        self.logger.debug(f"pack payload: {kwargs}")
-        payload_bytes = self._pack_fields(self.packet.payload_fields, kwargs)
-        kwargs['payload_size'] = len(payload_bytes)
-        return payload_bytes
+    def _pack_payload(self, kwargs: FieldsValues) -> List[bytes]:
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(f"pack payload: {kwargs}")
+        payload_buffers = \
+            self._pack_fields(self.schema.payload_codec, kwargs)
+        kwargs['payload_size'] = _buffers_size(payload_buffers)
+        return payload_buffers
 
-    def _pack_header(self, kwargs: FieldsValues) -> bytes:
-        return self._pack_fields(self.packet.header_fields, kwargs)
+    def _pack_header(self, kwargs: FieldsValues) -> List[bytes]:
+        return self._pack_fields(self.schema.header_codec, kwargs)
+
+    def _pack_fixed_length_packet(self, kwargs: FieldsValues) -> bytes:
+        """Packs header and payload values with a single struct."""
+        codec = self.schema.packet_codec
+        return codec.pack(codec.pop_values(kwargs))
+
+    def pack_buffers(self, **kwargs: FieldsValues) -> List[bytes]:
+        """Packs the packet into buffers to send in order (see
+          common.framing.send_buffers): the header, the fixed payload fields,
+          and the values of the other fields as given - so large contents are
+          not copied."""
+        if self.schema.packet_codec is not None:
+            return [self._pack_fixed_length_packet(kwargs)]
+        payload_buffers = self._pack_payload(kwargs)
+        return self._pack_header(kwargs) + payload_buffers
 
     def pack(self, **kwargs: FieldsValues) -> bytes:
-        payload_bytes = self._pack_payload(kwargs)
-        header_bytes = self._pack_header(kwargs)
-        return header_bytes + payload_bytes
+        if self.schema.packet_codec is not None:
+            return self._pack_fixed_length_packet(kwargs)
+        return b''.join(self.pack_buffers(**kwargs))
+
+    def _streamed_field(self, kwargs: FieldsValues) -> Compound:
+        """Returns the Compound field given as an iterator of rows, if any.
+        Only the last payload field can be streamed."""
+        dynamic_fields = self.schema.payload_codec.dynamic_fields
+        if len(dynamic_fields) == 1 \
+                and isinstance(dynamic_fields[0], Compound) \
+                and isinstance(kwargs.get(dynamic_fields[0].name), Iterator):
+            return dynamic_fields[0]
+
+    def _pack_rows(
+            self, field: Compound, rows: Iterator[Tuple], size: int,
+    ) -> Iterator[List[bytes]]:
+        packed_size = 0
+        for row in rows:
+            row_buffers = field.pack_row_buffers(row)
+            packed_size += _buffers_size(row_buffers)
+            if packed_size > size:
+                break
+            yield row_buffers
+        if packed_size != size:
+            raise PackerValueError(
+                field, f"Rows of {packed_size} bytes or more differ from the "
+                       f"declared size {size}.")
+
+    def pack_stream(self, **kwargs: FieldsValues) -> Iterable[List[bytes]]:
+        """Packs the packet in chunks of buffers (see pack_buffers).
+
+        The last payload field, if a Compound, may be given as an iterator of
+          its rows, together with its size in bytes as `<name>_size`. Then the
+          header and fixed payload fields are packed at once, and each row is
+          packed while iterating - so the packet is never held as a whole.
+        Otherwise, returns a tuple of the buffers of the whole packet."""
+        field = self._streamed_field(kwargs)
+        if field is None:
+            return self.pack_buffers(**kwargs),
+
+        rows = kwargs.pop(field.name)
+        rows_size = kwargs.pop(field.name + Compound.SIZE_SUFFIX)
+        codec = self.schema.payload_codec
+        fixed_bytes = codec.pack(codec.pop_values(kwargs))
+        kwargs['payload_size'] = len(fixed_bytes) + rows_size
+        return chain(
+            (self._pack_header(kwargs) + [fixed_bytes], ),
+            self._pack_rows(field, rows, rows_size),
+        )
+
+
+def _buffers_size(buffers: List[bytes]) -> int:
+    return sum(len(buffer) for buffer in buffers)
@@ -1,19 +1,29 @@
 import logging
-from typing import Iterator, Tuple, Dict
+from typing import Tuple, Union, Optional
 from collections import OrderedDict
 
 from common.utils import FieldsValues
-from common.exceptions import UnpackerValueError
-from protocol.packets.base import PacketBase
-from protocol.fields.base import FieldBase
+from common.exceptions import UnpackerValueError, PacketBaseValueError
+from protocol.packets.base import PacketBase, PacketSchema
+from protocol.fields.codec import StructCodec
 
 
 class Unpacker:
+    """Unpacks a packet in a protocol version: the given one, or - if None -
+      the one its header declares, out of the supported versions.
+
+    The packet may be replaced by its concrete type after unpacking the
+      header, and the payload is then unpacked in the same version."""
 
     logger = logging.getLogger(__name__)
 
-    def __init__(self, packet: PacketBase):
+    def __init__(self, packet: PacketBase, version: Optional[int] = None):
         self.packet = packet
+        self.version = version
+
+    @property
+    def schema(self) -> PacketSchema:
+        return self.packet.schema_of_version(self.version)
 
     def _validate_header_length(self, packet_bytes: bytes) -> None:
         bytes_length = len(packet_bytes)
@@ -23,33 +33,47 @@ class Unpacker:
                 f"Packet length {bytes_length} is lower then expected "
                 f"header length {self.packet.HEADER_LENGTH}.")
 
-    def _update_size_field_to_field(
-            self, field_name: str, field_length: int,
-            fields_to_pack: FieldsValues,
-    ) -> None:
-        for field_to_pack in fields_to_pack:
-            if field_to_pack.name + '_size' == field_name:
-                field_to_pack.length = field_length
-
     def _unpack_fields(
-            self, bytes_iter: Iterator[bytes],
-            expected_fields: Tuple[FieldBase],
-    ) -> Dict[str, FieldBase]:
-        fields = OrderedDict()
-        for field in expected_fields:
-            field_value = field.unpack(bytes_iter)
+            self, buffer: memoryview, codec: StructCodec,
+    ) -> Tuple[FieldsValues, int]:
+        """Unpacks the codec fields from the start of `buffer`.
+        Returns the fields values and the count of unpacked bytes."""
+        values, offset = codec.unpack_from(buffer)
+        fields = OrderedDict(zip(codec.names, values))
+        for field in codec.dynamic_fields:
+            # the length of a field might be given by a preceding size field
+            field_length = fields.get(field.name + '_size')
+            if field_length is None:
+                field_value, offset = field.unpack(buffer, offset)
+            else:
+                field_value, offset = \
+                    field.unpack(buffer, offset, field_length)
             fields[field.name] = field_value
-            if field.name.endswith('_size'):
-                self._update_size_field_to_field(
-                    field.name, field_value, expected_fields)
-        return fields
+        return fields, offset
 
-    def unpack_header(self, header: bytes) -> FieldsValues:
+    def unpack_header(self, header: Union[bytes, memoryview]) -> FieldsValues:
         self._validate_header_length(header)
-        header_iter = iter(header)
-        return self._unpack_fields(header_iter, self.packet.header_fields)
+        if self.version is None:
+            # the version field leads the header in all versions
+            self.version = header[0]
+        try:
+            schema = self.schema
+        except PacketBaseValueError as e:
+            raise UnpackerValueError(self, str(e))
+        # static values of the packet, such as its code and version, are
+        #  validated by its header codec
+        fields, _ = self._unpack_fields(
+            memoryview(header), schema.header_codec)
+        return fields
 
-    def unpack_payload(self, payload_iter: Iterator[bytes]) -> FieldsValues:
-        payload_fields = \
-            self._unpack_fields(payload_iter, self.packet.payload_fields)
+    def unpack_payload(
+            self, payload: Union[bytes, memoryview],
+    ) -> FieldsValues:
+        payload = memoryview(payload)
+        payload_fields, offset = \
+            self._unpack_fields(payload, self.schema.payload_codec)
+        if offset != len(payload):
+            raise UnpackerValueError(
+                self, f"Did not read all the payload "
+                      f"({len(payload) - offset} bytes left).")
         return payload_fields
@@ -6,33 +6,20 @@ from typing import NewType, Union, Dict, Any
 FieldsValues = NewType('FieldsValues', dict)
 
 
-class classproperty(object):
-    def __init__(self, f):
-        self.f = f
+class Immutable:
+    """Allows setting each attribute only once, upon initialization.
 
-    def __get__(self, obj, owner):
-        return self.f(owner)
+    Instances are shared between threads, e.g. fields of a packet type, so
+      any per-call state must be kept elsewhere."""
 
+    __slots__ = ()
 
-def abstractproperty(func: object) -> object:
-    return property(abc.abstractmethod(func))  # noqa
-
-
-def camel_case_to_snake_case(text: str) -> str:
-    import re
-    return re.sub(r'(?<!^)(?=[A-Z])', '_', text).lower()
+    def __setattr__(self, name: str, value: Any) -> None:
+        if hasattr(self, name):
+            raise AttributeError(
+                f"{self.__class__.__name__}.{name} is immutable.")
+        super(Immutable, self).__setattr__(name, value)
 
 
-def islice(iterable, stop):
-    it = iter(range(stop))
-    nexti = next(it)
-
-    try:
-        for i, element in enumerate(iterable):
-            if i == nexti:
-                yield element
-                nexti = next(it)
-    except StopIteration:
-        # Consume to *stop*.
-        for i, element in zip(range(i + 1, stop), iterable):
-            pass
+def abstractproperty(func: object) -> object:
+    return property(abc.abstractmethod(func))  # noqa
@@ -9,6 +9,22 @@ if __name__ == '__main__':
     parser.add_argument(
         dest='run', choices=['server', 'client'],
     )
+    parser.add_argument(
+        '--engine', dest='engine', choices=['threading', 'asyncio'],
+        default='threading',
+        help='server engine: a pool of threads, or a single asyncio event '
+             'loop (server only)',
+    )
+    parser.add_argument(
+        '--processes', dest='processes', type=int, default=1,
+        help='count of forked server processes sharing the port, each running '
+             'the engine (server only, Unix)',
+    )
+    parser.add_argument(
+        '--unix', dest='unix_path', metavar='PATH', default=None,
+        help='also listen on a Unix domain socket at PATH, for clients on the '
+             'same host (server only, Unix)',
+    )
     parser.add_argument(
         '-v', dest='verbosity', action='store_true',
         help='enable debug logging',
@@ -21,7 +37,8 @@ if __name__ == '__main__':
 
     if args.run == 'server':
         from serverapp import main
+        main.run(engine=args.engine, processes=args.processes,
+                 unix_path=args.unix_path)
     else:  # args.run == 'client':
         from clientapp import main
-
-    main.run()
+        main.run()
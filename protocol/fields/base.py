@@ -1,13 +1,21 @@
 import abc
 import logging
-from itertools import cycle
-from typing import Type, Iterator, Tuple, Sequence, Any, Optional
+from typing import Type, Tuple, Sequence, Any, Optional, List, Union
 
-from common.utils import abstractproperty, islice
+from common.utils import abstractproperty, Immutable
 from common.exceptions import FieldBaseValueError
+from common.framing import FileRegion
 
 
-class FieldBase(metaclass=abc.ABCMeta):
+class FieldBase(Immutable, metaclass=abc.ABCMeta):
+    """Abstract field of a packet.
+
+    Fields are immutable, as they are shared by all packets of a type: the
+      length of a field given by a preceding size field is passed to unpack
+      instead.
+    """
+
+    __slots__ = ('name', 'length', 'value')
 
     @abstractproperty
     def TYPE(self) -> Type: pass
@@ -40,6 +48,16 @@ class FieldBase(metaclass=abc.ABCMeta):
     @abc.abstractmethod
     def pack(self, field_value: TYPE) -> bytes: pass
 
+    def pack_buffers(self, field_value: TYPE) -> List[bytes]:
+        """Packs the field into buffers to send in order, without joining
+          them."""
+        return [self.pack(field_value)]
+
+    def for_version(self, version: int) -> 'FieldBase':
+        """Returns the field as encoded in the protocol version: the field
+          itself, unless its encoding changed."""
+        return self
+
     def _validate_static_value(self, field_value: TYPE) -> None:
         if self.value not in [None, float('inf')] \
                 and field_value != self.value:
@@ -48,11 +66,32 @@ class FieldBase(metaclass=abc.ABCMeta):
                       f"{self.value!r}.")
 
     @abc.abstractmethod
-    def unpack(self, bytes_iter: Iterator[bytes]) -> TYPE: pass
+    def unpack(self, buffer: memoryview, offset: int) -> Tuple[Any, int]:
+        """Unpacks the field value found at `offset` of `buffer`.
+        Returns the value and the offset following it."""
+        pass
+
+    @property
+    def struct_format(self) -> Optional[str]:
+        """Format of the field in a struct.Struct, or None if the field length
+          is not fixed.
+
+        Formats of 's' type are converted with to_struct and from_struct,
+          other formats are packed as is."""
+        return None
+
+    def to_struct(self, field_value: Any) -> bytes:
+        return self.pack(field_value)
+
+    def from_struct(self, struct_value: bytes) -> Any:
+        field_value, _ = self.unpack(memoryview(struct_value), 0)
+        return field_value
 
 
 class SequenceMixin:
 
+    __slots__ = ()
+
     @abstractproperty
     def TYPE(self) -> Sequence: pass
 
@@ -67,23 +106,51 @@ class SequenceMixin:
 
 class BoundedMixin:
 
+    __slots__ = ()
+
     length: int
 
-    def _slice_bytes_iter(self, bytes_iter: Iterator[bytes]) -> bytes:
-        FieldBase.logger.debug(f"_slice_bytes_iter of length {self.length}")
-        if self.length == 0:
-            assert bytes(bytes_iter) == b''  # noqa
-            return b''
-        sliced_bytes = bytes(islice(bytes_iter, self.length))
-        if sliced_bytes == b'':
-            raise StopIteration
-        return sliced_bytes
+    @property
+    def struct_format(self) -> Optional[str]:
+        if self.length == float('inf'):
+            return None
+        return f'{self.length}s'
+
+    def _slice_buffer(
+            self, buffer: memoryview, offset: int, length: int = None,
+    ) -> Tuple[memoryview, int]:
+        """Returns a view of the field bytes, and the offset following it.
+
+        `length` overrides the field length, e.g. when it is given by a
+          preceding size field."""
+        if length is None:
+            length = self.length
+        end = offset + length
+        if end > len(buffer):
+            raise FieldBaseValueError(
+                self, f"Expected {length} bytes at offset {offset}, "
+                      f"only {len(buffer) - offset} left.")
+        return buffer[offset:end], end
 
 
-class Int(FieldBase, BoundedMixin, metaclass=abc.ABCMeta):
+class Int(BoundedMixin, FieldBase, metaclass=abc.ABCMeta):
 
     TYPE = int
     BITS_IN_BYTE = 8
+    # lengths with a native struct format
+    STRUCT_FORMATS = {1: 'B', 2: 'H', 4: 'I', 8: 'Q'}
+
+    @property
+    def struct_format(self) -> Optional[str]:
+        return Int.STRUCT_FORMATS.get(self.length, super().struct_format)
+
+    def to_struct(self, field_value: int) -> bytes:
+        # invalid values raise here, and are then validated by pack
+        return field_value.to_bytes(
+            length=self.length, byteorder="little", signed=False)
+
+    def from_struct(self, struct_value: bytes) -> int:
+        return int.from_bytes(struct_value, byteorder="little", signed=False)
 
     def _validate_value_expected_length(self, field_value: int) -> None:
         bits_count = self.length * self.BITS_IN_BYTE
@@ -101,57 +168,171 @@ class Int(FieldBase, BoundedMixin, metaclass=abc.ABCMeta):
             signed=False,
         )
 
-    def unpack(self, bytes_iter: Iterator[bytes]) -> int:
-        field_bytes = self._slice_bytes_iter(bytes_iter)
+    def unpack(self, buffer: memoryview, offset: int) -> Tuple[int, int]:
+        field_bytes, offset = self._slice_buffer(buffer, offset)
         field_value = int.from_bytes(
             bytes=field_bytes,
             byteorder="little",
             signed=False,
         )
         self._validate_static_value(field_value)
-        return field_value
+        return field_value, offset
 
 
-class String(FieldBase, SequenceMixin, BoundedMixin, metaclass=abc.ABCMeta):
+class String(BoundedMixin, SequenceMixin, FieldBase, metaclass=abc.ABCMeta):
 
     TYPE = str
 
+    def to_struct(self, field_value: str) -> bytes:
+        # invalid values raise here, and are then validated by pack
+        encoded = field_value.encode()
+        if len(encoded) > self.length:
+            raise FieldBaseValueError(
+                self, f"{field_value!r} exceeds the {self.length!r} "
+                      f"bytes length of field.")
+        return encoded.zfill(self.length)
+
+    def from_struct(self, struct_value: bytes) -> str:
+        # the padding is stripped before decoding, as it is ASCII
+        return struct_value.lstrip(b'0').decode()
+
     def pack(self, field: str) -> bytes:
         self._validate_field_to_pack(field)
         return field.encode().zfill(self.length)
 
-    def unpack(self, bytes_iter: Iterator[bytes]) -> str:
-        field_bytes = self._slice_bytes_iter(bytes_iter)
-        field_value = field_bytes.decode().lstrip('0')
+    def unpack(self, buffer: memoryview, offset: int) -> Tuple[str, int]:
+        field_bytes, offset = self._slice_buffer(buffer, offset)
+        field_value = str(field_bytes, 'utf-8').lstrip('0')
         self._validate_static_value(field_value)
-        return field_value
+        return field_value, offset
+
+    def for_version(self, version: int) -> FieldBase:
+        # zero-padded strings are length-prefixed since version 3
+        if version >= VarString.SINCE_VERSION:
+            return VarString(
+                name=self.name, max_length=self.length, value=self.value)
+        return self
+
+
+# bytes of the longest varint unpacked, enough for any 64 bits value
+VARINT_MAX_BYTES = 10
+
+
+def pack_varint(value: int) -> bytes:
+    """Packs an unsigned integer in LEB128: 7 bits a byte, least significant
+      first, with the high bit set on all bytes but the last."""
+    if value <= 0x7f:
+        return bytes((value, ))
+    varint = bytearray()
+    while value > 0x7f:
+        varint.append(value & 0x7f | 0x80)
+        value >>= 7
+    varint.append(value)
+    return bytes(varint)
+
+
+def unpack_varint(buffer: memoryview, offset: int) -> Tuple[int, int]:
+    """Unpacks an unsigned LEB128 integer found at `offset` of `buffer`.
+    Returns the value and the offset following it."""
+    value = 0
+    for idx in range(min(VARINT_MAX_BYTES, len(buffer) - offset)):
+        byte = buffer[offset + idx]
+        value |= (byte & 0x7f) << (7 * idx)
+        if byte < 0x80:
+            return value, offset + idx + 1
+    raise FieldBaseValueError(
+        'varint', f"Truncated or too long varint at offset {offset}.")
+
+
+class VarString(SequenceMixin, FieldBase):
+    """UTF-8 string prefixed by its length in bytes as a varint, instead of
+      zero-padded to a fixed length.
+
+    Class Attributes:
+      SINCE_VERSION: The protocol version replacing fixed strings with it.
+    """
+
+    __slots__ = ('max_length', )
+
+    TYPE = str
+    SINCE_VERSION = 3
+
+    def __init__(self, name: str, max_length: int, value: str = None):
+        super(VarString, self).__init__(
+            name=name, length=float('inf'), value=value)
+        self.max_length = max_length
+
+    def _validate_value_expected_length(self, field_value: str) -> None:
+        pass  # validated by the encoded length
+
+    def pack(self, field_value: str) -> bytes:
+        self._validate_type(field_value)
+        encoded = field_value.encode()
+        if len(encoded) > self.max_length:
+            raise FieldBaseValueError(
+                self, f"{field_value!r} exceeds the {self.max_length!r} "
+                      f"bytes length of field.")
+        return pack_varint(len(encoded)) + encoded
+
+    def unpack(self, buffer: memoryview, offset: int) -> Tuple[str, int]:
+        length, offset = unpack_varint(buffer, offset)
+        if length > self.max_length:
+            raise FieldBaseValueError(
+                self, f"Length {length} exceeds the {self.max_length!r} "
+                      f"bytes length of field.")
+        end = offset + length
+        if end > len(buffer):
+            raise FieldBaseValueError(
+                self, f"Expected {length} bytes at offset {offset}, "
+                      f"only {len(buffer) - offset} left.")
+        field_value = str(buffer[offset:end], 'utf-8')
+        self._validate_static_value(field_value)
+        return field_value, end
 
 
 class UnboundedString(String, metaclass=abc.ABCMeta):
 
+    @property
+    def struct_format(self) -> Optional[str]:
+        return None
+
+    def for_version(self, version: int) -> FieldBase:
+        # not padded, it spans the rest of the packet in any version
+        return self
+
     def pack(self, field: str) -> bytes:
         self._validate_field_to_pack(field)
         return field.encode()
 
-    def unpack(self, bytes_iter: Iterator[bytes]) -> str:
-        return bytes(bytes_iter).decode()
+    def unpack(self, buffer: memoryview, offset: int) -> Tuple[str, int]:
+        return str(buffer[offset:], 'utf-8'), len(buffer)
 
 
-class Bytes(FieldBase, SequenceMixin, metaclass=abc.ABCMeta):
+class Bytes(SequenceMixin, FieldBase, metaclass=abc.ABCMeta):
 
     TYPE = bytes
 
-    def pack(self, field: bytes) -> bytes:
-        self._validate_field_to_pack(field)
+    def pack(
+            self, field: Union[bytes, FileRegion],
+    ) -> Union[bytes, FileRegion]:
+        """Returns the bytes as is. A FileRegion is returned as is too, to be
+          sent from its file (see common.framing.send_buffers)."""
+        if isinstance(field, FileRegion):
+            self._validate_value_expected_length(field)
+        else:
+            self._validate_field_to_pack(field)
         return field
 
 
-class BoundedBytes(Bytes, BoundedMixin, metaclass=abc.ABCMeta):
+class BoundedBytes(BoundedMixin, Bytes, metaclass=abc.ABCMeta):
 
-    def unpack(self, bytes_iter: Iterator[bytes]) -> bytes:
-        field_value = self._slice_bytes_iter(bytes_iter)
+    def unpack(
+            self, buffer: memoryview, offset: int, length: int = None,
+    ) -> Tuple[bytes, int]:
+        field_bytes, offset = self._slice_buffer(buffer, offset, length)
+        field_value = bytes(field_bytes)
         self._validate_static_value(field_value)
-        return field_value
+        return field_value, offset
 
 
 class UnboundedBytes(Bytes, metaclass=abc.ABCMeta):
@@ -160,27 +341,59 @@ class UnboundedBytes(Bytes, metaclass=abc.ABCMeta):
         super(UnboundedBytes, self).__init__(
             name=name, length=float('inf'))
 
-    def unpack(self, bytes_iter: Iterator[bytes]) -> bytes:
-        return bytes(bytes_iter)
+    def unpack(self, buffer: memoryview, offset: int) -> Tuple[bytes, int]:
+        return bytes(buffer[offset:]), len(buffer)
 
 
 class Compound(FieldBase, metaclass=abc.ABCMeta):
+    """Rows of the values of nested fields, e.g. a client ID and name per
+      client, spanning the rest of the packet.
+
+    Values are tuples of rows, each a tuple of the values of the nested
+      fields in order. Rows are packed and unpacked by a precompiled
+      StructCodec: the fixed-width fields of a row with a single struct, and
+      the fields following them (e.g. a MessageContent) at the lengths given
+      by their size fields in the row. Rows of fixed-width fields only are
+      unpacked at once, with struct.iter_unpack.
+    """
+
+    __slots__ = ('fields', 'codec', '_dynamic_fields')
 
     TYPE = Tuple
+    SIZE_SUFFIX = '_size'
 
     def __init__(
             self, fields: Tuple[FieldBase, ...], name: str,
     ):
+        from protocol.fields.codec import StructCodec
+
         super(Compound, self).__init__(name=name, length=float('inf'))
         self.fields = fields
+        self.codec = StructCodec(fields)
+        # the row index of each field of variable length, and of its size
+        #  field (if any)
+        names = [field.name for field in fields]
+        self._dynamic_fields = tuple(
+            (idx, field, names.index(field.name + Compound.SIZE_SUFFIX)
+             if field.name + Compound.SIZE_SUFFIX in names else None)
+            for idx, field in enumerate(
+                self.codec.dynamic_fields, len(self.codec.fixed_fields)))
 
     @property
     def compound_length(self) -> int:
-        return sum(field.length for field in self.fields)
+        """Length of each nested values row, besides its fields of variable
+          length (which are given by size fields)."""
+        return sum(
+            field.length for field in self.fields
+            if field.length != float('inf'))
 
     def _validate_value_expected_length(self, field_value: Tuple[Any]) -> None:
         expected_length = len(self.fields)
         for nested_values in field_value:
+            if not isinstance(nested_values, (tuple, list)):
+                raise FieldBaseValueError(
+                    self, f"Invalid nested values {nested_values!r}, "
+                          f"expected a row of {expected_length} values.")
             actual_length = len(nested_values)
             if actual_length != expected_length:
                 raise FieldBaseValueError(
@@ -188,40 +401,62 @@ class Compound(FieldBase, metaclass=abc.ABCMeta):
                           f"({actual_length}), expected {expected_length}."
                 )
 
-    def pack(self, fields_values: Tuple[Any]) -> bytes:
-        fields_values_iter = iter(fields_values)
-
-        compound_bytes = []
-        for field in cycle(self.fields):
-            try:
-                field_value = next(fields_values_iter)
-            except StopIteration:
-                break
-            if field.name.endswith('_size'):
-                assert field_value != float('inf')
-                name_to_update = field.name.replace('_size', '')
-                for _field in self.fields:
-                    if _field.name == name_to_update:
-                        _field.length = field_value
-            field_bytes = field.pack(field_value)
-            compound_bytes.append(field_bytes)
-        return b''.join(compound_bytes)
-
-    def unpack(self, bytes_iter: Iterator[bytes]) -> TYPE:
-        fields_values = []
-        for field in cycle(self.fields):
-            try:
-                field_value = field.unpack(bytes_iter)
-            except StopIteration:
-                break
-            if field.name.endswith('_size'):
-                assert field_value != float('inf')
-                name_to_update = field.name.replace('_size', '')
-                for _field in self.fields:
-                    if _field.name == name_to_update:
-                        _field.length = field_value
-            fields_values.append(field_value)
-        return tuple(fields_values)
+    def for_version(self, version: int) -> FieldBase:
+        fields = tuple(field.for_version(version) for field in self.fields)
+        if fields == self.fields:
+            return self
+        return Compound(fields=fields, name=self.name)
+
+    def pack(self, rows: Sequence[Tuple[Any, ...]]) -> bytes:
+        return b''.join(self.pack_buffers(rows))
+
+    def pack_buffers(self, rows: Sequence[Tuple[Any, ...]]) -> List[bytes]:
+        """Packs the rows into buffers to send in order. Values of variable
+          length are buffers of their own, so they are not copied."""
+        self._validate_value_expected_length(rows)
+        if not self._dynamic_fields:
+            return [b''.join(map(self.codec.pack, rows))]
+        return [buffer for row in rows
+                for buffer in self._pack_row_buffers(row)]
+
+    def pack_row_buffers(self, row: Tuple[Any, ...]) -> List[bytes]:
+        """Packs a single row, e.g. while streaming rows (see
+          common.packer.Packer.pack_stream)."""
+        self._validate_value_expected_length((row, ))
+        if not self._dynamic_fields:
+            return [self.codec.pack(row)]
+        return self._pack_row_buffers(row)
+
+    def _pack_row_buffers(self, row: Tuple[Any, ...]) -> List[bytes]:
+        row_buffers = [self.codec.pack(row[:len(self.codec.fixed_fields)])]
+        for idx, field, size_idx in self._dynamic_fields:
+            field_value = row[idx]
+            if size_idx is not None and len(field_value) != row[size_idx]:
+                raise FieldBaseValueError(
+                    field, f"Value length {len(field_value)} differs from "
+                           f"its size {row[size_idx]}.")
+            row_buffers.append(field.pack(field_value))
+        return row_buffers
+
+    def unpack(self, buffer: memoryview, offset: int) -> Tuple[TYPE, int]:
+        """Unpacks rows until the end of `buffer`, which must not end in the
+          middle of a row."""
+        if not self._dynamic_fields:
+            rows = tuple(self.codec.iter_unpack(buffer[offset:]))
+            return rows, len(buffer)
+
+        rows = []
+        while offset < len(buffer):
+            row, offset = self.codec.unpack_from(buffer, offset)
+            for _, field, size_idx in self._dynamic_fields:
+                if size_idx is None:
+                    field_value, offset = field.unpack(buffer, offset)
+                else:
+                    field_value, offset = \
+                        field.unpack(buffer, offset, row[size_idx])
+                row.append(field_value)
+            rows.append(tuple(row))
+        return tuple(rows), offset
 
 
 class ClientID(Int):
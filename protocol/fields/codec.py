@@ -0,0 +1,116 @@
+import struct
+from itertools import takewhile
+from typing import Tuple, Sequence, Any, List, Mapping, Optional, Iterator
+
+from common.utils import Immutable, FieldsValues
+from common.exceptions import FieldBaseValueError
+from protocol.fields.base import FieldBase
+
+
+class StructCodec(Immutable):
+    """Precompiled codec of a fields tuple.
+
+    The fixed-width prefix of the fields is packed and unpacked with a single
+      struct.Struct. The fields following it (e.g. a MessageContent, which
+      length depends on the preceding size field) are left to the caller as
+      `dynamic_fields`.
+
+    Static values of the fields are the default values when packing, and are
+      validated when unpacking. They can be overridden by name, e.g. by the
+      code of a concrete packet.
+    """
+
+    __slots__ = (
+        'fixed_fields', 'dynamic_fields', 'names', 'defaults', 'struct',
+        'size', '_to_struct', '_from_struct', '_static_values',
+    )
+
+    def __init__(
+            self, fields: Tuple[FieldBase, ...],
+            values: Optional[Mapping[str, Any]] = None,
+    ):
+        values = values or {}
+        self.fixed_fields = tuple(takewhile(
+            lambda field: field.struct_format is not None, fields))
+        self.dynamic_fields = fields[len(self.fixed_fields):]
+        self.names = tuple(field.name for field in self.fixed_fields)
+        self.defaults = tuple(
+            values.get(field.name, field.value)
+            for field in self.fixed_fields)
+        self.struct = struct.Struct('<' + ''.join(
+            field.struct_format for field in self.fixed_fields))
+        self.size = self.struct.size
+
+        converted = [
+            (idx, field) for idx, field in enumerate(self.fixed_fields)
+            if field.struct_format.endswith('s')]
+        self._to_struct = tuple(
+            (idx, field.to_struct) for idx, field in converted)
+        self._from_struct = tuple(
+            (idx, field.from_struct) for idx, field in converted)
+        self._static_values = tuple(
+            (idx, field, value) for idx, (field, value)
+            in enumerate(zip(self.fixed_fields, self.defaults))
+            if value not in [None, float('inf')])
+
+    def _validate_values(self, values: Sequence[Any], error: Exception):
+        """Called when struct failed packing values: re-packs each value by
+          its field, to raise the same error as packing the field would."""
+        for field, value in zip(self.fixed_fields, values):
+            field.pack(value)
+        raise FieldBaseValueError(self, f"Invalid values {values!r}: {error}")
+
+    def pop_values(self, kwargs: FieldsValues) -> List[Any]:
+        """Pops the values of the fixed fields, or their defaults."""
+        return [kwargs.pop(name, default)
+                for name, default in zip(self.names, self.defaults)]
+
+    def pack(self, values: Sequence[Any]) -> bytes:
+        """Packs the values of the fixed fields, in order."""
+        struct_values = list(values)
+        try:
+            for idx, to_struct in self._to_struct:
+                struct_values[idx] = to_struct(struct_values[idx])
+            return self.struct.pack(*struct_values)
+        except (struct.error, FieldBaseValueError, TypeError,
+                AttributeError, OverflowError) as e:
+            self._validate_values(values, e)
+
+    def unpack_from(
+            self, buffer: memoryview, offset: int = 0,
+    ) -> Tuple[List[Any], int]:
+        """Unpacks the values of the fixed fields found at `offset` of
+          `buffer`. Returns them and the offset following them."""
+        if offset + self.size > len(buffer):
+            raise FieldBaseValueError(
+                self, f"Expected {self.size} bytes at offset {offset}, "
+                      f"only {len(buffer) - offset} left.")
+        values = self._from_struct_values(
+            self.struct.unpack_from(buffer, offset))
+        return values, offset + self.size
+
+    def iter_unpack(self, buffer: memoryview) -> Iterator[Tuple[Any, ...]]:
+        """Unpacks consecutive rows of the values of the fixed fields, which
+          must fill `buffer` exactly. Yields the values of each row."""
+        if len(buffer) % self.size:
+            raise FieldBaseValueError(
+                self, f"Expected rows of {self.size} bytes, got "
+                      f"{len(buffer)} bytes.")
+        for struct_values in self.struct.iter_unpack(buffer):
+            yield tuple(self._from_struct_values(struct_values))
+
+    def _from_struct_values(
+            self, struct_values: Tuple[Any, ...],
+    ) -> List[Any]:
+        values = list(struct_values)
+        for idx, from_struct in self._from_struct:
+            values[idx] = from_struct(values[idx])
+        for idx, field, value in self._static_values:
+            if values[idx] != value:
+                raise FieldBaseValueError(
+                    field, f"Invalid field value {values[idx]!r}, expected "
+                           f"{value!r}.")
+        return values
+
+    def __str__(self):
+        return f"StructCodec({', '.join(self.names)})"
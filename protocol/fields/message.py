@@ -1,5 +1,3 @@
-from typing import Iterator
-
 from protocol.fields.base import Int, ClientID, UnboundedBytes, \
     BoundedMixin, Compound, Bytes, BoundedBytes
 from protocol.fields.header import SenderClientID
@@ -46,6 +44,28 @@ class MessageID(Int):
         super(MessageID, self).__init__(name='message_id', length=5)
 
 
+class MaxMessages(Int):
+    """Maximal count of messages to pop, or 0 for no limit."""
+
+    def __init__(self):
+        super(MaxMessages, self).__init__(name='max_messages', length=4)
+
+
+class MaxMessagesSize(Int):
+    """Maximal size in bytes of the popped messages, or 0 for no limit."""
+
+    def __init__(self):
+        super(MaxMessagesSize, self).__init__(
+            name='max_messages_size', length=4)
+
+
+class HasMoreMessages(Int):
+
+    def __init__(self):
+        super(HasMoreMessages, self).__init__(
+            name='has_more_messages', length=1)
+
+
 class Messages(Compound):
 
     def __init__(self):
@@ -33,3 +33,10 @@ class RequestedClientID(ClientID):
 
     def __init__(self):
         super(RequestedClientID, self).__init__(name='requested_client_id')
+
+
+class MaxVersion(Int):
+    """The highest protocol version supported."""
+
+    def __init__(self):
+        super(MaxVersion, self).__init__(name='max_version', length=1)
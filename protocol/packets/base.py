@@ -1,61 +1,164 @@
 import abc
 import logging
-from copy import deepcopy
-from typing import Tuple, Any, NewType, Optional
+from types import MappingProxyType
+from typing import Tuple, Any, NewType, Dict, Mapping
 
-from common.utils import abstractproperty, classproperty
+from common.utils import abstractproperty, Immutable
 from common.exceptions import PacketBaseValueError
 from protocol.fields.base import FieldBase
+from protocol.fields.codec import StructCodec
+
+
+class PacketSchema(Immutable):
+    """Immutable layout of a packet type in a protocol version, built once per
+      class and version.
+
+    Holds the codecs compiled for the packet type. Values of a single pack or
+      unpack call are kept by the Packer or Unpacker, so a schema is safely
+      shared between threads.
+
+    Attributes:
+      version: The protocol version.
+      header_values: Static header values, e.g. the packet code.
+      header_codec, payload_codec: Codecs of the header and payload.
+      packet_codec: Codec of the header and payload together, compiled only
+        for packets of a fixed length.
+      header_length: Length of the packet header.
+    """
+
+    __slots__ = (
+        'version', 'header_fields', 'payload_fields', 'header_values',
+        'header_codec', 'payload_codec', 'packet_codec', 'header_length',
+    )
+
+    def __init__(
+            self, version: int, header_fields: Tuple[FieldBase, ...],
+            payload_fields: Tuple[FieldBase, ...],
+            header_values: Mapping[str, Any],
+    ):
+        self.version = version
+        self.header_fields = header_fields
+        self.payload_fields = payload_fields
+        self.header_values = MappingProxyType(dict(header_values))
+        self.header_codec = StructCodec(header_fields, header_values)
+        self.payload_codec = StructCodec(payload_fields)
+        if self.payload_codec.dynamic_fields:
+            self.packet_codec = None
+        else:
+            self.packet_codec = StructCodec(
+                header_fields + payload_fields, header_values)
+        self.header_length = self.header_codec.size
 
 
 class PacketBase(metaclass=abc.ABCMeta):
     """Abstract packet base class in MessageU protocol.
 
+    Packets hold no state: all packets of a type share its schemas.
+
     Class Attributes:
       PacketBase: class typing hack.
+      VERSION: The protocol version packets are packed in, unless another one
+        was negotiated.
+      VERSIONS: The supported protocol versions. The version field leads the
+        header in all of them, and the header layout is the same.
       CODE: Unique packet code. Each concrete packet implementation has a
         different code.
+      HEADER_VALUES: Static header values of the packet type, other than its
+        code and payload size.
       X_FIELD: Shortcut for creating specific fields.
+      schemas: The packet type schemas by protocol version, built once upon
+        its definition.
+      schema: The packet type schema in VERSION.
+      HEADER_LENGTH: Length of the packet header.
+      _TYPES_BY_CODE: Packet types by their code, registered upon definition.
+        The first type defined with a code is registered, so types sharing
+        the code of their parent (e.g. messages) resolve to the parent.
     """
 
     PacketBase = NewType('PacketBase', type)  # only for type notations
 
+    VERSION: int
+    VERSIONS = (2, 3)
+
     CODE = None
 
+    HEADER_VALUES: Dict[str, Any] = {}
+
     payload_fields: Tuple[FieldBase, ...] = ()
-    payload_size: int
-    header_fields: Tuple[FieldBase, ...]
+
+    schemas: Mapping[int, PacketSchema]
+    schema: PacketSchema
+    HEADER_LENGTH: int
+
+    _TYPES_BY_CODE: Dict[int, PacketBase] = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.schemas = MappingProxyType({
+            version: cls._build_schema(version)
+            for version in PacketBase.VERSIONS})
+        cls.schema = cls.schemas[cls.VERSION]
+        cls.HEADER_LENGTH = cls.schema.header_length
+        if cls.CODE is not None:
+            PacketBase._TYPES_BY_CODE.setdefault(cls.CODE, cls)
+
+    @classmethod
+    def type_by_code(cls, code: int) -> PacketBase:
+        """Returns the packet type registered with the code, out of the
+          subclasses of this class (e.g. only requests for Request).
+        If there is none, raises a PacketBaseValueError."""
+        packet_type = PacketBase._TYPES_BY_CODE.get(code)
+        if packet_type is None or not issubclass(packet_type, cls):
+            raise PacketBaseValueError(
+                cls.__name__, f"Unexpected code {code}!")
+        return packet_type
 
     @classmethod
     def _length_of_fields(cls, fields: Tuple[FieldBase, ...]) -> int:
         return sum(field.length for field in fields)
 
-    @abstractproperty
-    def HEADER_FIELDS_TEMPLATE(self) -> Tuple[FieldBase]: pass
-
-    @classproperty
-    def HEADER_LENGTH(self) -> int:
-        return self._length_of_fields(self.HEADER_FIELDS_TEMPLATE)
+    @classmethod
+    def _build_schema(cls, version: int) -> PacketSchema:
+        payload_fields = tuple(
+            field.for_version(version) for field in cls.payload_fields)
+        return PacketSchema(
+            version=version,
+            header_fields=cls.HEADER_FIELDS_TEMPLATE,
+            payload_fields=payload_fields,
+            header_values=cls._header_values(version, payload_fields),
+        )
 
-    def _update_header_value(self, field_name: str, field_value: Any) -> None:
-        for header in self.header_fields:
-            if header.name == field_name:
-                header.value = field_value
-                return
-        raise PacketBaseValueError(self, f"Invalid field name {field_name!s}!")
+    @classmethod
+    def _header_values(
+            cls, version: int, payload_fields: Tuple[FieldBase, ...],
+    ) -> Dict[str, Any]:
+        header_values = {'version': version, 'code': cls.CODE}
+        # the payload size of concrete packets of fixed length is static
+        payload_size = cls._length_of_fields(payload_fields)
+        if cls.CODE is not None and payload_size != float('inf'):
+            header_values['payload_size'] = payload_size
+        header_values.update(cls.HEADER_VALUES)
+        return header_values
 
-    CALCULATE_PAYLOAD_SIZE = -1
+    @classmethod
+    def schema_of_version(cls, version: int) -> PacketSchema:
+        """Returns the packet type schema in the protocol version.
+        If the version is not supported, raises a PacketBaseValueError."""
+        try:
+            return cls.schemas[version]
+        except KeyError:
+            raise PacketBaseValueError(
+                cls.__name__, f"Unsupported protocol version {version}, "
+                              f"expected one of {PacketBase.VERSIONS}.")
 
-    def __init__(self, payload_size: Optional[int] = CALCULATE_PAYLOAD_SIZE):
-        self.header_fields = deepcopy(self.HEADER_FIELDS_TEMPLATE)
-        if payload_size == self.CALCULATE_PAYLOAD_SIZE:
-            payload_size = self._length_of_fields(self.payload_fields)
-        self._update_header_value('payload_size', payload_size)
-        self._update_header_value('code', self.CODE)
+    @abstractproperty
+    def HEADER_FIELDS_TEMPLATE(self) -> Tuple[FieldBase]: pass
 
     def __str__(self):
         """Returns string with basic attributes."""
-        headers_str = ', '.join(str(f) for f in self.header_fields)
+        headers_str = ', '.join(
+            f'{name}={value!s}'
+            for name, value in self.schema.header_values.items())
         payload_str = ', '.join(str(f) for f in self.payload_fields)
         return f"{self.__class__.__name__}" \
                f"(code={self.CODE}, " \
@@ -1,4 +1,5 @@
 import abc
+from typing import Optional
 
 from protocol.fields.header import Version, RequestCode, PayloadSize, \
     SenderClientID
@@ -6,20 +7,23 @@ from protocol.packets.base import PacketBase
 
 
 class Request(PacketBase, metaclass=abc.ABCMeta):
-    """Abstract class of a request in MessageU protocol."""
+    """Abstract class of a request in MessageU protocol.
+
+    Class Attributes:
+      RESPONSE: The response type the server answers the request with, unless
+        it fails.
+      IDEMPOTENT: Whether serving the request again has no further effect, so
+        it is safe to resend when its response was lost.
+    """
 
     VERSION = 2
 
+    RESPONSE: Optional[PacketBase.PacketBase] = None
+    IDEMPOTENT = False
+
     HEADER_FIELDS_TEMPLATE = (
         Version(VERSION),
         RequestCode(),
         PayloadSize(),
         SenderClientID(),
     )
-
-    def __init__(self):
-        if self.__class__.__name__ == 'Request':
-            # if it's not a concrete request - we don't know the payload
-            super(Request, self).__init__(payload_size=None)
-        else:
-            super(Request, self).__init__()
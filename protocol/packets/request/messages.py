@@ -1,29 +1,60 @@
 import abc
+from typing import Dict
 
+from common.exceptions import PacketBaseValueError
 from protocol.fields.message import MessageContent, \
     ReceiverClientID, MessageType, MessageContentSize
 from protocol.packets.request.base import Request
+from protocol.packets.response.responses import PushMessageResponse
+
+
+def _message_payload_fields(message_type: int = None):
+    return (
+        ReceiverClientID(),
+        MessageType(message_type),
+        MessageContentSize(),
+        MessageContent()
+    )
 
 
 class PushMessageRequest(Request, metaclass=abc.ABCMeta):
     """Push a message to a client request.
 
-    Upon sending, expects a PushMessageResponse child class or ErrorResponse
-      from the server.
+    Upon sending, expects a PushMessageResponse or ErrorResponse from the
+      server.
+
+    Class Attributes:
+      _TYPES_BY_MESSAGE_TYPE: Message request types by their message type,
+        registered upon definition.
     """
 
     CODE = 103
 
+    RESPONSE = PushMessageResponse
+
     MESSAGE_TYPE: int = None
 
-    def __init__(self):
-        self.payload_fields = (
-            ReceiverClientID(),
-            MessageType(self.MESSAGE_TYPE),
-            MessageContentSize(),
-            MessageContent()
-        )
-        super(PushMessageRequest, self).__init__()
+    payload_fields = _message_payload_fields(MESSAGE_TYPE)
+
+    _TYPES_BY_MESSAGE_TYPE: Dict[int, Request.PacketBase] = {}
+
+    def __init_subclass__(cls, **kwargs):
+        # each message type validates its own static MessageType value
+        cls.payload_fields = _message_payload_fields(cls.MESSAGE_TYPE)
+        super(PushMessageRequest, cls).__init_subclass__(**kwargs)
+        if cls.MESSAGE_TYPE is not None:
+            PushMessageRequest._TYPES_BY_MESSAGE_TYPE.setdefault(
+                cls.MESSAGE_TYPE, cls)
+
+    @classmethod
+    def type_by_message_type(cls, message_type: int) -> Request.PacketBase:
+        """Returns the message request type registered with the message type.
+        If there is none, raises a PacketBaseValueError."""
+        try:
+            return PushMessageRequest._TYPES_BY_MESSAGE_TYPE[message_type]
+        except KeyError:
+            raise PacketBaseValueError(
+                cls.__name__, f"Unexpected message type {message_type}!")
 
 
 class GetSymmetricKeyRequest(PushMessageRequest):
@@ -1,6 +1,10 @@
 from protocol.fields.payload import ClientName, PublicKey, RequestedClientID
+from protocol.fields.message import MaxMessages, MaxMessagesSize
 from protocol.packets.request.base import Request
 from protocol.packets.request.messages import PushMessageRequest
+from protocol.packets.response.responses import RegisterResponse, \
+    ListClientsResponse, PublicKeyResponse, PopMessagesResponse, \
+    PopMessagesPageResponse, VersionResponse
 
 
 class RegisterRequest(Request):
@@ -11,9 +15,9 @@ class RegisterRequest(Request):
 
     CODE = 100
 
-    def __init__(self):
-        super(RegisterRequest, self).__init__()
-        self._update_header_value('sender_client_id', 0)
+    RESPONSE = RegisterResponse
+
+    HEADER_VALUES = {'sender_client_id': 0}
 
     payload_fields = (
         ClientName(),
@@ -30,6 +34,10 @@ class ListClientsRequest(Request):
 
     CODE = 101
 
+    RESPONSE = ListClientsResponse
+
+    IDEMPOTENT = True
+
 
 class PublicKeyRequest(Request):
     """Get public-key of a specific client request.
@@ -39,6 +47,10 @@ class PublicKeyRequest(Request):
 
     CODE = 102
 
+    RESPONSE = PublicKeyResponse
+
+    IDEMPOTENT = True
+
     payload_fields = (RequestedClientID(), )
 
 
@@ -51,10 +63,52 @@ class PopMessagesRequest(Request):
 
     CODE = 104
 
+    RESPONSE = PopMessagesResponse
+
     payload_fields = ()
 
 
+class PopMessagesPageRequest(Request):
+    """Pop the first messages of a client request, within a count and size
+      budget.
+
+    At least one message is popped, even if it exceeds the size budget, so
+      the client can drain its messages by repeating the request while
+      PopMessagesPageResponse reports more messages.
+
+    Upon sending, expects a PopMessagesPageResponse or ErrorResponse from the
+      server.
+    """
+
+    CODE = 105
+
+    RESPONSE = PopMessagesPageResponse
+
+    payload_fields = (
+        MaxMessages(),
+        MaxMessagesSize(),
+    )
+
+
+class VersionRequest(Request):
+    """Probe of the protocol versions the server supports.
+
+    Sent in version 2, which all servers support. Servers predating it answer
+      with an ErrorResponse, and then only support version 2.
+
+    Upon sending, expects a VersionResponse or ErrorResponse from the server.
+    """
+
+    CODE = 106
+
+    RESPONSE = VersionResponse
+
+    IDEMPOTENT = True
+
+    HEADER_VALUES = {'sender_client_id': 0}
+
+
 ALL_REQUESTS = (
     RegisterRequest, ListClientsRequest, PublicKeyRequest, PushMessageRequest,
-    PopMessagesRequest,
+    PopMessagesRequest, PopMessagesPageRequest, VersionRequest,
 )
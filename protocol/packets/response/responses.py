@@ -1,7 +1,7 @@
-from common.utils import FieldsValues
-from protocol.fields.payload import Clients, RequestedClientID, PublicKey
+from protocol.fields.payload import Clients, RequestedClientID, PublicKey, \
+    MaxVersion
 from protocol.fields.message import ReceiverClientID, NewClientID, MessageID, \
-    Messages
+    Messages, HasMoreMessages
 from protocol.packets.response.base import Response
 
 
@@ -45,14 +45,22 @@ class PopMessagesResponse(Response):
 
     payload_fields = (Messages(), )
 
-    @property
-    def compound_length(self) -> int:
-        return sum(field.length for field in self.payload_fields[0].fields)
 
-    def pack(self, messages_count: int, **kwargs: FieldsValues) -> bytes:
-        self.payload_size = self.compound_length * messages_count
-        self._update_header_value('payload_size', self.payload_size)
-        return super(PopMessagesResponse, self).pack(**kwargs)
+class PopMessagesPageResponse(Response):
+
+    CODE = 1005
+
+    payload_fields = (
+        HasMoreMessages(),
+        Messages(),
+    )
+
+
+class VersionResponse(Response):
+
+    CODE = 1006
+
+    payload_fields = (MaxVersion(), )
 
 
 class ErrorResponse(Response):
@@ -62,5 +70,6 @@ class ErrorResponse(Response):
 
 ALL_RESPONSES = (
     RegisterResponse, ListClientsResponse, PublicKeyResponse,
-    PushMessageResponse, PopMessagesResponse, ErrorResponse,
+    PushMessageResponse, PopMessagesResponse, PopMessagesPageResponse,
+    VersionResponse, ErrorResponse,
 )
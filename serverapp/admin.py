@@ -1,6 +1,8 @@
 from django.contrib import admin
+from django.db import transaction
 
 from serverapp.models import Client, Message
+from serverapp.blobstore import blobs
 
 
 @admin.register(Client)
@@ -13,5 +15,20 @@ class ClientAdmin(admin.ModelAdmin):
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
 
-    list_display = ('id', 'to_client', 'from_client', 'message_type')
-    readonly_fields = list_display + ('content', )
+    list_display = (
+        'id', 'to_client', 'from_client', 'message_type', 'content_size')
+    readonly_fields = list_display + ('blob', 'content')
+
+    def get_queryset(self, request):
+        # contents are only loaded by the page of a single message
+        return super(MessageAdmin, self).get_queryset(request).defer('content')
+
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, Message.objects.filter(id=obj.id))
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            released_blobs = set(
+                queryset.exclude(blob='').values_list('blob', flat=True))
+            queryset.delete()
+            blobs.release(released_blobs)
@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class ServerappConfig(AppConfig):
+
+    name = 'serverapp'
+
+    def ready(self):
+        # connects the signal receivers
+        from serverapp import signals  # noqa: F401
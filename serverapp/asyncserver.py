@@ -0,0 +1,293 @@
+import time
+import socket
+import asyncio
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple, Optional, Iterable, List, Union
+
+from common.utils import FieldsValues
+from common.exceptions import DeadlineExceededError
+from common.framing import Deadline, FileRegion
+from serverapp.handler import ServerHandler
+from serverapp.metrics import metrics
+from protocol.packets.request.base import Request
+
+
+class AsyncServerHandler(ServerHandler):
+    """Serves a single connection of the asyncio server.
+
+    Reuses ServerHandler's packet parsing and request methods. The request
+      methods perform blocking Django ORM calls, so they are run on the
+      server's bounded executor instead of the event loop.
+
+    Class Attributes:
+      CHUNK_SIZE: Size of the chunks spooled message contents are read in.
+
+    Records into serverapp.metrics, besides ServerHandler's:
+      queue_wait: Time requests waited for an executor thread - as
+        connections wait for a worker of PooledTCPServer.
+    """
+
+    CHUNK_SIZE = 2 ** 16
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(
+            self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+            executor: ThreadPoolExecutor,
+    ):
+        # BaseRequestHandler.__init__ handles the request synchronously, so
+        #  it is not called.
+        self.reader = reader
+        self.writer = writer
+        self.executor = executor
+        self.client_address = writer.get_extra_info('peername')
+        if not self.client_address:
+            # Unix domain peers are unnamed
+            self.client_address = \
+                (f"unix:{writer.get_extra_info('sockname')}", 0)
+
+    async def _read_async(
+            self, size: int, deadline: Optional[Deadline] = None,
+    ) -> bytes:
+        """Reads exactly `size` bytes, within the idle timeout and by
+          `deadline` - else raises an asyncio.TimeoutError, or a
+          DeadlineExceededError."""
+        from django.conf import settings
+
+        timeout = settings.MESSAGEU_IDLE_TIMEOUT
+        if deadline is not None:
+            timeout = min(deadline.remaining(), timeout)
+        try:
+            return await asyncio.wait_for(
+                self.reader.readexactly(size), timeout=timeout)
+        except asyncio.TimeoutError:
+            if deadline is not None:
+                deadline.remaining()
+            raise
+
+    async def _read_header_async(self) -> Tuple[bytes, Deadline]:
+        """Waits for a request as long as the connection may be idle, and
+          reads its header by the header deadline. Returns the header and
+          that deadline."""
+        from django.conf import settings
+
+        # reads from the StreamReader buffer, not from the socket
+        first_byte = await self._read_async(1)
+        deadline = Deadline('header', settings.MESSAGEU_HEADER_TIMEOUT)
+        rest = await self._read_async(Request.HEADER_LENGTH - 1, deadline)
+        return first_byte + rest, deadline
+
+    async def _expect_spooled_payload(
+            self, header_fields: FieldsValues, deadline: Deadline,
+    ) -> Tuple[Request, FieldsValues]:
+        """Reads the payload of a large message request, receiving its content
+          into a SpooledTemporaryFile in chunks."""
+        from django.conf import settings
+
+        request_type, fixed_size = self._spooled_request_type(header_fields)
+        fixed_payload = await self._read_async(fixed_size, deadline)
+        content = tempfile.SpooledTemporaryFile(
+            max_size=settings.MESSAGEU_SPOOL_THRESHOLD)
+        try:
+            remaining = header_fields['payload_size'] - fixed_size
+            while remaining:
+                chunk = await self._read_async(
+                    min(remaining, AsyncServerHandler.CHUNK_SIZE), deadline)
+                content.write(chunk)
+                remaining -= len(chunk)
+            return self._unpack_spooled_payload(
+                request_type, header_fields, fixed_payload, content)
+        except BaseException:
+            content.close()
+            raise
+
+    def _respond_queued(
+            self, queued: float, request_type: Request, fields: FieldsValues,
+    ) -> Iterable[List[bytes]]:
+        """Records the time the request waited for the executor, and
+          responds."""
+        metrics.observe('queue_wait', time.monotonic() - queued)
+        return self._respond(request_type, fields)
+
+    async def _write_response(
+            self, response_chunks: Iterable[List[bytes]],
+    ) -> None:
+        """Writes the chunks of buffers returned by _respond. Streamed chunks
+          are packed on the executor, as iterating them queries the database,
+          and are written one by one."""
+        if isinstance(response_chunks, tuple):
+            for chunk in response_chunks:
+                self.writer.writelines(chunk)
+            await self.writer.drain()
+            return
+
+        loop = asyncio.get_running_loop()
+        while True:
+            chunk = await loop.run_in_executor(
+                self.executor, next, response_chunks, None)
+            if chunk is None:
+                break
+            await self._write_buffers(chunk)
+
+    async def _write_buffers(
+            self, buffers: List[Union[bytes, FileRegion]],
+    ) -> None:
+        """Writes the buffers, and FileRegions among them with
+          loop.sendfile (by the kernel, where the transport supports it)."""
+        loop = asyncio.get_running_loop()
+        memory_buffers = []
+        for buffer in buffers:
+            if not isinstance(buffer, FileRegion):
+                memory_buffers.append(buffer)
+                continue
+            self.writer.writelines(memory_buffers)
+            memory_buffers = []
+            await self.writer.drain()
+            sent = await loop.sendfile(
+                self.writer.transport, buffer.file, buffer.offset, buffer.size)
+            if sent != buffer.size:
+                raise ValueError(f"File ended after {sent} of the "
+                                 f"{buffer.size} bytes to send.")
+        self.writer.writelines(memory_buffers)
+        await self.writer.drain()
+
+    async def _handle_request_async(self) -> bool:
+        """Expects a single request and responds to it.
+
+        Returns whether the connection can serve another request, like
+          ServerHandler._handle_request."""
+        loop = asyncio.get_running_loop()
+        try:
+            # expect a request
+            header, header_deadline = await self._read_header_async()
+            unpacker, header_fields = self._unpack_header(header, Request())
+            deadline = self._payload_deadline(
+                header_fields['payload_size'], header_deadline.started)
+            if self._should_spool(header_fields):
+                request_type, fields = await self._expect_spooled_payload(
+                    header_fields, deadline)
+            else:
+                payload = await self._read_async(
+                    header_fields['payload_size'], deadline)
+                request_type, fields = \
+                    self._unpack_payload(unpacker, header_fields, payload)
+        except DeadlineExceededError as e:
+            self._timed_out(e.deadline_name)
+            return False
+        except asyncio.TimeoutError:
+            self._timed_out('idle')
+            return False
+        except asyncio.IncompleteReadError:
+            return False
+        except Exception as e:
+            self.logger.exception(e)
+            # pack and send an error response
+            self.writer.write(self._error_response())
+            return False
+
+        self.logger.debug(f"{request_type.__class__.__name__}: {fields}")
+        received = time.monotonic()
+        try:
+            response_chunks = await loop.run_in_executor(
+                self.executor, self._respond_queued, received, request_type,
+                fields)
+        except Exception as e:
+            self.logger.exception(e)
+            # pack and send an error response
+            self.writer.write(self._error_response(fields['version']))
+            await self.writer.drain()
+            return True
+
+        try:
+            await self._write_response(response_chunks)
+        except ConnectionError:
+            raise
+        except Exception as e:
+            # part of the response might have been sent already
+            self.logger.exception(e)
+            return False
+        metrics.observe('request', time.monotonic() - received)
+        self.logger.debug(
+            f"Responded to {self.client_address[0]} successfully.")
+        return True
+
+    async def handle_async(self) -> None:
+        """Serves requests until the client closes the connection."""
+        try:
+            while await self._handle_request_async():
+                pass
+            await self.writer.drain()
+        except ConnectionError as e:
+            self.logger.debug(f"Connection with {self.client_address[0]} "
+                              f"lost: {e!r}")
+        finally:
+            self.writer.close()
+
+
+class AsyncServer:
+    """TCP server serving all connections from a single asyncio event loop.
+    Also serves a listening Unix domain socket, if given one.
+
+    Mirrors the socketserver interface used by ServerApp: serve_forever
+      blocks until shutdown is called from another thread."""
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(
+            self, server_address: Tuple[str, int], executor_workers: int,
+            reuse_port: bool = False,
+            unix_socket: Optional[socket.socket] = None,
+    ):
+        self.server_address = server_address
+        self.reuse_port = reuse_port
+        self.unix_socket = unix_socket
+        self.executor = ThreadPoolExecutor(
+            max_workers=executor_workers,
+            thread_name_prefix='MessageU ORM',
+        )
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._servers: List[asyncio.AbstractServer] = []
+        self.started = threading.Event()
+
+    async def _on_connection(
+            self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+    ) -> None:
+        handler = AsyncServerHandler(reader, writer, self.executor)
+        await handler.handle_async()
+
+    async def _serve(self) -> None:
+        host, port = self.server_address
+        self._loop = asyncio.get_running_loop()
+        server = await asyncio.start_server(
+            self._on_connection, host, port, reuse_port=self.reuse_port)
+        # the port might have been picked by the OS
+        self.server_address = server.sockets[0].getsockname()[:2]
+        self._servers.append(server)
+        if self.unix_socket is not None:
+            self._servers.append(await asyncio.start_unix_server(
+                self._on_connection, sock=self.unix_socket))
+        self.started.set()
+        try:
+            await asyncio.gather(
+                *(server.serve_forever() for server in self._servers))
+        except asyncio.CancelledError:
+            pass
+        finally:
+            for server in self._servers:
+                server.close()
+                await server.wait_closed()
+
+    def serve_forever(self) -> None:
+        try:
+            asyncio.run(self._serve())
+        finally:
+            self.executor.shutdown(wait=True)
+
+    def shutdown(self) -> None:
+        """Stops serve_forever. Must be called from another thread."""
+        self.started.wait()
+        for server in self._servers:
+            self._loop.call_soon_threadsafe(server.close)
@@ -0,0 +1,164 @@
+import os
+import time
+import hashlib
+import logging
+import tempfile
+from typing import Union, BinaryIO, Iterable, Set, Collection
+
+
+class BlobStore:
+    """Content-addressed files of large message contents, kept out of the
+      database - so they neither bloat it, nor are read by queries that
+      do not need them.
+
+    Blobs are named by the SHA-256 digest of their content, under a directory
+      of its first two hex digits, and are referenced by Message.blob.
+
+    A blob is deleted by `release` once no message references it. It must be
+      called in the transaction deleting the messages, after deleting them:
+      SQLite serializes writing transactions, so a push of the same content
+      either committed already (and its message references the blob), or
+      stores the blob again once it inserted its message (see `ensure`).
+    Blobs left by failures, e.g. of a push after storing its content, or by
+      clients deleted with their messages, are deleted by collect_garbage.
+
+    Class Attributes:
+      CHUNK_SIZE: Bytes read at once when storing content from a file.
+      GC_GRACE: Seconds collect_garbage keeps blobs no message references,
+        as they might be stored by a push meanwhile.
+      TEMP_PREFIX: Prefix of the files blobs are written into, before being
+        renamed by their digest.
+
+    The server uses the module-level `blobs` instance.
+    """
+
+    CHUNK_SIZE = 2 ** 16
+    GC_GRACE = 60 * 60
+    TEMP_PREFIX = '.tmp-'
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, root: str = None):
+        self._root = root
+
+    @property
+    def root(self) -> str:
+        """The blobs directory: `root` if given, MESSAGEU_BLOB_DIR otherwise.
+        """
+        if self._root is not None:
+            return str(self._root)
+        from django.conf import settings
+        return str(settings.MESSAGEU_BLOB_DIR)
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest)
+
+    def put(self, content: Union[bytes, BinaryIO]) -> str:
+        """Stores content given as bytes or as a file (e.g. spooled, which is
+          copied in chunks). Returns its digest.
+
+        The content is written to a temporary file, synced, and renamed by its
+          digest - replacing a blob of the same content, if any."""
+        root = self.root
+        os.makedirs(root, exist_ok=True)
+        digest = hashlib.sha256()
+        with tempfile.NamedTemporaryFile(
+                dir=root, prefix=BlobStore.TEMP_PREFIX, delete=False,
+        ) as temp:
+            try:
+                if isinstance(content, bytes):
+                    digest.update(content)
+                    temp.write(content)
+                else:
+                    content.seek(0)
+                    for chunk in iter(
+                            lambda: content.read(BlobStore.CHUNK_SIZE), b''):
+                        digest.update(chunk)
+                        temp.write(chunk)
+                temp.flush()
+                os.fsync(temp.fileno())
+            except BaseException:
+                temp.close()
+                os.unlink(temp.name)
+                raise
+        hex_digest = digest.hexdigest()
+        path = self.path(hex_digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temp.name, path)
+        return hex_digest
+
+    def ensure(self, digest: str, content: Union[bytes, BinaryIO]) -> None:
+        """Stores the content again if its blob was deleted, e.g. released by
+          a pop after this content was stored by a push. Called in the
+          transaction inserting the message referencing it, after inserting
+          it."""
+        if not os.path.exists(self.path(digest)):
+            self.put(content)
+
+    def open(self, digest: str) -> BinaryIO:
+        return open(self.path(digest), 'rb')
+
+    def read(self, digest: str) -> bytes:
+        with self.open(digest) as file:
+            return file.read()
+
+    def _referenced(self, digests: Collection[str]) -> Set[str]:
+        """Returns the digests referenced by messages."""
+        from django.db import connection
+        from serverapp.models import Message
+
+        digests = list(digests)
+        batch_size = connection.ops.bulk_batch_size(['blob'], digests)
+        referenced = set()
+        for idx in range(0, len(digests), batch_size):
+            referenced.update(Message.objects.filter(
+                blob__in=digests[idx:idx + batch_size],
+            ).values_list('blob', flat=True))
+        return referenced
+
+    def _unlink(self, path: str) -> bool:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def release(self, digests: Iterable[str]) -> None:
+        """Deletes the blobs of the digests, unless referenced by messages."""
+        digests = set(digests)
+        if not digests:
+            return
+        for digest in digests - self._referenced(digests):
+            self._unlink(self.path(digest))
+
+    def collect_garbage(self) -> int:
+        """Deletes the blobs no message references, and temporary files left
+          by failed writes, unless modified within GC_GRACE seconds. Returns
+          the count of deleted files."""
+        root = self.root
+        expired = time.time() - BlobStore.GC_GRACE
+        deleted = 0
+        blob_paths = {}
+        for dir_path, _, file_names in os.walk(root):
+            for file_name in file_names:
+                path = os.path.join(dir_path, file_name)
+                try:
+                    if os.stat(path).st_mtime > expired:
+                        continue
+                except FileNotFoundError:
+                    continue
+                if file_name.startswith(BlobStore.TEMP_PREFIX):
+                    deleted += self._unlink(path)
+                else:
+                    blob_paths[file_name] = path
+        if blob_paths:
+            referenced = self._referenced(blob_paths)
+            for digest, path in blob_paths.items():
+                if digest not in referenced:
+                    deleted += self._unlink(path)
+        if deleted:
+            self.logger.info(f"Deleted {deleted} unreferenced blob files.")
+        return deleted
+
+
+blobs = BlobStore()
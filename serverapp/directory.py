@@ -0,0 +1,181 @@
+import logging
+import threading
+from typing import Dict, Iterable, Set, Tuple, Optional
+
+from common.packer import Packer
+from protocol.packets.base import PacketBase
+from protocol.packets.response.responses import ListClientsResponse, \
+    PublicKeyResponse
+
+
+class ClientDirectory:
+    """Process-wide directory of the names and public keys of the registered
+      clients, so looking a client up never queries the database. The
+      responses listing the clients and holding a client's public key are
+      cached packed, per protocol version.
+
+    Clients are loaded from the database when a server process starts, and
+      added upon registering in this process. Clients registered by other
+      server processes (see serverapp.prefork) are loaded once looked up.
+      Once started, a background thread refreshes the directory every
+      `interval` seconds - so clients registered by other processes are
+      listed, and clients deleted (e.g. through the admin panel) are dropped,
+      while lookups never wait for a refresh. A refresh loads only the
+      clients registered since the last one, and the IDs of the others.
+
+    The server uses the module-level `directory` instance.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # names and public keys by client ID
+        self._clients: Dict[int, Tuple[str, str]] = {}
+        # the highest ID loaded from the database - other server processes
+        #  might commit lower IDs than those registered by this process
+        self._loaded_id = 0
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # incremented upon changes, so responses packed meanwhile are dropped
+        self._generation = 0
+        self._list_responses: Dict[int, bytes] = {}
+        self._public_key_responses: Dict[Tuple[int, int], bytes] = {}
+
+    def _add(self, client_id: int, name: str, public_key: str) -> None:
+        """Called with the lock held."""
+        if self._clients.get(client_id) == (name, public_key):
+            return
+        self._clients[client_id] = (name, public_key)
+        self._generation += 1
+        self._list_responses = {}
+        for version in PacketBase.VERSIONS:
+            self._public_key_responses.pop((client_id, version), None)
+
+    def _remove(self, client_id: int) -> None:
+        """Called with the lock held."""
+        del self._clients[client_id]
+        self._generation += 1
+        self._list_responses = {}
+        for version in PacketBase.VERSIONS:
+            self._public_key_responses.pop((client_id, version), None)
+
+    def _fetch(self, after_id: int) -> Iterable[Tuple[int, str, str]]:
+        """Returns the IDs, names and public keys of the clients of IDs above
+          `after_id`, in order."""
+        from serverapp.models import Client
+
+        return Client.objects.filter(id__gt=after_id).order_by(
+            'id').values_list('id', 'name', 'public_key')
+
+    def _fetch_ids(self) -> Set[int]:
+        """Returns the IDs of all the clients."""
+        from serverapp.models import Client
+
+        return set(Client.objects.values_list('id', flat=True))
+
+    def _load(self) -> None:
+        """Called with the lock held."""
+        for client_id, name, public_key in self._fetch(self._loaded_id):
+            self._add(client_id, name, public_key)
+            self._loaded_id = client_id
+
+    def load(self) -> None:
+        """Loads the clients registered since the last load."""
+        with self._lock:
+            self._load()
+
+    def refresh(self) -> None:
+        """Loads the clients registered since the last load, and drops those
+          deleted since."""
+        with self._lock:
+            self._load()
+            # clients added meanwhile wait for the lock, so are fetched too
+            for client_id in self._clients.keys() - self._fetch_ids():
+                self._remove(client_id)
+
+    def _run(self, interval: float) -> None:
+        from django.db import connection
+
+        try:
+            while not self._stopped.wait(interval):
+                try:
+                    self.refresh()
+                except Exception as e:
+                    self.logger.warning(
+                        f"Failed refreshing the client directory: {e!r}")
+        finally:
+            connection.close()
+
+    def start(self, interval: float) -> None:
+        """Starts refreshing every `interval` seconds in a background thread,
+          unless already started."""
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(interval, ),
+            name='MessageU directory refresh', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops refreshing in the background."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def add(self, client_id: int, name: str, public_key: str) -> None:
+        """Adds a client registered by this process."""
+        with self._lock:
+            self._add(client_id, name, public_key)
+
+    def get(self, client_id: int) -> Optional[Tuple[str, str]]:
+        """Returns the name and public key of the client, or None if there is
+          no such client."""
+        client = self._clients.get(client_id)
+        if client is None:
+            # e.g. registered by another server process
+            self.load()
+            client = self._clients.get(client_id)
+        return client
+
+    def list_clients_response(self, version: int) -> bytes:
+        """Returns the packed ListClientsResponse of all clients."""
+        response = self._list_responses.get(version)
+        if response is not None:
+            return response
+
+        with self._lock:
+            generation = self._generation
+            clients = tuple(
+                (client_id, name)
+                for client_id, (name, _) in sorted(self._clients.items()))
+        response = Packer(ListClientsResponse(), version).pack(clients=clients)
+        with self._lock:
+            if generation == self._generation:
+                self._list_responses[version] = response
+        return response
+
+    def public_key_response(
+            self, client_id: int, version: int,
+    ) -> Optional[bytes]:
+        """Returns the packed PublicKeyResponse of the client, or None if there
+          is no such client."""
+        response = self._public_key_responses.get((client_id, version))
+        if response is not None:
+            return response
+
+        client = self.get(client_id)
+        if client is None:
+            return None
+        _, public_key = client
+        response = Packer(PublicKeyResponse(), version).pack(
+            requested_client_id=client_id, public_key=public_key)
+        with self._lock:
+            if self._clients.get(client_id) == client:
+                self._public_key_responses[(client_id, version)] = response
+        return response
+
+
+directory = ClientDirectory()
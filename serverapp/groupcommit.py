@@ -0,0 +1,172 @@
+import time
+import logging
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, List, Optional, Sequence
+
+from common.exceptions import ServerAppException
+from serverapp.metrics import metrics
+
+
+class _PendingPush:
+    """A push waiting for the committer, and then for its message ID."""
+
+    __slots__ = ('row', 'done', 'message_id', 'error')
+
+    def __init__(self, row: Any):
+        self.row = row
+        self.done = threading.Event()
+        self.message_id: Optional[int] = None
+        self.error: Optional[BaseException] = None
+
+
+class GroupCommitter:
+    """Inserts the messages pushed concurrently in a single transaction, on
+      a committer thread - so pushes do not each wait for a transaction of
+      their own, and its sync, under the database write lock.
+
+    A push enqueues its row and waits. The committer takes up to
+      `batch_size` pending rows, waiting up to `interval` seconds for more
+      once the first one arrived (0 commits the rows pending meanwhile right
+      away), and inserts them by `insert` - which returns their message IDs
+      in order. If the transaction fails, each row is retried in one of its
+      own, so a push fails by its own error only.
+
+    Pushes are inserted by the pushing thread itself before the committer is
+      started, and after it is stopped (or failed). A push not committed
+      within `timeout` seconds raises a ServerAppException - though once the
+      committer took it, it may still be inserted.
+
+    Records into serverapp.metrics:
+      group_commit: Time transactions of pushes took.
+      group_commit_messages: Count of messages they inserted - divided by the
+        count of group_commit, the mean batch size.
+      group_commit_errors: Count of failed transactions of several pushes,
+        which were retried one by one.
+      group_commit_timeouts: Count of pushes that timed out.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(
+            self, insert: Callable[[Sequence[Any]], List[int]],
+            interval: float, batch_size: int, timeout: float = 30,
+    ):
+        self._insert = insert
+        self.interval = interval
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self._condition = threading.Condition()
+        self._pending: Deque[_PendingPush] = deque()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+
+    def push(self, row: Any) -> int:
+        """Inserts the row, once committed with the others pending. Returns
+          its message ID, or raises the error inserting it."""
+        pending = _PendingPush(row)
+        with self._condition:
+            if self._thread is None or self._stopping:
+                pending = None
+            else:
+                self._pending.append(pending)
+                self._condition.notify()
+        if pending is None:
+            return self._insert([row])[0]
+        if not pending.done.wait(self.timeout):
+            with self._condition:
+                if pending in self._pending:
+                    self._pending.remove(pending)
+            metrics.increment('group_commit_timeouts')
+            raise ServerAppException(
+                f"The message was not committed within {self.timeout} "
+                f"seconds.")
+        if pending.error is not None:
+            raise pending.error
+        return pending.message_id
+
+    def _take_batch(self) -> List[_PendingPush]:
+        """Waits for pending pushes, and takes a batch of them. Returns an
+          empty batch once stopping with no pushes left."""
+        with self._condition:
+            while not self._pending and not self._stopping:
+                self._condition.wait()
+            if self.interval:
+                deadline = time.monotonic() + self.interval
+                while 0 < len(self._pending) < self.batch_size \
+                        and not self._stopping:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+            return [self._pending.popleft() for _ in range(
+                min(len(self._pending), self.batch_size))]
+
+    def _commit(self, batch: List[_PendingPush]) -> None:
+        started = time.monotonic()
+        try:
+            message_ids = self._insert([pending.row for pending in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0].error = e
+                batch[0].done.set()
+                return
+            metrics.increment('group_commit_errors')
+            self.logger.warning(
+                f"Failed inserting {len(batch)} messages at once, retrying "
+                f"each: {e!r}")
+            for pending in batch:
+                self._commit([pending])
+            return
+        metrics.observe('group_commit', time.monotonic() - started)
+        metrics.increment('group_commit_messages', len(batch))
+        for pending, message_id in zip(batch, message_ids):
+            pending.message_id = message_id
+            pending.done.set()
+
+    def _run(self) -> None:
+        from django.db import connection
+
+        batch: List[_PendingPush] = []
+        try:
+            while True:
+                batch = self._take_batch()
+                if not batch:
+                    return
+                self._commit(batch)
+        except BaseException as e:
+            self.logger.critical(f"The committer failed: {e!r}")
+            raise
+        finally:
+            # upon failing, the pushes taken or pending do not wait for the
+            #  committer, and later ones are inserted by their own threads
+            with self._condition:
+                self._stopping = True
+                batch.extend(self._pending)
+                self._pending.clear()
+            for pending in batch:
+                if not pending.done.is_set():
+                    pending.error = ServerAppException(
+                        "The committer failed.")
+                    pending.done.set()
+            connection.close()
+
+    def start(self) -> None:
+        """Starts committing pushes on a committer thread, unless started
+          already."""
+        if self._thread is not None:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(
+            target=self._run, name='MessageU group commit', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Commits the pending pushes, and stops the committer thread."""
+        if self._thread is None:
+            return
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        self._thread.join()
+        self._thread = None
@@ -1,27 +1,82 @@
+import time
+import socket
+import select
 import logging
+import tempfile
 import socketserver
-from typing import Dict, Tuple, Union, NewType, Type, Callable
-from itertools import dropwhile
+from types import MappingProxyType
+from typing import Dict, Tuple, Union, Type, Callable, BinaryIO, \
+    Iterable, Iterator, Mapping, Optional
 
-from django.core.exceptions import ValidationError, ObjectDoesNotExist
+from django.conf import settings
 
 from common import exceptions
+from common.framing import FrameReader, Deadline, send_buffers
 from common.handlerbase import HandlerBase
-from common.utils import camel_case_to_snake_case, FieldsValues
+from common.utils import FieldsValues
 from common.packer import Packer
-from serverapp.models import Client, Message
+from serverapp.models import Client
+from serverapp.metrics import metrics
+from serverapp.lastseen import last_seen
+from serverapp.directory import directory
+from serverapp.messagestore import message_store
 from protocol.packets.base import PacketBase
 from protocol.packets.request.base import Request
-from protocol.packets.response.responses import ALL_RESPONSES
+from protocol.packets.request.requests import RegisterRequest, \
+    ListClientsRequest, PublicKeyRequest, PopMessagesRequest, \
+    PopMessagesPageRequest, VersionRequest
+from protocol.packets.request.messages import PushMessageRequest
+from protocol.packets.response.responses import PopMessagesResponse, \
+    PopMessagesPageResponse
 
 
 class ServerHandler(HandlerBase, socketserver.BaseRequestHandler):
+    """Serves the requests of a single connection.
 
-    Clients = NewType('Clients', Tuple[Union[int, str], ...])
-    Messages = NewType('Messages', Tuple[str, ...])
+    Class Attributes:
+      REQUEST_METHODS: Names of the methods handling each request type. A
+        request type without an entry is handled by the method of its nearest
+        parent, e.g. all the message types by _push_message. Methods return
+        the response fields, or the response packed already. They are
+        resolved for all request types once each handler class is defined.
+      IDLE_POLL_INTERVAL: Seconds between the checks whether other
+        connections wait for the worker, while waiting for the next request.
+
+    Records into serverapp.metrics:
+      timeouts_idle, timeouts_header, timeouts_body, timeouts_request: Count
+        of connections closed after waiting too long for a request, or for
+        the rest of its header or payload (see MESSAGEU_*_TIMEOUT settings).
+      connections_released: Count of connections closed after a request, or
+        while idle, as other connections waited for their worker.
+      request: Time requests took from being received to being responded to.
+    """
+
+    REQUEST_METHODS: Dict[Type[Request], str] = {
+        RegisterRequest: '_register',
+        ListClientsRequest: '_list_clients',
+        PublicKeyRequest: '_public_key',
+        PushMessageRequest: '_push_message',
+        PopMessagesRequest: '_pop_messages',
+        PopMessagesPageRequest: '_pop_messages_page',
+        VersionRequest: '_version',
+    }
+
+    # requests which sender is not a registered client
+    ANONYMOUS_REQUESTS = (RegisterRequest, VersionRequest)
+
+    IDLE_POLL_INTERVAL = 0.1
+
+    # methods of this handler class resolved per request type, read-only so
+    #  shared by all threads - see __init_subclass__
+    _methods: Mapping[Type[Request], Callable] = MappingProxyType({})
 
     logger = logging.getLogger(__name__)
 
+    def __init_subclass__(cls, **kwargs):
+        super(ServerHandler, cls).__init_subclass__(**kwargs)
+        # e.g. AsyncServerHandler, which overrides methods
+        cls._methods = cls._resolve_methods()
+
     def _register(self, fields: FieldsValues) -> Dict[str, int]:
         clients_count = Client.objects.count()
         if clients_count > 2 ** 128 - 1:
@@ -37,123 +92,368 @@ class ServerHandler(HandlerBase, socketserver.BaseRequestHandler):
                 f"Failed to create Client: {e!r}"
             )
         else:
+            directory.add(client.id, client.name, client.public_key)
             return {'new_client_id': client.id}
 
-    def _list_clients(
-            self, fields: FieldsValues,
-    ) -> Dict[str, Union[int, Clients]]:
-        clients = Client.objects.all()
+    def _list_clients(self, fields: FieldsValues) -> bytes:
         # we won't exclude the sender client, that's because the local me.info
         #  file might be compromised - it's better to get a clear image.
-        clients_list = []
-        for client in clients:
-            clients_list.append(client.id)
-            clients_list.append(client.name)
-        return {'clients': tuple(clients_list), 'clients_count': len(clients)}
-
-    def _public_key(self, fields: FieldsValues) -> Dict[str, str]:
-        receiver_client_id = fields['requested_client_id']
-        try:
-            client = Client.objects.get(id=receiver_client_id)
-        except ObjectDoesNotExist:
-            raise ValueError(f"No client with the ID {receiver_client_id}.")
-        else:
-            return {
-                'requested_client_id': client.id,
-                'public_key': client.public_key,
-            }
+        return directory.list_clients_response(fields['version'])
+
+    def _public_key(self, fields: FieldsValues) -> bytes:
+        requested_client_id = fields['requested_client_id']
+        response = directory.public_key_response(
+            requested_client_id, fields['version'])
+        if response is None:
+            raise ValueError(f"No client with the ID {requested_client_id}.")
+        return response
 
     def _pop_messages(
             self, fields: FieldsValues,
-    ) -> Dict[str, Union[int, Messages]]:
-        from serverapp.models import Message
+    ) -> Dict[str, Union[int, Iterator[Tuple]]]:
+        """Returns the waiting messages as rows to stream, and their packed
+          size. They are deleted after the last row is sent."""
+        sender_client_id = fields['sender_client_id']
+        store = message_store()
+        # later messages are left for the next pop
+        messages_sizes = list(store.messages_sizes(sender_client_id))
+        row_length = PopMessagesResponse.payload_fields[0].compound_length
+        messages_size = sum(
+            row_length + content_size for _, content_size in messages_sizes)
 
+        return {
+            'messages': store.pop(sender_client_id, messages_sizes),
+            'messages_size': messages_size,
+        }
+
+    def _pop_messages_page(
+            self, fields: FieldsValues,
+    ) -> Dict[str, Union[int, Iterator[Tuple]]]:
+        """Returns the first waiting messages within the requested budget as
+          rows to stream, their packed size and whether more messages wait.
+        Only the returned messages are deleted, after the last row is sent."""
+        max_messages = fields['max_messages']
+        max_messages_size = fields['max_messages_size']
         sender_client_id = fields['sender_client_id']
-        messages = Message.objects.filter(to_client__id=sender_client_id)
-
-        messages_tuples = []
-        for message in messages:
-            messages_tuples.extend([
-                message.from_client.id,
-                message.id,
-                message.message_type,
-                len(message.content),
-                message.content,
-            ])
-        messages.delete()
+        store = message_store()
+
+        # one more message tells whether more are waiting
+        sizes = store.messages_sizes(
+            sender_client_id, max_messages + 1 if max_messages else None)
+        row_length = PopMessagesPageResponse.payload_fields[-1].compound_length
+
+        messages_sizes = []
+        messages_size = 0
+        has_more_messages = False
+        for message_id, content_size in sizes:
+            row_size = row_length + content_size
+            # the first message is popped even if it exceeds the size budget
+            if len(messages_sizes) == max_messages != 0 or (
+                    messages_sizes and max_messages_size
+                    and messages_size + row_size > max_messages_size):
+                has_more_messages = True
+                break
+            messages_sizes.append((message_id, content_size))
+            messages_size += row_size
 
         return {
-            'messages': tuple(messages_tuples),
-            'messages_count': len(messages_tuples) // 5,
+            'has_more_messages': int(has_more_messages),
+            'messages': store.pop(sender_client_id, messages_sizes),
+            'messages_size': messages_size,
         }
 
+    def _version(self, fields: FieldsValues) -> Dict[str, int]:
+        return {'max_version': max(PacketBase.VERSIONS)}
+
     def _push_message(self, fields: FieldsValues):
         sender_client_id = fields['sender_client_id']
         receiver_client_id = fields['receiver_client_id']
-        try:
-            sender_client = Client.objects.get(id=sender_client_id)
-            receiver_client = Client.objects.get(id=receiver_client_id)
-        except Exception as e:
+        if directory.get(sender_client_id) is None \
+                or directory.get(receiver_client_id) is None:
             raise exceptions.MessageValidationError(
                 f"Invalid IDs ({sender_client_id}, {receiver_client_id}): "
-                f"{e!r}."
+                f"no such client."
             )
         content = fields.get('content', b'')
-        message_type = fields['message_type']
-
-        try:
-            message = Message.objects.create(
-                message_type=message_type,
-                from_client=sender_client,
-                to_client=receiver_client,
-                content=content,
-            )
-        except ValidationError as e:
-            raise exceptions.MessageValidationError(e)
+        push_args = (sender_client_id, receiver_client_id,
+                     fields['message_type'], content, fields['content_size'])
+        if hasattr(content, 'read'):
+            # spooled content
+            with content:
+                message_id = message_store().push(*push_args)
+        else:
+            message_id = message_store().push(*push_args)
 
         return {'receiver_client_id': receiver_client_id,
-                'message_id': message.id}
-
-    def _request_type_to_method_and_response_type(
-            self, request_type: PacketBase,
-    ) -> Tuple[Callable, Type[Request]]:
-        request_name = request_type.__class__.__name__[:-7]  # omit 'Request'
-        response_name = request_name + 'Response'
-        method_name = '_' + camel_case_to_snake_case(request_name)
-        response_type = next(dropwhile(
-            lambda response_t: response_t.__name__ != response_name,
-            ALL_RESPONSES,
-        ))
-        return getattr(self, method_name), response_type
+                'message_id': message_id}
 
-    def handle(self) -> None:
-        from django.utils import timezone
-        from protocol.packets.request.requests import RegisterRequest
+    @classmethod
+    def _resolve_method(
+            cls, request_type: Type[Request],
+    ) -> Optional[Callable[['ServerHandler', FieldsValues], FieldsValues]]:
+        """Returns the method registered for the request type in
+          REQUEST_METHODS, or for its nearest parent (e.g. all message types
+          are pushed alike) - or None if there is none."""
+        for base in request_type.__mro__:
+            method_name = cls.REQUEST_METHODS.get(base)
+            if method_name is not None:
+                return getattr(cls, method_name)
+        return None
+
+    @classmethod
+    def _resolve_methods(
+            cls,
+    ) -> Mapping[Type[Request], Callable[
+            ['ServerHandler', FieldsValues], FieldsValues]]:
+        """Returns the methods handling all the request types defined so far.
+        """
+        methods = {}
+        request_types = [Request]
+        while request_types:
+            request_type = request_types.pop()
+            request_types.extend(request_type.__subclasses__())
+            method = cls._resolve_method(request_type)
+            if method is not None:
+                methods[request_type] = method
+        return MappingProxyType(methods)
+
+    @classmethod
+    def _request_type_to_method(
+            cls, request_type: Type[Request],
+    ) -> Callable[['ServerHandler', FieldsValues], FieldsValues]:
+        """Returns the method handling the request type (see
+          REQUEST_METHODS).
+        If there is none, raises a PacketBaseValueError."""
+        method = cls._methods.get(request_type)
+        if method is None:
+            # e.g. defined after the handler class
+            method = cls._resolve_method(request_type)
+        if method is None:
+            raise exceptions.PacketBaseValueError(
+                request_type.__name__, "No method handles the request.")
+        return method
+
+    def _respond(
+            self, request_type: PacketBase, fields: FieldsValues,
+    ) -> Iterable[bytes]:
+        """Calls the method handling the request, and returns the response
+          packed in the version of the request: a tuple of its buffers, or an
+          iterator of its chunks when it is streamed (see
+          Packer.pack_stream).
+
+        Performs blocking Django ORM calls, so does iterating the chunks."""
+        # determine action and response
+        method = self._request_type_to_method(type(request_type))
+        # call corresponding method
+        response_kwargs = method(self, fields)
+        # update last seen after valid request, written in the background
+        if not isinstance(request_type, self.ANONYMOUS_REQUESTS):
+            last_seen.touch(fields['sender_client_id'])
+        if isinstance(response_kwargs, bytes):
+            # packed already, e.g. cached by the client directory
+            return [response_kwargs],
+        self.logger.debug(f'result: {response_kwargs}')
+        # pack a response
+        return Packer(request_type.RESPONSE(), fields['version']).pack_stream(
+            **response_kwargs)
+
+    def _error_response(self, version: Optional[int] = None) -> bytes:
+        """Returns an ErrorResponse in the version of the request, or in the
+          default version if unknown (e.g. the request could not be parsed).
+        """
         from protocol.packets.response.responses import ErrorResponse
 
+        return Packer(ErrorResponse(), version).pack()
+
+    def _should_spool(self, header_fields: FieldsValues) -> bool:
+        """Returns whether the request payload should be spooled to a file.
+        If it is larger than allowed, raises a PayloadTooLargeError - before
+          any of it is read."""
+        payload_size = header_fields['payload_size']
+        if payload_size > settings.MESSAGEU_MAX_PAYLOAD_SIZE:
+            raise exceptions.PayloadTooLargeError(
+                f"Payload size {payload_size} exceeds the maximum "
+                f"{settings.MESSAGEU_MAX_PAYLOAD_SIZE}.")
+        return payload_size > settings.MESSAGEU_SPOOL_THRESHOLD
+
+    def _spooled_request_type(
+            self, header_fields: FieldsValues,
+    ) -> Tuple[Request, int]:
+        """Returns the request to spool, and the length of the fixed payload
+          fields preceding its content. Only message requests, which payload
+          ends with their content, are spooled."""
+        request_type = \
+            self.get_packet_type_by_code(header_fields['code'], Request)()
+        if not isinstance(request_type, PushMessageRequest):
+            raise exceptions.UnpackerValueError(
+                request_type, f"Unexpected payload size "
+                              f"{header_fields['payload_size']}.")
+        schema = request_type.schema_of_version(header_fields['version'])
+        return request_type, schema.payload_codec.size
+
+    def _unpack_spooled_payload(
+            self, request_type: Request, header_fields: FieldsValues,
+            fixed_payload: Union[bytes, memoryview], content: BinaryIO,
+    ) -> Tuple[Request, FieldsValues]:
+        """Unpacks the fixed payload fields of a spooled request, and sets its
+          content to the file it was received into."""
+        codec = request_type.schema_of_version(
+            header_fields['version']).payload_codec
+        values, content_offset = codec.unpack_from(memoryview(fixed_payload))
+        header_fields.update(zip(codec.names, values))
+        content_size = header_fields['payload_size'] - content_offset
+        if header_fields['content_size'] != content_size:
+            raise exceptions.UnpackerValueError(
+                request_type, f"Content size {header_fields['content_size']} "
+                              f"does not match the payload ({content_size}).")
+        content.seek(0)
+        header_fields['content'] = content
+        return request_type, header_fields
+
+    def _payload_deadline(self, payload_size: int, started: float) -> Deadline:
+        """Returns the deadline for receiving a payload: the body timeout
+          plus its time at the minimal rate, bounded by the request timeout
+          since the request `started`."""
+        body_seconds = settings.MESSAGEU_BODY_TIMEOUT \
+            + payload_size / settings.MESSAGEU_MIN_BODY_RATE
+        request_seconds = \
+            started + settings.MESSAGEU_REQUEST_TIMEOUT - time.monotonic()
+        if body_seconds <= request_seconds:
+            return Deadline('body', body_seconds)
+        return Deadline('request', request_seconds)
+
+    def _expect_request(self) -> Tuple[Request, FieldsValues]:
+        """Reads a whole request from the connection.
+
+        The header and the payload must each be received by their deadlines,
+          so a client sending slowly (or less than it declared) releases the
+          worker serving it.
+        Large message contents are received into a SpooledTemporaryFile, in
+          chunks, so the memory held by a connection is bounded."""
+        header_deadline = \
+            Deadline('header', settings.MESSAGEU_HEADER_TIMEOUT, start=False)
+        header = self.frames.read_exactly(
+            Request.HEADER_LENGTH, header_deadline)
+        unpacker, header_fields = self._unpack_header(header, Request())
+        deadline = self._payload_deadline(
+            header_fields['payload_size'], header_deadline.started)
+        if not self._should_spool(header_fields):
+            payload = self._read_payload(
+                self.frames, header_fields['payload_size'], deadline)
+            return self._unpack_payload(unpacker, header_fields, payload)
+
+        request_type, fixed_size = self._spooled_request_type(header_fields)
+        fixed_payload = self._read_payload(self.frames, fixed_size, deadline)
+        content = tempfile.SpooledTemporaryFile(
+            max_size=settings.MESSAGEU_SPOOL_THRESHOLD)
+        try:
+            # the fixed payload view is only valid until the next read
+            fixed_payload = bytes(fixed_payload)
+            self.frames.copy_to_file(
+                content, header_fields['payload_size'] - fixed_size, deadline)
+            return self._unpack_spooled_payload(
+                request_type, header_fields, fixed_payload, content)
+        except BaseException:
+            content.close()
+            raise
+
+    def _timed_out(self, deadline_name: str) -> None:
+        metrics.increment(f'timeouts_{deadline_name}')
+        self.logger.debug(f"Closing connection with {self.client_address[0]}: "
+                          f"{deadline_name} timeout.")
+
+    def setup(self) -> None:
+        self.request.settimeout(settings.MESSAGEU_IDLE_TIMEOUT)
+        self.frames = FrameReader(self.request)
+
+    def _wait_for_request(self, release: bool) -> bool:
+        """Waits for the client to start sending its next request, in slices
+          of IDLE_POLL_INTERVAL - so when `release`, an idle client does not
+          hold its worker while other connections wait for one.
+
+        Returns whether a request is arriving: False once the connection was
+          idle for MESSAGEU_IDLE_TIMEOUT, or - when `release` - as soon as
+          other connections wait (the client reconnects upon its next
+          request)."""
+        started = time.monotonic()
+        while True:
+            readable, _, _ = select.select(
+                [self.request], [], [], ServerHandler.IDLE_POLL_INTERVAL)
+            if readable:
+                return True
+            if release and getattr(self.server, 'busy', False):
+                metrics.increment('connections_released')
+                return False
+            if time.monotonic() - started > settings.MESSAGEU_IDLE_TIMEOUT:
+                self._timed_out('idle')
+                return False
+
+    def _handle_request(self) -> bool:
+        """Expects a single request and responds to it.
+
+        Returns whether the connection can serve another request: the client
+          might have closed it, stayed idle for too long, or sent a packet
+          that could not be parsed - and then the next packet boundary is
+          unknown."""
         try:
             # expect a request
-            request_type, fields = self._expect_packet(self.request, Request())
-            self.logger.debug(f"{request_type.__class__.__name__}: {fields}")
-            # determine action and response
-            method, response_type = \
-                self._request_type_to_method_and_response_type(request_type)
-            # call corresponding method
-            response_kwargs = method(fields)
-            self.logger.debug(f'result: {response_kwargs}')
-            # update last seen after valid request
-            if request_type.__class__.__name__ != 'RegisterRequest':
-                Client.objects.filter(
-                    pk=fields['sender_client_id'],
-                ).update(last_seen=timezone.now())
-            # pack and send a response
-            response_bytes = Packer(response_type()).pack(**response_kwargs)
-            self.request.send(response_bytes)
-            # log about success
-            client_address = self.client_address[0]
-            self.logger.debug(f"Responded to {client_address} successfully.")
+            request_type, fields = self._expect_request()
+        except exceptions.DeadlineExceededError as e:
+            self._timed_out(e.deadline_name)
+            return False
+        except socket.timeout:
+            self._timed_out('idle')
+            return False
+        except (exceptions.ConnectionClosedError,
+                exceptions.IncompleteFrameError):
+            return False
         except Exception as e:
             self.logger.exception(e)
             # pack and send an error response
-            error_bytes = Packer(ErrorResponse()).pack()
-            self.request.send(error_bytes)
+            self.request.sendall(self._error_response())
+            return False
+
+        self.logger.debug(f"{request_type.__class__.__name__}: {fields}")
+        received = time.monotonic()
+        try:
+            response_chunks = self._respond(request_type, fields)
+        except Exception as e:
+            self.logger.exception(e)
+            # pack and send an error response
+            self.request.sendall(self._error_response(fields['version']))
+            return True
+
+        try:
+            for chunk in response_chunks:
+                send_buffers(self.request, chunk)
+        except ConnectionError:
+            raise
+        except Exception as e:
+            # part of the response might have been sent already
+            self.logger.exception(e)
+            return False
+        metrics.observe('request', time.monotonic() - received)
+        # log about success
+        client_address = self.client_address[0]
+        self.logger.debug(f"Responded to {client_address} successfully.")
+        return True
+
+    def handle(self) -> None:
+        """Serves requests until the client closes the connection, or until
+          other connections wait for the worker serving this one."""
+        # a new connection is not released before its first request
+        served = False
+        try:
+            while self._wait_for_request(release=served) \
+                    and self._handle_request():
+                served = True
+                # the client reconnects upon its next request
+                if getattr(self.server, 'busy', False):
+                    metrics.increment('connections_released')
+                    break
+        except ConnectionError as e:
+            self.logger.debug(f"Connection with {self.client_address[0]} "
+                              f"lost: {e!r}")
+
+
+ServerHandler._methods = ServerHandler._resolve_methods()
@@ -0,0 +1,102 @@
+import time
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+
+from django.utils import timezone
+
+from serverapp.metrics import metrics
+
+
+class LastSeenTracker:
+    """Collects the times clients were last seen in memory, and writes them
+      to the database in the background - so a request never waits for a
+      write, or for the database lock, to update them.
+
+    The times are flushed every `interval` seconds in a single batched
+      transaction, and once more when the tracker is stopped. Client.last_seen
+      is therefore up to `interval` seconds stale.
+
+    The server records into the module-level `last_seen` instance.
+
+    Records into serverapp.metrics:
+      last_seen_flush: Time flushes took.
+      last_seen_flush_errors: Count of failed flushes. Their times are
+        written by the next flush.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: Dict[int, datetime] = {}
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def touch(self, client_id: int) -> None:
+        """Records that the client was seen now."""
+        seen = timezone.now()
+        with self._lock:
+            self._pending[client_id] = seen
+
+    def _write(self, pending: Dict[int, datetime]) -> None:
+        from serverapp.models import Client
+
+        # a single transaction of batched UPDATE statements
+        Client.objects.bulk_update(
+            [Client(id=client_id, last_seen=seen)
+             for client_id, seen in pending.items()],
+            ['last_seen'])
+
+    def flush(self) -> None:
+        """Writes the times recorded since the last flush."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        started = time.monotonic()
+        try:
+            self._write(pending)
+        except Exception as e:
+            metrics.increment('last_seen_flush_errors')
+            self.logger.warning(
+                f"Failed writing the last seen times of {len(pending)} "
+                f"clients: {e!r}")
+            with self._lock:
+                # times recorded meanwhile are newer
+                for client_id, seen in pending.items():
+                    self._pending.setdefault(client_id, seen)
+            return
+        metrics.observe('last_seen_flush', time.monotonic() - started)
+
+    def _run(self, interval: float) -> None:
+        from django.db import connection
+
+        try:
+            while not self._stopped.wait(interval):
+                self.flush()
+        finally:
+            connection.close()
+
+    def start(self, interval: float) -> None:
+        """Starts flushing every `interval` seconds in a background thread,
+          unless already started."""
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(interval, ),
+            name='MessageU last seen', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops flushing in the background, and flushes the times left."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+
+last_seen = LastSeenTracker()
@@ -1,11 +1,16 @@
 import os
 import sys
 import enum
+import stat
+import signal
+import socket
 import django
 import pathlib
 import logging
+import threading
 import socketserver
 from io import StringIO
+from typing import Optional
 
 from django.core.management import call_command
 from django.core.management.base import CommandError
@@ -18,6 +23,7 @@ django.setup()
 
 from common.exceptions import ServerAppException
 from serverapp.handler import ServerHandler
+from serverapp.blobstore import blobs
 
 
 class ServerApp:
@@ -79,20 +85,137 @@ class ServerApp:
                 f"Invalid port format: {content}. Should be an integer.")
         return port
 
-    def __init__(self):
+    ENGINES = ('threading', 'asyncio')
+
+    def __init__(
+            self, engine: str = 'threading', processes: int = 1,
+            unix_path: Optional[str] = None,
+    ):
+        from django.conf import settings
+
+        if engine not in ServerApp.ENGINES:
+            raise ServerAppException(
+                f"Invalid engine {engine!r}, expected one of "
+                f"{ServerApp.ENGINES}.")
+        if processes < 1:
+            raise ServerAppException(
+                f"Invalid processes count {processes}, expected at least 1.")
+        if processes > 1 and settings.MESSAGEU_MESSAGE_STORE == 'memory':
+            raise ServerAppException(
+                "The memory message store serves a single process.")
+        self.engine = engine
+        self.processes = processes
+        self.unix_path = unix_path
+        self._unix_socket: Optional[socket.socket] = None
         self._init_db()
         self._create_superuser()
         self._start_django_server()
         self.host = '127.0.0.1'  # TODO: socket.gethostname()?
         self.port = self._read_port()
 
-    def run(self):
-        self.logger.debug(f"Listening on {self.host}:{self.port}")
-        with socketserver.ThreadingTCPServer(
-                (self.host, self.port), ServerHandler) as server:
-            server.serve_forever()
-
+    def _listen_unix(self) -> socket.socket:
+        """Binds the Unix domain socket, replacing a stale one left by a
+          previous run. It is bound once, before forking server processes,
+          which then all accept on it."""
+        if os.path.exists(self.unix_path) \
+                and stat.S_ISSOCK(os.stat(self.unix_path).st_mode):
+            os.unlink(self.unix_path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.bind(self.unix_path)
+            sock.listen(socketserver.TCPServer.request_queue_size)
+        except BaseException:
+            sock.close()
+            raise
+        return sock
+
+    def _run_threading(self) -> None:
+        from django.conf import settings
+        from serverapp.poolserver import PooledTCPServer, PooledUnixListener
+
+        with PooledTCPServer(
+                (self.host, self.port), ServerHandler,
+                workers=settings.MESSAGEU_WORKERS,
+                queue_size=settings.MESSAGEU_ACCEPT_QUEUE_SIZE,
+                reuse_port=self.processes > 1,
+        ) as server:
+            if self._unix_socket is None:
+                server.serve_forever()
+                return
+            listener = PooledUnixListener(self._unix_socket, server)
+            threading.Thread(
+                target=listener.serve_forever,
+                name='MessageU Unix listener', daemon=True,
+            ).start()
+            try:
+                server.serve_forever()
+            finally:
+                # stop queueing connections before the workers exit
+                listener.shutdown()
+
+    def _run_asyncio(self) -> None:
+        from django.conf import settings
+        from serverapp.asyncserver import AsyncServer
+
+        server = AsyncServer(
+            (self.host, self.port),
+            executor_workers=settings.MESSAGEU_EXECUTOR_WORKERS,
+            reuse_port=self.processes > 1,
+            unix_socket=self._unix_socket,
+        )
+        server.serve_forever()
+
+    def _serve(self) -> None:
+        """Serves in the current process, e.g. a forked worker."""
+        from django.conf import settings
+        from serverapp.directory import directory
+        from serverapp.lastseen import last_seen
+        from serverapp.messagestore import message_store
+        from serverapp.metrics import metrics
+
+        # a terminated server unwinds, so the last seen times are written
+        signal.signal(signal.SIGTERM, _exit)
+        directory.load()
+        directory.start(settings.MESSAGEU_DIRECTORY_REFRESH)
+        store = message_store()
+        last_seen.start(settings.MESSAGEU_LAST_SEEN_INTERVAL)
+        metrics.start(settings.MESSAGEU_METRICS_INTERVAL)
+        try:
+            getattr(self, f'_run_{self.engine}')()
+        finally:
+            directory.stop()
+            last_seen.stop()
+            store.close()
+            metrics.stop()
 
-def run():
-    server = ServerApp()
+    def run(self):
+        self.logger.debug(
+            f"Listening on {self.host}:{self.port} ({self.engine} engine, "
+            f"{self.processes} processes)")
+        if self.unix_path is not None:
+            self._unix_socket = self._listen_unix()
+            self.logger.debug(f"Listening on unix:{self.unix_path}")
+        # once, before forking server processes
+        blobs.collect_garbage()
+        try:
+            if self.processes == 1:
+                self._serve()
+            else:
+                from serverapp.prefork import PreforkSupervisor
+                PreforkSupervisor(self._serve, self.processes).serve_forever()
+        finally:
+            if self._unix_socket is not None:
+                self._unix_socket.close()
+                os.unlink(self.unix_path)
+
+
+def _exit(signum: int, frame) -> None:
+    sys.exit(0)
+
+
+def run(
+        engine: str = 'threading', processes: int = 1,
+        unix_path: Optional[str] = None,
+):
+    server = ServerApp(engine=engine, processes=processes, unix_path=unix_path)
     server.run()
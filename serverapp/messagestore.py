@@ -0,0 +1,432 @@
+import os
+import abc
+import struct
+import logging
+import itertools
+import threading
+from collections import deque
+from typing import Dict, Deque, Tuple, List, Iterator, Iterable, \
+    Optional, Sequence, Union, BinaryIO
+
+from common import exceptions
+from common.framing import FileRegion
+from serverapp.blobstore import blobs
+from serverapp.groupcommit import GroupCommitter
+
+# a message row, as packed into PopMessagesResponse: the sender ID, message ID,
+#  message type, content size and content
+MessageRow = Tuple[int, int, int, int, Union[bytes, FileRegion]]
+
+
+class MessageStore(metaclass=abc.ABCMeta):
+    """The waiting messages of the clients, pushed and popped by
+      serverapp.handler.ServerHandler.
+
+    The server uses the store chosen by MESSAGEU_MESSAGE_STORE (see
+      message_store).
+    """
+
+    @abc.abstractmethod
+    def push(
+            self, from_client_id: int, to_client_id: int, message_type: int,
+            content: Union[bytes, BinaryIO], content_size: int,
+    ) -> int:
+        """Stores a message, given its content as bytes or as a file (e.g.
+          spooled). Returns the message ID."""
+
+    @abc.abstractmethod
+    def messages_sizes(
+            self, client_id: int, limit: Optional[int] = None,
+    ) -> Iterable[Tuple[int, int]]:
+        """Returns the IDs and content sizes of the first `limit` (or all)
+          waiting messages of the client, in order."""
+
+    @abc.abstractmethod
+    def pop(
+            self, client_id: int, messages_sizes: List[Tuple[int, int]],
+    ) -> Iterator[MessageRow]:
+        """Yields the waiting messages of the given IDs and content sizes as
+          rows, and deletes exactly them after the last row was yielded -
+          messages pushed meanwhile are left for the next pop."""
+
+    def close(self) -> None:
+        """Called once the server stops."""
+
+
+class DjangoMessageStore(MessageStore):
+    """Stores the messages in the database, as serverapp.models.Message rows.
+    Contents larger than MESSAGEU_BLOB_THRESHOLD are kept in
+      serverapp.blobstore.
+
+    Class Attributes:
+      POP_BATCH_SIZE: Bytes of message contents fetched at once when popping
+        messages - a page within the clients' budget is fetched by a single
+        query.
+    """
+
+    POP_BATCH_SIZE = 2 ** 20
+
+    def __init__(
+            self, commit_interval: float = 0, commit_batch_size: int = 1,
+            commit_timeout: float = 30,
+    ):
+        """Pushes are inserted by a serverapp.groupcommit.GroupCommitter
+          unless `commit_batch_size` is 1, in which case each push is
+          inserted in a transaction of its own."""
+        self._committer: Optional[GroupCommitter] = None
+        if commit_batch_size > 1:
+            self._committer = GroupCommitter(
+                self._insert, commit_interval, commit_batch_size,
+                commit_timeout)
+            self._committer.start()
+
+    @staticmethod
+    def _insert(rows: Sequence[Tuple]) -> List[int]:
+        """Inserts the messages of the rows (see push) in a single
+          transaction. Returns their IDs."""
+        from django.db import connection, transaction
+        from serverapp.models import Message
+
+        with transaction.atomic():
+            messages = Message.objects.bulk_create([
+                Message(
+                    from_client_id=from_client_id,
+                    to_client_id=to_client_id,
+                    message_type=message_type,
+                    content=b'' if blob else content,
+                    blob=blob,
+                    content_size=content_size,
+                )
+                for from_client_id, to_client_id, message_type, content,
+                blob, content_size in rows
+            ])
+            if connection.features.can_return_rows_from_bulk_insert:
+                message_ids = [message.id for message in messages]
+            elif connection.vendor == 'sqlite':
+                # the transaction holds the write lock, so the AUTOINCREMENT
+                #  IDs of the rows are consecutive
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT last_insert_rowid()')
+                    last_id, = cursor.fetchone()
+                message_ids = list(range(last_id - len(rows) + 1, last_id + 1))
+            else:
+                raise exceptions.ServerAppException(
+                    f"Cannot read back the IDs of inserted messages from "
+                    f"{connection.vendor}.")
+            for _, _, _, content, blob, _ in rows:
+                if blob:
+                    blobs.ensure(blob, content)
+        return message_ids
+
+    def push(
+            self, from_client_id: int, to_client_id: int, message_type: int,
+            content: Union[bytes, BinaryIO], content_size: int,
+    ) -> int:
+        """Content kept as a blob is copied to it, without reading spooled
+          content into memory."""
+        from django.conf import settings
+        from django.core.exceptions import ValidationError
+
+        blob = ''
+        if content_size > settings.MESSAGEU_BLOB_THRESHOLD:
+            blob = blobs.put(content)
+        elif hasattr(content, 'read'):
+            content = content.read()
+
+        row = (from_client_id, to_client_id, message_type, content, blob,
+               content_size)
+        try:
+            if self._committer is not None:
+                return self._committer.push(row)
+            return self._insert([row])[0]
+        except ValidationError as e:
+            raise exceptions.MessageValidationError(e)
+
+    def messages_sizes(
+            self, client_id: int, limit: Optional[int] = None,
+    ) -> Iterable[Tuple[int, int]]:
+        from serverapp.models import Message
+
+        sizes = Message.objects.filter(to_client_id=client_id).order_by(
+            'id').values_list('id', 'content_size')
+        if limit is not None:
+            sizes = sizes[:limit]
+        return sizes.iterator()
+
+    @staticmethod
+    def _batch_messages(
+            messages_sizes: List[Tuple[int, int]], max_count: int,
+    ) -> Iterator[List[int]]:
+        """Yields the message IDs in batches of up to `max_count` IDs and
+          POP_BATCH_SIZE bytes of contents (or a single larger message)."""
+        batch_ids = []
+        batch_size = 0
+        for message_id, content_size in messages_sizes:
+            if batch_ids and (
+                    len(batch_ids) == max_count
+                    or batch_size + content_size
+                    > DjangoMessageStore.POP_BATCH_SIZE):
+                yield batch_ids
+                batch_ids = []
+                batch_size = 0
+            batch_ids.append(message_id)
+            batch_size += content_size
+        if batch_ids:
+            yield batch_ids
+
+    def pop(
+            self, client_id: int, messages_sizes: List[Tuple[int, int]],
+    ) -> Iterator[MessageRow]:
+        """The messages are deleted at once, with their blobs unless
+          referenced by other messages.
+
+        Each batch of rows is fetched by a single values_list query, and no
+          database cursor is held open while rows are sent (the asyncio
+          engine iterates the rows on several threads). Contents kept as blobs
+          are yielded as FileRegions, so they are sent from their file by the
+          kernel - the file is closed once its row was sent."""
+        from django.db import connection, transaction
+        from serverapp.models import Message
+
+        if not messages_sizes:
+            return
+        message_ids = [message_id for message_id, _ in messages_sizes]
+        # within SQLite's parameters limit
+        batch_count = connection.ops.bulk_batch_size(['id'], message_ids)
+
+        messages = Message.objects.filter(to_client_id=client_id)
+        released_blobs = set()
+        for batch_ids in self._batch_messages(messages_sizes, batch_count):
+            rows = messages.filter(id__in=batch_ids).order_by('id')
+            rows = rows.values_list(
+                'from_client_id', 'id', 'message_type', 'content_size',
+                'content', 'blob')
+            for from_client_id, message_id, message_type, content_size, \
+                    content, blob in rows:
+                if not blob:
+                    yield from_client_id, message_id, message_type, \
+                        content_size, content
+                    continue
+                released_blobs.add(blob)
+                with blobs.open(blob) as file:
+                    yield from_client_id, message_id, message_type, \
+                        content_size, FileRegion(file, 0, content_size)
+
+        with transaction.atomic():
+            for idx in range(0, len(message_ids), batch_count):
+                Message.objects.filter(
+                    id__in=message_ids[idx:idx + batch_count]).delete()
+            blobs.release(released_blobs)
+
+    def close(self) -> None:
+        """Inserts the pending pushes."""
+        if self._committer is not None:
+            self._committer.stop()
+
+
+class MemoryMessageStore(MessageStore):
+    """Stores the messages in memory, in a deque per recipient - so pushing
+      and popping never wait for the database. Serves a single server
+      process only.
+
+    When given a `log_path`, the pushed and popped messages are appended to
+      that log, and the log is replayed upon creating the store - so the
+      messages survive a crash or restart of the server (though not of the
+      host, as the log is not synced). The replayed log is compacted to the
+      messages left.
+
+    Class Attributes:
+      PUSH_RECORD, POP_RECORD: Formats of the log records of a push (followed
+        by the message content) and of a pop (followed by the popped IDs).
+    """
+
+    PUSH_RECORD = struct.Struct('<BQQQBI')
+    POP_RECORD = struct.Struct('<BQI')
+    _PUSH, _POP = 1, 2
+    _ID = struct.Struct('<Q')
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, log_path: Optional[str] = None):
+        self._lock = threading.Lock()
+        # (message ID, sender ID, message type, content) by recipient ID
+        self._mailboxes: Dict[int, Deque[Tuple[int, int, int, bytes]]] = {}
+        self._last_id = 0
+        self._log: Optional[BinaryIO] = None
+        if log_path is not None:
+            self._replay(log_path)
+            self._log = self._compact(log_path)
+
+    def _read_record(self, log: BinaryIO) -> bool:
+        """Applies the next record of the log. Returns False at the end of
+          the log, or at a record cut short by a crash while writing it."""
+        header = log.read(self.POP_RECORD.size)
+        if len(header) < self.POP_RECORD.size:
+            return False
+        if header[0] == self._PUSH:
+            header += log.read(self.PUSH_RECORD.size - len(header))
+            if len(header) < self.PUSH_RECORD.size:
+                return False
+            _, message_id, from_client_id, to_client_id, message_type, \
+                content_size = self.PUSH_RECORD.unpack(header)
+            content = log.read(content_size)
+            if len(content) < content_size:
+                return False
+            self._append(
+                message_id, from_client_id, to_client_id, message_type,
+                content)
+            self._last_id = max(self._last_id, message_id)
+        elif header[0] == self._POP:
+            _, to_client_id, count = self.POP_RECORD.unpack(header)
+            ids = log.read(count * self._ID.size)
+            if len(ids) < count * self._ID.size:
+                return False
+            self._remove(to_client_id, {
+                message_id for message_id, in self._ID.iter_unpack(ids)})
+        else:
+            raise ValueError(f"Invalid record kind {header[0]} in the "
+                             f"messages log at offset {log.tell()}.")
+        return True
+
+    def _replay(self, log_path: str) -> None:
+        if not os.path.exists(log_path):
+            return
+        with open(log_path, 'rb') as log:
+            records_end = 0
+            while self._read_record(log):
+                records_end = log.tell()
+            if records_end < os.fstat(log.fileno()).st_size:
+                # dropped by compacting the log
+                self.logger.warning(
+                    f"A record is cut short at offset {records_end} of the "
+                    f"messages log {log_path}.")
+        self.logger.debug(
+            f"Replayed {sum(map(len, self._mailboxes.values()))} messages "
+            f"from {log_path}.")
+
+    def _compact(self, log_path: str) -> BinaryIO:
+        """Rewrites the log with the messages left, and opens it for
+          appending."""
+        compacted_path = log_path + '.compact'
+        with open(compacted_path, 'wb') as log:
+            for to_client_id, mailbox in self._mailboxes.items():
+                for message in mailbox:
+                    self._write_push(log, to_client_id, *message)
+            log.flush()
+            os.fsync(log.fileno())
+        os.replace(compacted_path, log_path)
+        return open(log_path, 'ab')
+
+    def _write_push(
+            self, log: BinaryIO, to_client_id: int, message_id: int,
+            from_client_id: int, message_type: int, content: bytes,
+    ) -> None:
+        log.write(self.PUSH_RECORD.pack(
+            self._PUSH, message_id, from_client_id, to_client_id,
+            message_type, len(content)))
+        log.write(content)
+
+    def _append(
+            self, message_id: int, from_client_id: int, to_client_id: int,
+            message_type: int, content: bytes,
+    ) -> None:
+        mailbox = self._mailboxes.get(to_client_id)
+        if mailbox is None:
+            mailbox = self._mailboxes[to_client_id] = deque()
+        mailbox.append((message_id, from_client_id, message_type, content))
+
+    def _remove(self, to_client_id: int, message_ids: set) -> None:
+        mailbox = self._mailboxes.get(to_client_id, ())
+        left = deque(
+            message for message in mailbox if message[0] not in message_ids)
+        if left:
+            self._mailboxes[to_client_id] = left
+        else:
+            self._mailboxes.pop(to_client_id, None)
+
+    def push(
+            self, from_client_id: int, to_client_id: int, message_type: int,
+            content: Union[bytes, BinaryIO], content_size: int,
+    ) -> int:
+        if hasattr(content, 'read'):
+            content = content.read()
+        content = bytes(content)
+        with self._lock:
+            self._last_id += 1
+            message_id = self._last_id
+            if self._log is not None:
+                self._write_push(
+                    self._log, to_client_id, message_id, from_client_id,
+                    message_type, content)
+                self._log.flush()
+            self._append(
+                message_id, from_client_id, to_client_id, message_type,
+                content)
+        return message_id
+
+    def messages_sizes(
+            self, client_id: int, limit: Optional[int] = None,
+    ) -> Iterable[Tuple[int, int]]:
+        with self._lock:
+            mailbox = self._mailboxes.get(client_id, ())
+            return [(message_id, len(content))
+                    for message_id, _, _, content
+                    in itertools.islice(mailbox, limit)]
+
+    def pop(
+            self, client_id: int, messages_sizes: List[Tuple[int, int]],
+    ) -> Iterator[MessageRow]:
+        message_ids = {message_id for message_id, _ in messages_sizes}
+        with self._lock:
+            messages = [message
+                        for message in self._mailboxes.get(client_id, ())
+                        if message[0] in message_ids]
+        for message_id, from_client_id, message_type, content in messages:
+            yield from_client_id, message_id, message_type, len(content), \
+                content
+
+        if not message_ids:
+            return
+        with self._lock:
+            if self._log is not None:
+                self._log.write(self.POP_RECORD.pack(
+                    self._POP, client_id, len(message_ids)))
+                self._log.write(b''.join(map(self._ID.pack, message_ids)))
+                self._log.flush()
+            self._remove(client_id, message_ids)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+
+
+_store: Optional[MessageStore] = None
+_store_lock = threading.Lock()
+
+
+def message_store() -> MessageStore:
+    """Returns the store chosen by MESSAGEU_MESSAGE_STORE, created upon first
+      use - e.g. when the server starts, so the messages log of the memory
+      store is replayed then."""
+    global _store
+    if _store is not None:
+        return _store
+    from django.conf import settings
+
+    with _store_lock:
+        if _store is None:
+            if settings.MESSAGEU_MESSAGE_STORE == 'django':
+                _store = DjangoMessageStore(
+                    settings.MESSAGEU_GROUP_COMMIT_INTERVAL,
+                    settings.MESSAGEU_GROUP_COMMIT_BATCH_SIZE,
+                    settings.MESSAGEU_GROUP_COMMIT_TIMEOUT)
+            elif settings.MESSAGEU_MESSAGE_STORE == 'memory':
+                _store = MemoryMessageStore(settings.MESSAGEU_MESSAGE_LOG)
+            else:
+                raise exceptions.ServerAppException(
+                    f"Invalid MESSAGEU_MESSAGE_STORE "
+                    f"{settings.MESSAGEU_MESSAGE_STORE!r}, expected 'django' "
+                    f"or 'memory'.")
+    return _store
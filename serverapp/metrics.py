@@ -0,0 +1,99 @@
+import logging
+import threading
+from collections import Counter
+from typing import Dict, Optional, Union
+
+
+class Timing:
+    """Count, total and maximum of the observed durations of an event."""
+
+    __slots__ = ('count', 'total', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+
+class Metrics:
+    """Thread-safe counters and timings of the server, e.g. the count of
+      rejected connections and the time connections waited for a worker.
+
+    Once started, a snapshot is logged every `interval` seconds in a
+      background thread, so the metrics are observed while the server runs.
+
+    The server records into the module-level `metrics` instance."""
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = Counter()
+        self._timings: Dict[str, Timing] = {}
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def increment(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._counters[name] += value
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self._lock:
+            timing = self._timings.get(name)
+            if timing is None:
+                timing = self._timings[name] = Timing()
+            timing.observe(seconds)
+
+    def snapshot(self) -> Dict[str, Union[int, float]]:
+        """Returns the counters, and the count, mean and maximum (in seconds)
+          of each timing."""
+        with self._lock:
+            values = dict(self._counters)
+            for name, timing in self._timings.items():
+                values[f'{name}_count'] = timing.count
+                values[f'{name}_mean'] = timing.mean
+                values[f'{name}_max'] = timing.max
+        return values
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._timings.clear()
+
+    def log(self) -> None:
+        self.logger.info(f"Server metrics: {self.snapshot()}")
+
+    def _run(self, interval: float) -> None:
+        while not self._stopped.wait(interval):
+            self.log()
+
+    def start(self, interval: float) -> None:
+        """Starts logging a snapshot every `interval` seconds in a background
+          thread, unless already started."""
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(interval, ),
+            name='MessageU metrics', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops logging in the background, and logs a last snapshot."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.log()
+
+
+metrics = Metrics()
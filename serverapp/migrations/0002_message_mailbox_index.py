@@ -0,0 +1,23 @@
+# Generated by Django 3.1.7 on 2026-10-17 08:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('serverapp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='message',
+            name='to_client',
+            field=models.ForeignKey(db_index=False, help_text='The message recipient', on_delete=django.db.models.deletion.CASCADE, related_name='waiting_messages', to='serverapp.client'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['to_client', 'id'], name='mailbox_idx'),
+        ),
+    ]
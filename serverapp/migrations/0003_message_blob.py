@@ -0,0 +1,35 @@
+# Generated by Django 3.1.7 on 2026-10-17 08:44
+
+from django.db import migrations, models
+from django.db.models.functions import Length
+
+
+def set_content_sizes(apps, schema_editor):
+    Message = apps.get_model('serverapp', 'Message')
+    Message.objects.update(content_size=Length('content'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('serverapp', '0002_message_mailbox_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='blob',
+            field=models.CharField(blank=True, db_index=True, help_text='The SHA-256 digest of the message content, if kept as a blob', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='content_size',
+            field=models.PositiveIntegerField(default=0, help_text='The message content size in bytes'),
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='content',
+            field=models.BinaryField(blank=True, help_text='The message content, unless kept as a blob'),
+        ),
+        migrations.RunPython(set_content_sizes, migrations.RunPython.noop),
+    ]
@@ -31,12 +31,28 @@ class Message(models.Model):
         names=[(str(t), t) for t in ALL_REQUEST_MESSAGES_TYPES],
     )
 
+    # indexed by the mailbox index below
     to_client = models.ForeignKey(
-        Client, related_name='waiting_messages',
+        Client, related_name='waiting_messages', db_index=False,
         help_text="The message recipient", on_delete=models.CASCADE)
     from_client = models.ForeignKey(
         Client, related_name='sent_messages',
         help_text="The message sender", on_delete=models.CASCADE)
     # did not use `type` name because it's a Python built-in
     message_type = models.IntegerField(choices=MessageType.choices)
-    content = models.BinaryField(help_text="The message content")
+    # contents larger than MESSAGEU_BLOB_THRESHOLD are kept in
+    #  serverapp.blobstore instead
+    content = models.BinaryField(
+        blank=True, help_text="The message content, unless kept as a blob")
+    blob = models.CharField(
+        max_length=64, blank=True, db_index=True,
+        help_text="The SHA-256 digest of the message content, if kept as a "
+                  "blob")
+    content_size = models.PositiveIntegerField(
+        default=0, help_text="The message content size in bytes")
+
+    class Meta:
+        indexes = [
+            # the waiting messages of a client, in the order they are popped
+            models.Index(fields=['to_client', 'id'], name='mailbox_idx'),
+        ]
@@ -0,0 +1,120 @@
+import time
+import queue
+import socket
+import logging
+import threading
+import socketserver
+from typing import Tuple, Type
+
+from common.packer import Packer
+from protocol.packets.response.responses import ErrorResponse
+from serverapp.metrics import metrics
+
+
+class PooledTCPServer(socketserver.TCPServer):
+    """TCP server serving connections by a fixed pool of worker threads.
+
+    Accepted connections wait for a free worker in a bounded queue. When the
+      queue is full, a connection is answered with an ErrorResponse and
+      closed at once, so a reconnect storm slows the server down instead of
+      exhausting its threads and database connections.
+
+    Records into serverapp.metrics:
+      connections_rejected: Count of connections rejected by a full queue.
+      queue_wait: Time connections waited for a worker.
+    """
+
+    allow_reuse_address = True
+    # the listen backlog: the queue is drained by accepting, not by workers
+    request_queue_size = 128
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(
+            self, server_address: Tuple[str, int],
+            handler_class: Type[socketserver.BaseRequestHandler],
+            workers: int, queue_size: int, reuse_port: bool = False,
+    ):
+        self.reuse_port = reuse_port
+        super(PooledTCPServer, self).__init__(server_address, handler_class)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._error_response = Packer(ErrorResponse()).pack()
+        self._workers = [
+            threading.Thread(
+                target=self._work, name=f'MessageU worker {idx}', daemon=True)
+            for idx in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def server_bind(self) -> None:
+        if self.reuse_port:
+            # several processes listen on the port
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super(PooledTCPServer, self).server_bind()
+
+    @property
+    def busy(self) -> bool:
+        """Whether connections are waiting for a worker. Handlers then release
+          their worker after the current request."""
+        return not self._queue.empty()
+
+    def _work(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            request, client_address, enqueued = item
+            metrics.observe('queue_wait', time.monotonic() - enqueued)
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    def _reject(self, request: socket.socket) -> None:
+        metrics.increment('connections_rejected')
+        try:
+            request.setblocking(False)
+            request.send(self._error_response)
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def process_request(
+            self, request: socket.socket, client_address: Tuple[str, int],
+    ) -> None:
+        try:
+            self._queue.put_nowait(
+                (request, client_address, time.monotonic()))
+        except queue.Full:
+            self._reject(request)
+
+    def server_close(self) -> None:
+        super(PooledTCPServer, self).server_close()
+        # the workers exit after serving the connections already queued
+        for _ in self._workers:
+            self._queue.put(None)
+
+
+class PooledUnixListener(socketserver.UnixStreamServer):
+    """Accepts connections on a listening Unix domain socket, and queues them
+      to the workers of a PooledTCPServer - so both transports are served by
+      the same pool, within the same bounds.
+
+    The socket is bound by the caller, e.g. once before forking server
+      processes, which then all accept on it."""
+
+    def __init__(self, sock: socket.socket, pool: PooledTCPServer):
+        super(PooledUnixListener, self).__init__(
+            sock.getsockname(), pool.RequestHandlerClass,
+            bind_and_activate=False)
+        self.socket.close()
+        self.socket = sock
+        self.pool = pool
+
+    def process_request(
+            self, request: socket.socket, client_address: str,
+    ) -> None:
+        # Unix domain peers are unnamed, so the listener names them
+        self.pool.process_request(request, (f'unix:{self.server_address}', 0))
@@ -0,0 +1,98 @@
+import os
+import time
+import signal
+import logging
+from typing import Callable, Dict
+
+
+class PreforkSupervisor:
+    """Runs a server in several forked worker processes, and restarts workers
+      that die.
+
+    Each worker runs `serve`, which listens on the same port with
+      SO_REUSEPORT - so the kernel spreads the connections between the
+      workers, and packing and unpacking run on several cores. The supervisor
+      itself only waits for its workers.
+
+    Database connections are closed before forking, so each worker opens its
+      own. SQLite serializes the writes of the workers by locking its file.
+
+    Class Attributes:
+      RESTART_DELAY: Seconds a worker is restarted after, if it died sooner
+        than that after starting - so a crashing worker does not spin.
+    """
+
+    RESTART_DELAY = 1
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, serve: Callable[[], None], processes: int):
+        self.serve = serve
+        self.processes = processes
+        self._workers: Dict[int, float] = {}  # start times by pid
+        self._stopping = False
+
+    def _serve_worker(self) -> None:
+        """Runs in a forked worker, and never returns."""
+        exit_code = 0
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            # Ctrl+C interrupts the whole process group - the supervisor then
+            #  terminates the workers, which unwind (e.g. flushing writes)
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            self.serve()
+        except SystemExit as e:
+            # e.g. `serve` exits when terminated
+            exit_code = e.code if isinstance(e.code, int) \
+                else int(e.code is not None)
+        except BaseException as e:
+            self.logger.exception(e)
+            exit_code = 1
+        finally:
+            os._exit(exit_code)
+
+    def _fork_worker(self) -> None:
+        from django.db import connections
+
+        connections.close_all()
+        pid = os.fork()
+        if pid == 0:
+            self._serve_worker()
+        self._workers[pid] = time.monotonic()
+        self.logger.debug(f"Started worker {pid}.")
+
+    def _on_signal(self, signum: int, frame) -> None:
+        self.shutdown()
+
+    def serve_forever(self) -> None:
+        """Starts the workers, and restarts them until shutdown is called or
+          the supervisor is interrupted."""
+        signal.signal(signal.SIGTERM, self._on_signal)
+        signal.signal(signal.SIGINT, self._on_signal)
+        for _ in range(self.processes):
+            self._fork_worker()
+
+        while self._workers:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            started = self._workers.pop(pid, None)
+            if started is None or self._stopping:
+                continue
+            self.logger.warning(
+                f"Worker {pid} died with status {status}, restarting it.")
+            lifetime = time.monotonic() - started
+            if lifetime < PreforkSupervisor.RESTART_DELAY:
+                time.sleep(PreforkSupervisor.RESTART_DELAY - lifetime)
+            if not self._stopping:
+                self._fork_worker()
+
+    def shutdown(self) -> None:
+        """Terminates the workers. serve_forever returns once they exit."""
+        self._stopping = True
+        for pid in list(self._workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.dispatch import receiver
+from django.db.backends.signals import connection_created
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs) -> None:
+    """Applies MESSAGEU_SQLITE_PRAGMAS to every new SQLite connection - e.g.
+      of each worker thread and server process."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.MESSAGEU_SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
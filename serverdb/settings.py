@@ -37,7 +37,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    'serverapp'
+    'serverapp.apps.ServerappConfig',
 ]
 
 MIDDLEWARE = [
@@ -79,6 +79,11 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'server.db',
+        'OPTIONS': {
+            # seconds to wait for a lock held by another thread or server
+            #  process, before failing with "database is locked"
+            'timeout': 10,
+        },
     }
 }
 
@@ -101,3 +106,92 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/3.1/howto/static-files/
 
 STATIC_URL = '/static/'
+
+
+# MessageU server
+
+# Count of worker threads serving connections, when serving with the
+#  threading engine. Each worker holds its own database connection.
+MESSAGEU_WORKERS = 16
+
+# Maximal count of accepted connections waiting for a worker. Connections
+#  beyond it are answered with an error and closed.
+MESSAGEU_ACCEPT_QUEUE_SIZE = 256
+
+# Maximal number of threads running blocking Django ORM calls, when serving
+#  with the asyncio engine.
+MESSAGEU_EXECUTOR_WORKERS = 16
+
+# Seconds a connection is kept open while waiting for the client's next
+#  request. A single read of a request never waits longer either.
+MESSAGEU_IDLE_TIMEOUT = 60
+
+# Seconds a request header must be received in, once its first bytes were.
+MESSAGEU_HEADER_TIMEOUT = 10
+
+# A request payload must be received within MESSAGEU_BODY_TIMEOUT seconds,
+#  plus its size divided by MESSAGEU_MIN_BODY_RATE (bytes per second).
+MESSAGEU_BODY_TIMEOUT = 10
+MESSAGEU_MIN_BODY_RATE = 2 ** 16
+
+# Seconds a whole request must be received in, once its first bytes were.
+MESSAGEU_REQUEST_TIMEOUT = 300
+
+# Maximal payload size of a request, in bytes. Larger requests are answered
+#  with an error before their payload is read.
+MESSAGEU_MAX_PAYLOAD_SIZE = 64 * 2 ** 20
+
+# Payload size above which message content is received into a temporary file
+#  (kept in memory up to that size) instead of a buffer.
+MESSAGEU_SPOOL_THRESHOLD = 2 ** 20
+
+# Seconds between writes of the times clients were last seen, which are
+#  collected in memory meanwhile (and written once more on shutdown).
+MESSAGEU_LAST_SEEN_INTERVAL = 5
+
+# Seconds between the snapshots of serverapp.metrics logged by each server
+#  process (and one more on shutdown), e.g. queue waits and request latency.
+MESSAGEU_METRICS_INTERVAL = 60
+
+# Seconds after which clients registered by other server processes are
+#  listed, and deleted clients are dropped, as each process keeps a directory
+#  of the clients in memory.
+MESSAGEU_DIRECTORY_REFRESH = 1
+
+# PRAGMA statements run upon opening each SQLite connection (see
+#  serverapp.signals). WAL lets reads run concurrently with a write. With
+#  synchronous=NORMAL, only WAL checkpoints wait for the disk rather than
+#  every commit - a power loss may undo the last commits, but never corrupts
+#  the database. The page cache size is in KiB when negative.
+MESSAGEU_SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 2 ** 28,
+    'cache_size': -2 ** 16,
+    'temp_store': 'MEMORY',
+}
+
+# Message contents larger than MESSAGEU_BLOB_THRESHOLD bytes are kept in files
+#  under MESSAGEU_BLOB_DIR, named by their SHA-256 digest, instead of in the
+#  database (see serverapp.blobstore).
+MESSAGEU_BLOB_DIR = BASE_DIR / 'blobs'
+MESSAGEU_BLOB_THRESHOLD = 2 ** 16
+
+# Where waiting messages are stored: 'django' for the database, or 'memory'
+#  for a deque per recipient in the server process - which serves a single
+#  process only, and keeps the messages across restarts only if
+#  MESSAGEU_MESSAGE_LOG is a path to append them to (see
+#  serverapp.messagestore).
+MESSAGEU_MESSAGE_STORE = 'django'
+MESSAGEU_MESSAGE_LOG = None
+
+# Pushes to the 'django' store are inserted by a committer thread, in a single
+#  transaction of up to MESSAGEU_GROUP_COMMIT_BATCH_SIZE messages, waiting up
+#  to MESSAGEU_GROUP_COMMIT_INTERVAL seconds for more once one is pending (see
+#  serverapp.groupcommit) - a longer interval trades push latency for fewer
+#  transactions. A batch size of 1 inserts each push in its own transaction.
+MESSAGEU_GROUP_COMMIT_INTERVAL = 0
+MESSAGEU_GROUP_COMMIT_BATCH_SIZE = 256
+# Seconds a push waits for the committer before failing, e.g. while the
+#  database is locked.
+MESSAGEU_GROUP_COMMIT_TIMEOUT = 30
@@ -1,18 +1,25 @@
+import socket
+import threading
+
 import pytest
 
 # TOOO: make imports shorter
 from clientapp.handler import ClientHandler
+from common.exceptions import PacketBaseValueError, ConnectionClosedError, \
+    IncompleteFrameError
+from common.framing import FrameReader
+from common.packer import Packer
 from protocol.fields.message import MessageContent
 from protocol.packets.base import PacketBase
 from protocol.packets.request.base import Request
 from protocol.packets.request.requests import RegisterRequest, \
-    ListClientsRequest, PublicKeyRequest, PopMessagesRequest
+    ListClientsRequest, PublicKeyRequest, PopMessagesRequest, VersionRequest
 from protocol.packets.request.messages import GetSymmetricKeyRequest, \
     SendSymmetricKeyRequest, SendMessageRequest, SendFileRequest, \
     PushMessageRequest
 from protocol.packets.response.responses import RegisterResponse, \
     ListClientsResponse, PublicKeyResponse, PushMessageResponse, \
-    PopMessagesResponse
+    PopMessagesResponse, VersionResponse
 from protocol.packets.response.base import Response
 
 
@@ -52,10 +59,170 @@ def test_request_to_response(
 def test_request_to_response_fail(
         _request: Request, client_handler: ClientHandler,
 ):
-    with pytest.raises(StopIteration):
+    with pytest.raises(PacketBaseValueError):
         client_handler._request_to_response(_request)
 
 
+@pytest.mark.parametrize(
+    'server_response, expected_version',
+    [({'max_version': 3}, 3),
+     ({'max_version': 200}, max(Request.VERSIONS)),
+     (RuntimeError("Server responded with general error"), 2)],
+)
+def test_negotiate_version(
+        server_response, expected_version: int,
+        client_handler: ClientHandler,
+):
+    sent = []
+
+    def _handle(request, fields_to_pack, version):
+        sent.append((request, version))
+        if not isinstance(request, VersionRequest):
+            return {}
+        if isinstance(server_response, Exception):
+            raise server_response
+        return server_response
+
+    client_handler._handle = _handle
+    client_handler.handle(ListClientsRequest(), {'sender_client_id': 1})
+    assert client_handler.version == expected_version
+    assert isinstance(sent[0][0], VersionRequest) and sent[0][1] == 2
+    assert sent[1][1] == expected_version
+
+
+class _ScriptedServer:
+    """Serves each accepted connection by the next script, or - past the
+      scripts - by responding to every request. A script is called with the
+      connection, and with a function responding to the next request."""
+
+    REQUEST_LENGTH = len(b''.join(
+        Packer(VersionRequest(), 2).pack_buffers()))
+    RESPONSE = Packer(VersionResponse(), 2).pack(max_version=2)
+
+    def __init__(self, *scripts):
+        self.scripts = list(scripts)
+        self.connections = 0
+        self.closed = threading.Event()
+        self.listener = socket.create_server(('127.0.0.1', 0))
+        self.port = self.listener.getsockname()[1]
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def _respond(self, conn):
+        """Returns whether a request was responded to."""
+        try:
+            FrameReader(conn).read_exactly(self.REQUEST_LENGTH)
+        except ConnectionError:
+            return False
+        conn.sendall(self.RESPONSE)
+        return True
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self.listener.accept()
+            except OSError:
+                return
+            self.connections += 1
+            with conn:
+                if self.scripts:
+                    self.scripts.pop(0)(conn, self._respond)
+                else:
+                    while self._respond(conn):
+                        pass
+            self.closed.set()
+
+    def close(self):
+        self.listener.close()
+
+
+@pytest.fixture
+def scripted_server():
+    servers = []
+
+    def start(*scripts):
+        servers.append(_ScriptedServer(*scripts))
+        return servers[-1]
+    yield start
+    for server in servers:
+        server.close()
+
+
+def _request(client_handler):
+    return client_handler.handle(VersionRequest(), {})
+
+
+def test_handle_keeps_connection(scripted_server):
+    server = scripted_server()
+    client_handler = ClientHandler('127.0.0.1', server.port, version=2)
+    assert _request(client_handler) == _request(client_handler)
+    assert server.connections == 1
+    client_handler.close()
+
+
+def test_handle_reconnects_to_send_on_closed_connection(
+        scripted_server, monkeypatch,
+):
+    # sent over a new connection even if not idempotent, as not sent before
+    monkeypatch.setattr(VersionRequest, 'IDEMPOTENT', False)
+    # the first connection is closed by the server after a request, e.g. once
+    #  idle for too long
+    server = scripted_server(lambda conn, respond: respond(conn))
+    client_handler = ClientHandler('127.0.0.1', server.port, version=2)
+    _request(client_handler)
+    assert server.closed.wait(timeout=5)
+    assert _request(client_handler)['max_version'] == 2
+    assert server.connections == 2
+    client_handler.close()
+
+
+@pytest.mark.parametrize('idempotent', (True, False))
+def test_handle_resends_only_idempotent(
+        scripted_server, monkeypatch, idempotent,
+):
+    def close_after_request(conn, respond):
+        respond(conn)
+        # the second request is received, but not responded to
+        FrameReader(conn).read_exactly(_ScriptedServer.REQUEST_LENGTH)
+
+    monkeypatch.setattr(VersionRequest, 'IDEMPOTENT', idempotent)
+    server = scripted_server(close_after_request)
+    client_handler = ClientHandler('127.0.0.1', server.port, version=2)
+    _request(client_handler)
+    if idempotent:
+        assert _request(client_handler)['max_version'] == 2
+        assert server.connections == 2
+    else:
+        with pytest.raises((ConnectionClosedError, ConnectionResetError)):
+            _request(client_handler)
+        assert server.connections == 1
+    client_handler.close()
+
+
+def test_handle_new_connection_not_resent(scripted_server):
+    server = scripted_server(lambda conn, respond: None)
+    client_handler = ClientHandler('127.0.0.1', server.port, version=2)
+    with pytest.raises((ConnectionClosedError, ConnectionResetError)):
+        _request(client_handler)
+    assert server.connections == 1
+    assert client_handler._socket is None
+
+
+def test_handle_partial_response_not_resent(scripted_server):
+    def respond_partially(conn, respond):
+        respond(conn)
+        FrameReader(conn).read_exactly(_ScriptedServer.REQUEST_LENGTH)
+        conn.sendall(_ScriptedServer.RESPONSE[:3])
+
+    server = scripted_server(respond_partially)
+    client_handler = ClientHandler('127.0.0.1', server.port, version=2)
+    _request(client_handler)
+    with pytest.raises(IncompleteFrameError):
+        _request(client_handler)
+    assert server.connections == 1
+    assert client_handler._socket is None
+
+
 # TODO:
 #  1. mock socket (difficult).
 #  2. use online server (fixture?). clear db before starting.
@@ -16,7 +16,8 @@ def client_app(tmp_path) -> Type[ClientApp]:
     'file_content,expected_host,expected_port',
     [('127.0.0.1:1234', '127.0.0.1', 1234),
      ('localhost:7538', 'localhost', 7538),
-     ('my-domain.org:1600', 'my-domain.org', 1600)]
+     ('my-domain.org:1600', 'my-domain.org', 1600),
+     ('unix:/run/messageu.sock\n', 'unix:/run/messageu.sock', None)]
 )
 def test_read_server_host_and_port(
         file_content: str, expected_host: str, expected_port: int,
@@ -38,7 +39,8 @@ def test_read_server_host_and_port_file_missing(client_app: Type[ClientApp]):
     'file_content',
     ['127.0.0.1:0 1234',
      'local:host:7538',
-     'my-domain.org:not a number']
+     'my-domain.org:not a number',
+     'unix:']
 )
 def test_read_server_host_and_port_file_invalid(
         file_content: str, client_app: Type[ClientApp]):
@@ -120,3 +122,62 @@ def test_load_user_info_if_exists_invalid_format(
         file.write(file_content)
     with pytest.raises(ClientAppException):
         client_app._load_user_info_if_exists()
+
+
+class _PagesHandler:
+    """Responds to PopMessagesPageRequests with the given pages, or - in
+      version 2 - to a PopMessagesRequest with their messages."""
+
+    def __init__(self, pages, version=3):
+        self.pages = list(pages)
+        self.version = version
+        self.requests = []
+
+    def protocol_version(self):
+        return self.version
+
+    def handle(self, request, fields_to_pack):
+        self.requests.append((request, dict(fields_to_pack)))
+        if self.version == 2:
+            return {'messages': tuple(
+                message for _, messages in self.pages for message in messages)}
+        has_more_messages, messages = self.pages.pop(0)
+        return {'has_more_messages': has_more_messages, 'messages': messages}
+
+
+def test_pop_messages_until_drained(client_app: Type[ClientApp]):
+    from protocol.packets.request.requests import PopMessagesPageRequest
+
+    message = (7, 1, 1, 0, b'')  # request for symmetric key
+    app = client_app.__new__(client_app)
+    app.client_id = 3
+    app.handler = _PagesHandler(
+        [(1, (message, message)), (1, (message, )), (0, ())])
+
+    output = app._pop_messages()
+    assert output.count("Request for symmetric key") == 3
+    assert len(app.handler.requests) == 3
+    request, fields = app.handler.requests[0]
+    assert isinstance(request, PopMessagesPageRequest)
+    assert fields == {
+        'sender_client_id': 3,
+        'max_messages': client_app.POP_MAX_MESSAGES,
+        'max_messages_size': client_app.POP_MAX_MESSAGES_SIZE,
+    }
+
+
+def test_pop_messages_from_version_2_server(client_app: Type[ClientApp]):
+    from protocol.packets.request.requests import PopMessagesRequest
+
+    message = (7, 1, 1, 0, b'')  # request for symmetric key
+    app = client_app.__new__(client_app)
+    app.client_id = 3
+    app.handler = _PagesHandler(
+        [(1, (message, message)), (0, (message, ))], version=2)
+
+    output = app._pop_messages()
+    assert output.count("Request for symmetric key") == 3
+    assert len(app.handler.requests) == 1
+    request, fields = app.handler.requests[0]
+    assert isinstance(request, PopMessagesRequest)
+    assert fields == {'sender_client_id': 3}
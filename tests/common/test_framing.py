@@ -0,0 +1,245 @@
+import io
+import time
+import socket
+import threading
+
+import pytest
+
+from common.exceptions import ConnectionClosedError, IncompleteFrameError, \
+    DeadlineExceededError
+from common.framing import FrameReader, Deadline, FileRegion, send_buffers, \
+    MAX_SEND_BUFFERS
+
+
+@pytest.fixture
+def socket_pair():
+    reader_socket, writer_socket = socket.socketpair()
+    yield reader_socket, writer_socket
+    reader_socket.close()
+    writer_socket.close()
+
+
+def _send_in_segments(sock: socket.socket, data: bytes, segment: int) -> None:
+    for offset in range(0, len(data), segment):
+        sock.sendall(data[offset:offset + segment])
+
+
+@pytest.mark.parametrize(
+    'size,segment',
+    [(7, 1),
+     (23, 23),
+     (FrameReader.INITIAL_BUFFER_SIZE * 3, 1000),
+     (FrameReader.MAX_RETAINED_BUFFER_SIZE + 1, 65536)],
+)
+def test_read_exactly_segmented(
+        size: int, segment: int, socket_pair,
+):
+    reader_socket, writer_socket = socket_pair
+    data = bytes(idx % 251 for idx in range(size))
+    sender = threading.Thread(
+        target=_send_in_segments,
+        args=(writer_socket, data + b'next', segment))
+    sender.start()
+
+    frames = FrameReader(reader_socket)
+    assert frames.read_exactly(size) == data
+    assert frames.read_exactly(4) == b'next'
+    sender.join()
+
+
+def test_read_exactly_reuses_buffer(socket_pair):
+    reader_socket, writer_socket = socket_pair
+    writer_socket.sendall(b'first' + b'second')
+
+    frames = FrameReader(reader_socket)
+    first = frames.read_exactly(5)
+    assert first.obj is frames.read_exactly(6).obj
+
+
+def test_read_exactly_does_not_retain_large_buffer(socket_pair):
+    reader_socket, writer_socket = socket_pair
+    size = FrameReader.MAX_RETAINED_BUFFER_SIZE + 1
+    sender = threading.Thread(
+        target=writer_socket.sendall, args=(b'x' * size + b'y', ))
+    sender.start()
+
+    frames = FrameReader(reader_socket)
+    frames.read_exactly(size)
+    assert frames.read_exactly(1).obj is frames._buffer
+    assert len(frames._buffer) <= FrameReader.MAX_RETAINED_BUFFER_SIZE
+    sender.join()
+
+
+def test_read_exactly_closed(socket_pair):
+    reader_socket, writer_socket = socket_pair
+    writer_socket.close()
+    with pytest.raises(ConnectionClosedError):
+        FrameReader(reader_socket).read_exactly(7)
+
+
+def test_read_exactly_closed_mid_frame(socket_pair):
+    reader_socket, writer_socket = socket_pair
+    writer_socket.sendall(b'abc')
+    writer_socket.close()
+    with pytest.raises(IncompleteFrameError):
+        FrameReader(reader_socket).read_exactly(7)
+
+
+def test_copy_to_file(socket_pair):
+    reader_socket, writer_socket = socket_pair
+    size = FrameReader.INITIAL_BUFFER_SIZE * 5 + 3
+    data = bytes(idx % 251 for idx in range(size))
+    sender = threading.Thread(
+        target=_send_in_segments, args=(writer_socket, data + b'next', 1000))
+    sender.start()
+
+    frames = FrameReader(reader_socket)
+    file = io.BytesIO()
+    frames.copy_to_file(file, size)
+    assert file.getvalue() == data
+    assert len(frames._buffer) == FrameReader.INITIAL_BUFFER_SIZE
+    assert frames.read_exactly(4) == b'next'
+    sender.join()
+
+
+def test_copy_to_file_closed_mid_frame(socket_pair):
+    reader_socket, writer_socket = socket_pair
+    writer_socket.sendall(b'abc')
+    writer_socket.close()
+    with pytest.raises(IncompleteFrameError):
+        FrameReader(reader_socket).copy_to_file(io.BytesIO(), 7)
+
+
+def _send_with_delays(
+        sock: socket.socket, data: bytes, segment: int, delay: float,
+) -> None:
+    for offset in range(0, len(data), segment):
+        time.sleep(delay)
+        sock.sendall(data[offset:offset + segment])
+
+
+def test_read_exactly_deadline_starts_with_first_bytes(socket_pair):
+    reader_socket, writer_socket = socket_pair
+    reader_socket.settimeout(5)
+    sender = threading.Thread(
+        target=_send_with_delays, args=(writer_socket, b'frame', 5, 0.3))
+    sender.start()
+
+    deadline = Deadline('header', 0.1, start=False)
+    # waiting for the peer to start sending is bounded by the socket timeout
+    assert FrameReader(reader_socket).read_exactly(5, deadline) == b'frame'
+    assert deadline.started is not None
+    sender.join()
+
+
+def test_read_exactly_deadline_restores_timeout(socket_pair):
+    reader_socket, writer_socket = socket_pair
+    reader_socket.settimeout(5)
+    sender = threading.Thread(
+        target=_send_with_delays, args=(writer_socket, b'frame', 1, 0.01))
+    sender.start()
+
+    FrameReader(reader_socket).read_exactly(5, Deadline('body', 1))
+    sender.join()
+    # e.g. the response is sent under the socket timeout, rather than under
+    #  what was left of the deadline
+    assert reader_socket.gettimeout() == 5
+
+
+def test_read_exactly_deadline_trickling_peer(socket_pair):
+    reader_socket, writer_socket = socket_pair
+    reader_socket.settimeout(5)
+    sender = threading.Thread(
+        target=_send_with_delays, args=(writer_socket, b'x' * 10, 1, 0.1))
+    sender.start()
+
+    frames = FrameReader(reader_socket)
+    started = time.monotonic()
+    # each byte arrives well within the socket timeout
+    with pytest.raises(DeadlineExceededError) as e:
+        frames.read_exactly(10, Deadline('body', 0.35))
+    assert e.value.deadline_name == 'body'
+    assert time.monotonic() - started < 1
+    sender.join()
+    # reads without a deadline are bounded by the socket timeout again
+    frames.read_exactly(1)
+    assert reader_socket.gettimeout() == 5
+
+
+def test_copy_to_file_deadline(socket_pair):
+    reader_socket, writer_socket = socket_pair
+    reader_socket.settimeout(5)
+    writer_socket.sendall(b'abc')
+    with pytest.raises(DeadlineExceededError):
+        FrameReader(reader_socket).copy_to_file(
+            io.BytesIO(), 7, Deadline('body', 0.1))
+
+
+class _PartialSendSocket:
+    """Sends at most `limit` bytes a call, like a socket with a full send
+      buffer."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.data = bytearray()
+        self.calls = 0
+
+    def sendmsg(self, buffers) -> int:
+        assert len(buffers) <= MAX_SEND_BUFFERS
+        self.calls += 1
+        sent = bytes(b''.join(buffers))[:self.limit]
+        self.data += sent
+        return len(sent)
+
+
+@pytest.mark.parametrize('limit', [1, 5, 1000])
+def test_send_buffers_partial_writes(limit: int):
+    buffers = [b'header', b'', b'x' * 17, memoryview(b'content')] + \
+        [b'r'] * (MAX_SEND_BUFFERS + 3)
+    sock = _PartialSendSocket(limit)
+    send_buffers(sock, buffers)
+    assert sock.data == b''.join(buffers)
+    assert sock.calls >= -(-len(sock.data) // limit)
+
+
+def test_send_buffers(socket_pair):
+    reader_socket, writer_socket = socket_pair
+    content = bytes(idx % 251 for idx in range(2 ** 20))
+    sender = threading.Thread(
+        target=send_buffers, args=(writer_socket, [b'head', content, b'tail']))
+    sender.start()
+
+    frames = FrameReader(reader_socket)
+    assert frames.read_exactly(4) == b'head'
+    assert frames.read_exactly(len(content)) == content
+    assert frames.read_exactly(4) == b'tail'
+    sender.join()
+
+
+def test_send_buffers_file_regions(socket_pair, tmp_path):
+    reader_socket, writer_socket = socket_pair
+    content = bytes(idx % 251 for idx in range(2 ** 20))
+    path = tmp_path / 'content'
+    path.write_bytes(b'skipped' + content)
+    with open(path, 'rb') as file:
+        region = FileRegion(file, len(b'skipped'), len(content))
+        sender = threading.Thread(target=send_buffers, args=(
+            writer_socket, [b'head', region, b'middle', region, b'tail']))
+        sender.start()
+
+        frames = FrameReader(reader_socket)
+        assert frames.read_exactly(4) == b'head'
+        assert frames.read_exactly(len(content)) == content
+        assert frames.read_exactly(6) == b'middle'
+        assert frames.read_exactly(len(content)) == content
+        assert frames.read_exactly(4) == b'tail'
+        sender.join()
+
+
+def test_send_buffers_short_file(socket_pair, tmp_path):
+    _, writer_socket = socket_pair
+    path = tmp_path / 'content'
+    path.write_bytes(b'short')
+    with open(path, 'rb') as file:
+        with pytest.raises(ValueError):
+            send_buffers(writer_socket, [FileRegion(file, 0, 10)])
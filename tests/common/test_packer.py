@@ -0,0 +1,57 @@
+import pytest
+
+from common.exceptions import PackerValueError
+from common.packer import Packer
+from protocol.packets.request.messages import SendFileRequest
+from protocol.packets.response.responses import PopMessagesResponse, \
+    PushMessageResponse
+
+MESSAGES = (
+    (1, 10, 3, 5, b'hello'),
+    (2, 11, 4, 0, b''),
+    (1, 12, 1, 3, b'key'),
+)
+MESSAGES_SIZE = 3 * 26 + 8
+
+
+def test_pack_stream():
+    chunks = Packer(PopMessagesResponse()).pack_stream(
+        messages=iter(MESSAGES), messages_size=MESSAGES_SIZE)
+    packet_bytes = Packer(PopMessagesResponse()).pack(messages=MESSAGES)
+    assert b''.join(b''.join(chunk) for chunk in chunks) == packet_bytes
+
+
+def test_pack_stream_rows_are_lazy():
+    def rows():
+        yield MESSAGES[0]
+        raise AssertionError("Packed beyond the first row.")
+
+    chunks = Packer(PopMessagesResponse()).pack_stream(
+        messages=rows(), messages_size=MESSAGES_SIZE)
+    header = b''.join(next(chunks))
+    assert int.from_bytes(header[3:7], 'little') == MESSAGES_SIZE
+    assert next(chunks)[-1] == b'hello'
+
+
+@pytest.mark.parametrize('size', [MESSAGES_SIZE - 1, MESSAGES_SIZE + 1])
+def test_pack_stream_size_mismatch(size: int):
+    chunks = Packer(PopMessagesResponse()).pack_stream(
+        messages=iter(MESSAGES), messages_size=size)
+    with pytest.raises(PackerValueError):
+        list(chunks)
+
+
+def test_pack_stream_not_streamed():
+    kwargs = {'receiver_client_id': 2, 'message_id': 17}
+    assert Packer(PushMessageResponse()).pack_stream(**kwargs) == \
+        ([Packer(PushMessageResponse()).pack(**kwargs)], )
+
+
+def test_pack_buffers_content_not_copied():
+    content = b'x' * 2 ** 20
+    kwargs = {'sender_client_id': 1, 'receiver_client_id': 2,
+              'content': content}
+    buffers = Packer(SendFileRequest()).pack_buffers(**kwargs)
+    assert buffers[-1] is content
+    assert b''.join(buffers) == \
+        Packer(SendFileRequest()).pack(**kwargs)
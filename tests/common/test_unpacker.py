@@ -0,0 +1,209 @@
+import pytest
+
+from common.exceptions import UnpackerValueError, FieldBaseValueError
+from common.packer import Packer
+from common.unpacker import Unpacker
+from common.utils import FieldsValues
+from protocol.packets.base import PacketBase
+from protocol.packets.request.base import Request
+from protocol.packets.request.requests import RegisterRequest, \
+    ListClientsRequest, PublicKeyRequest, PopMessagesRequest, \
+    PopMessagesPageRequest, VersionRequest
+from protocol.packets.request.messages import GetSymmetricKeyRequest, \
+    SendSymmetricKeyRequest, SendMessageRequest, SendFileRequest, \
+    PushMessageRequest
+from protocol.packets.response.responses import RegisterResponse, \
+    ListClientsResponse, PublicKeyResponse, PushMessageResponse, \
+    PopMessagesResponse, PopMessagesPageResponse, ErrorResponse, \
+    VersionResponse
+
+
+PUBLIC_KEY = 'MIGfMA0GCSqGSIb3DQEBAQUAA4GNAD' * 9
+
+
+def _unpack(packet_bytes: bytes, packet: PacketBase) -> FieldsValues:
+    """Unpacks like the handlers do: the server expects any request, while
+      the client expects a specific response."""
+    header_packet = Request() if isinstance(packet, Request) else packet
+    unpacker = Unpacker(header_packet)
+    header_length = header_packet.HEADER_LENGTH
+    fields = unpacker.unpack_header(packet_bytes[:header_length])
+    unpacker.packet = packet
+    fields.update(unpacker.unpack_payload(packet_bytes[header_length:]))
+    return fields
+
+
+@pytest.mark.parametrize(
+    'packet_type,fields_to_pack,expected_fields',
+    [(RegisterRequest,
+      {'client_name': 'alice', 'public_key': PUBLIC_KEY},
+      {'version': 2, 'code': 100, 'payload_size': 526,
+       'sender_client_id': 0, 'client_name': 'alice',
+       'public_key': PUBLIC_KEY}),
+     (ListClientsRequest,
+      {'sender_client_id': 2 ** 128 - 1},
+      {'version': 2, 'code': 101, 'payload_size': 0,
+       'sender_client_id': 2 ** 128 - 1}),
+     (PublicKeyRequest,
+      {'sender_client_id': 1, 'requested_client_id': 300},
+      {'version': 2, 'code': 102, 'payload_size': 16,
+       'sender_client_id': 1, 'requested_client_id': 300}),
+     (PushMessageRequest,
+      {'sender_client_id': 1, 'receiver_client_id': 2, 'message_type': 3,
+       'content': b'hello'},
+      {'version': 2, 'code': 103, 'payload_size': 26,
+       'sender_client_id': 1, 'receiver_client_id': 2, 'message_type': 3,
+       'content_size': 5, 'content': b'hello'}),
+     (GetSymmetricKeyRequest,
+      {'sender_client_id': 1, 'receiver_client_id': 2, 'content': b''},
+      {'version': 2, 'code': 103, 'payload_size': 21,
+       'sender_client_id': 1, 'receiver_client_id': 2, 'message_type': 1,
+       'content_size': 0, 'content': b''}),
+     (SendSymmetricKeyRequest,
+      {'sender_client_id': 1, 'receiver_client_id': 2,
+       'content': bytes(range(128))},
+      {'version': 2, 'code': 103, 'payload_size': 149,
+       'sender_client_id': 1, 'receiver_client_id': 2, 'message_type': 2,
+       'content_size': 128, 'content': bytes(range(128))}),
+     (SendMessageRequest,
+      {'sender_client_id': 1, 'receiver_client_id': 2, 'content': b'\x00a'},
+      {'version': 2, 'code': 103, 'payload_size': 23,
+       'sender_client_id': 1, 'receiver_client_id': 2, 'message_type': 3,
+       'content_size': 2, 'content': b'\x00a'}),
+     (SendFileRequest,
+      {'sender_client_id': 1, 'receiver_client_id': 2,
+       'content': b'f' * 100000},
+      {'version': 2, 'code': 103, 'payload_size': 100021,
+       'sender_client_id': 1, 'receiver_client_id': 2, 'message_type': 4,
+       'content_size': 100000, 'content': b'f' * 100000}),
+     (PopMessagesRequest,
+      {'sender_client_id': 3},
+      {'version': 2, 'code': 104, 'payload_size': 0,
+       'sender_client_id': 3}),
+     (PopMessagesPageRequest,
+      {'sender_client_id': 3, 'max_messages': 64,
+       'max_messages_size': 2 ** 20},
+      {'version': 2, 'code': 105, 'payload_size': 8,
+       'sender_client_id': 3, 'max_messages': 64,
+       'max_messages_size': 2 ** 20}),
+     (RegisterResponse,
+      {'new_client_id': 12},
+      {'version': 2, 'code': 1000, 'payload_size': 16, 'new_client_id': 12}),
+     (ListClientsResponse,
+      {'clients': ()},
+      {'version': 2, 'code': 1001, 'payload_size': 0, 'clients': ()}),
+     (ListClientsResponse,
+      {'clients': ((1, 'alice'), (2, 'bob'))},
+      {'version': 2, 'code': 1001, 'payload_size': 542,
+       'clients': ((1, 'alice'), (2, 'bob'))}),
+     (PublicKeyResponse,
+      {'requested_client_id': 2, 'public_key': PUBLIC_KEY},
+      {'version': 2, 'code': 1002, 'payload_size': 287,
+       'requested_client_id': 2, 'public_key': PUBLIC_KEY}),
+     (PushMessageResponse,
+      {'receiver_client_id': 2, 'message_id': 2 ** 40 - 1},
+      {'version': 2, 'code': 1003, 'payload_size': 21,
+       'receiver_client_id': 2, 'message_id': 2 ** 40 - 1}),
+     (PopMessagesResponse,
+      {'messages': ()},
+      {'version': 2, 'code': 1004, 'payload_size': 0, 'messages': ()}),
+     (PopMessagesResponse,
+      {'messages': ((1, 10, 1, 0, b''),
+                    (1, 11, 3, 5, b'hello'),
+                    (4, 12, 4, 3, b'abc'))},
+      {'version': 2, 'code': 1004, 'payload_size': 86,
+       'messages': ((1, 10, 1, 0, b''),
+                    (1, 11, 3, 5, b'hello'),
+                    (4, 12, 4, 3, b'abc'))}),
+     (PopMessagesPageResponse,
+      {'has_more_messages': 1, 'messages': ((1, 10, 3, 5, b'hello'), )},
+      {'version': 2, 'code': 1005, 'payload_size': 32,
+       'has_more_messages': 1, 'messages': ((1, 10, 3, 5, b'hello'), )}),
+     (ErrorResponse,
+      {},
+      {'version': 2, 'code': 9000, 'payload_size': 0})],
+)
+def test_unpack_packed(
+        packet_type, fields_to_pack: FieldsValues,
+        expected_fields: FieldsValues,
+):
+    packet_bytes = Packer(packet_type()).pack(**fields_to_pack)
+    assert _unpack(packet_bytes, packet_type()) == expected_fields
+    assert _unpack(memoryview(packet_bytes), packet_type()) == expected_fields
+
+
+@pytest.mark.parametrize(
+    'packet_type,fields_to_pack,extra_bytes',
+    [(PublicKeyRequest,
+      {'sender_client_id': 1, 'requested_client_id': 300}, b'\x00'),
+     (PublicKeyRequest,
+      {'sender_client_id': 1, 'requested_client_id': 300}, b'')],
+)
+def test_unpack_payload_length_mismatch(
+        packet_type, fields_to_pack: FieldsValues, extra_bytes: bytes,
+):
+    packet_bytes = Packer(packet_type()).pack(**fields_to_pack)
+    if extra_bytes:
+        packet_bytes += extra_bytes
+    else:
+        packet_bytes = packet_bytes[:-1]
+    with pytest.raises((UnpackerValueError, ValueError)):
+        _unpack(packet_bytes, packet_type())
+
+
+def test_unpack_header_too_short():
+    with pytest.raises(UnpackerValueError):
+        Unpacker(Request()).unpack_header(b'\x02\x65')
+
+
+@pytest.mark.parametrize(
+    'packet_type,fields_to_pack,expected_fields',
+    [(RegisterRequest,
+      {'client_name': 'alice', 'public_key': PUBLIC_KEY},
+      {'version': 3, 'code': 100, 'payload_size': 1 + 5 + 2 + 270,
+       'sender_client_id': 0, 'client_name': 'alice',
+       'public_key': PUBLIC_KEY}),
+     (ListClientsResponse,
+      {'clients': (
+          (1, 'alice'), (2 ** 128 - 1, '0bob'), (3, ''))},
+      {'version': 3, 'code': 1001, 'payload_size': 3 * 17 + 5 + 4,
+       'clients': (
+          (1, 'alice'), (2 ** 128 - 1, '0bob'), (3, ''))}),
+     (PublicKeyResponse,
+      {'requested_client_id': 2, 'public_key': PUBLIC_KEY},
+      {'version': 3, 'code': 1002, 'payload_size': 16 + 2 + 270,
+       'requested_client_id': 2, 'public_key': PUBLIC_KEY}),
+     (SendFileRequest,
+      {'sender_client_id': 1, 'receiver_client_id': 2, 'content': b'abc'},
+      {'version': 3, 'code': 103, 'payload_size': 24,
+       'sender_client_id': 1, 'receiver_client_id': 2, 'message_type': 4,
+       'content_size': 3, 'content': b'abc'}),
+     (VersionRequest,
+      {},
+      {'version': 3, 'code': 106, 'payload_size': 0,
+       'sender_client_id': 0}),
+     (VersionResponse,
+      {'max_version': 3},
+      {'version': 3, 'code': 1006, 'payload_size': 1, 'max_version': 3})],
+)
+def test_unpack_packed_v3(
+        packet_type, fields_to_pack: FieldsValues,
+        expected_fields: FieldsValues,
+):
+    packet_bytes = Packer(packet_type(), 3).pack(**fields_to_pack)
+    # the version is detected from the header
+    assert _unpack(packet_bytes, packet_type()) == expected_fields
+
+
+def test_unpack_unsupported_version():
+    packet_bytes = bytearray(Packer(ListClientsRequest()).pack(
+        sender_client_id=1))
+    packet_bytes[0] = 4
+    with pytest.raises(UnpackerValueError):
+        Unpacker(Request()).unpack_header(packet_bytes)
+
+
+def test_unpack_unexpected_version():
+    packet_bytes = Packer(ErrorResponse(), 3).pack()
+    with pytest.raises(FieldBaseValueError):
+        Unpacker(ErrorResponse(), 2).unpack_header(packet_bytes)
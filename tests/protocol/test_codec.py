@@ -0,0 +1,92 @@
+import pytest
+
+from common.exceptions import FieldBaseValueError
+from common.packer import Packer
+from protocol.fields.codec import StructCodec
+from protocol.fields.payload import ClientName, PublicKey
+from protocol.fields.message import MessageContent
+from protocol.packets.request.base import Request
+from protocol.packets.request.requests import RegisterRequest, \
+    ListClientsRequest
+from protocol.packets.request.messages import PushMessageRequest, \
+    SendFileRequest, SendMessageRequest
+from protocol.packets.response.responses import PushMessageResponse, \
+    PopMessagesResponse
+
+
+@pytest.mark.parametrize(
+    'packet_type,expected_format,expected_dynamic_fields',
+    [(RegisterRequest, '<255s271s', ()),
+     (ListClientsRequest, '<', ()),
+     (PushMessageRequest, '<16sBI', ('content', )),
+     (SendFileRequest, '<16sBI', ('content', )),
+     (PushMessageResponse, '<16s5s', ()),
+     (PopMessagesResponse, '<', ('messages', ))],
+)
+def test_payload_codec_compiled(
+        packet_type, expected_format: str, expected_dynamic_fields,
+):
+    codec = packet_type.schema.payload_codec
+    assert codec.struct.format == expected_format
+    assert tuple(field.name for field in codec.dynamic_fields) == \
+        expected_dynamic_fields
+    assert (packet_type.schema.packet_codec is None) \
+        == bool(expected_dynamic_fields)
+
+
+def test_fixed_length_packet_single_struct():
+    packet_bytes = Packer(PushMessageResponse()).pack(
+        receiver_client_id=2, message_id=17)
+    assert packet_bytes == \
+        b'\x02' + (1003).to_bytes(2, 'little') + (21).to_bytes(4, 'little') \
+        + (2).to_bytes(16, 'little') + (17).to_bytes(5, 'little')
+
+
+@pytest.mark.parametrize(
+    'values',
+    [('a' * 256, 'key'),
+     ('name', 1),
+     (None, 'key')],
+)
+def test_pack_invalid_values(values):
+    codec = StructCodec((ClientName(), PublicKey()))
+    with pytest.raises(FieldBaseValueError):
+        codec.pack(values)
+
+
+def test_pack_invalid_int():
+    with pytest.raises(FieldBaseValueError):
+        Packer(PushMessageResponse()).pack(
+            receiver_client_id=2 ** 128, message_id=17)
+
+
+def test_unpack_static_value():
+    packet_bytes = Packer(SendFileRequest()).pack(
+        sender_client_id=1, receiver_client_id=2, content=b'file')
+    payload = memoryview(packet_bytes)[22:]
+    values, _ = SendFileRequest.schema.payload_codec.unpack_from(payload)
+    assert values == [2, SendFileRequest.MESSAGE_TYPE, 4]
+    with pytest.raises(FieldBaseValueError):
+        SendMessageRequest.schema.payload_codec.unpack_from(payload)
+
+
+def test_codec_without_fixed_fields():
+    codec = StructCodec((MessageContent(), ))
+    assert codec.pack(()) == b''
+    assert codec.unpack_from(memoryview(b'abc'), 0) == ([], 0)
+
+
+def test_schema_shared_and_immutable():
+    assert RegisterRequest().schema is RegisterRequest().schema
+    with pytest.raises(AttributeError):
+        RegisterRequest.schema.header_codec = None
+    with pytest.raises(AttributeError):
+        ClientName().length = 1
+
+
+def test_header_values_of_packet_type():
+    packet_bytes = Packer(RegisterRequest()).pack(
+        client_name='name', public_key='key')
+    assert packet_bytes[:Request.HEADER_LENGTH] == \
+        b'\x02' + (100).to_bytes(1, 'little') + (526).to_bytes(4, 'little') \
+        + (0).to_bytes(16, 'little')
@@ -0,0 +1,99 @@
+import pytest
+
+from common.exceptions import FieldBaseValueError
+from protocol.fields.base import VarString, Compound, pack_varint, \
+    unpack_varint
+from protocol.fields.message import Messages
+from protocol.fields.payload import ClientName, Clients
+
+
+@pytest.mark.parametrize(
+    'value,expected_bytes',
+    [(0, b'\x00'),
+     (127, b'\x7f'),
+     (128, b'\x80\x01'),
+     (271, b'\x8f\x02'),
+     (2 ** 64 - 1, b'\xff' * 9 + b'\x01')],
+)
+def test_varint(value: int, expected_bytes: bytes):
+    assert pack_varint(value) == expected_bytes
+    buffer = memoryview(b'\xaa' + expected_bytes + b'\xbb')
+    assert unpack_varint(buffer, 1) == (value, 1 + len(expected_bytes))
+
+
+@pytest.mark.parametrize('varint_bytes', [b'', b'\x80', b'\xff' * 11])
+def test_unpack_varint_invalid(varint_bytes: bytes):
+    with pytest.raises(FieldBaseValueError):
+        unpack_varint(memoryview(varint_bytes), 0)
+
+
+def test_var_string():
+    field = VarString(name='name', max_length=5)
+    assert field.pack('ab') == b'\x02ab'
+    assert field.unpack(memoryview(b'\x02abc'), 0) == ('ab', 3)
+    with pytest.raises(FieldBaseValueError):
+        field.pack('abcdef')
+    with pytest.raises(FieldBaseValueError):
+        field.unpack(memoryview(b'\x06abcdef'), 0)
+    with pytest.raises(FieldBaseValueError):
+        field.unpack(memoryview(b'\x03ab'), 0)
+
+
+def test_fields_for_version():
+    client_name = ClientName()
+    assert client_name.for_version(2) is client_name
+    var_client_name = client_name.for_version(3)
+    assert isinstance(var_client_name, VarString)
+    assert var_client_name.max_length == ClientName.LENGTH
+
+    clients = Clients()
+    assert clients.for_version(2) is clients
+    var_clients = clients.for_version(3)
+    assert isinstance(var_clients, Compound)
+    assert var_clients.compound_length == 16
+    assert [type(field) for field in var_clients.fields] == \
+        [type(clients.fields[0]), VarString]
+
+
+@pytest.mark.parametrize(
+    'field,rows',
+    [(Clients(), ((1, 'alice'), (2 ** 128 - 1, 'bob'))),
+     (Clients().for_version(3), ((1, 'alice'), (2, ''))),
+     (Messages(), ((1, 10, 3, 5, b'hello'), (2, 11, 1, 0, b'')))],
+)
+def test_compound_rows(field: Compound, rows: tuple):
+    packed = field.pack(rows)
+    assert field.pack(()) == b''
+    assert b''.join(b''.join(field.pack_row_buffers(row))
+                    for row in rows) == packed
+    buffer = memoryview(b'\xaa' + packed)
+    assert field.unpack(buffer, 1) == (rows, len(buffer))
+
+
+def test_compound_content_not_copied():
+    content = b'x' * 1024
+    buffers = Messages().pack_buffers(((1, 10, 3, len(content), content), ))
+    assert buffers[-1] is content
+
+
+@pytest.mark.parametrize(
+    'field,rows',
+    [(Clients(), (1, 'alice')),
+     (Clients(), ((1, 'alice', 2), )),
+     (Clients(), ((1, 'a' * 256), )),
+     (Messages(), ((1, 10, 3, 4, b'hello'), ))],
+)
+def test_compound_pack_invalid(field: Compound, rows: tuple):
+    with pytest.raises(FieldBaseValueError):
+        field.pack(rows)
+
+
+@pytest.mark.parametrize(
+    'field,rows',
+    [(Clients(), ((1, 'alice'), )),
+     (Messages(), ((1, 10, 3, 5, b'hello'), ))],
+)
+def test_compound_unpack_partial_row(field: Compound, rows: tuple):
+    packed = field.pack(rows)
+    with pytest.raises(FieldBaseValueError):
+        field.unpack(memoryview(packed[:-1]), 0)
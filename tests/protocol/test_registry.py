@@ -0,0 +1,47 @@
+import pytest
+
+from common.exceptions import PacketBaseValueError
+from protocol.packets.base import PacketBase
+from protocol.packets.request.base import Request
+from protocol.packets.request.requests import RegisterRequest, \
+    PopMessagesRequest, VersionRequest
+from protocol.packets.request.messages import PushMessageRequest, \
+    SendFileRequest, GetSymmetricKeyRequest
+from protocol.packets.response.base import Response
+from protocol.packets.response.responses import PushMessageResponse, \
+    ErrorResponse, VersionResponse
+
+
+@pytest.mark.parametrize(
+    'packet, code, expected_type',
+    [(Request, RegisterRequest.CODE, RegisterRequest),
+     (Request, PopMessagesRequest.CODE, PopMessagesRequest),
+     (Request, PushMessageRequest.CODE, PushMessageRequest),
+     (Request, VersionRequest.CODE, VersionRequest),
+     (Response, VersionResponse.CODE, VersionResponse),
+     (Response, ErrorResponse.CODE, ErrorResponse),
+     (PacketBase, PushMessageResponse.CODE, PushMessageResponse),
+     (PushMessageResponse, PushMessageResponse.CODE, PushMessageResponse)],
+)
+def test_type_by_code(packet, code: int, expected_type):
+    assert packet.type_by_code(code) is expected_type
+
+
+@pytest.mark.parametrize(
+    'packet, code',
+    [(Request, ErrorResponse.CODE),
+     (Response, RegisterRequest.CODE),
+     (PushMessageResponse, ErrorResponse.CODE),
+     (PacketBase, 255)],
+)
+def test_type_by_code_fail(packet, code: int):
+    with pytest.raises(PacketBaseValueError):
+        packet.type_by_code(code)
+
+
+def test_type_by_message_type():
+    assert PushMessageRequest.type_by_message_type(4) is SendFileRequest
+    assert PushMessageRequest.type_by_message_type(1) is \
+        GetSymmetricKeyRequest
+    with pytest.raises(PacketBaseValueError):
+        PushMessageRequest.type_by_message_type(5)
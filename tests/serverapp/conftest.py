@@ -0,0 +1,44 @@
+import os
+import sys
+
+import pytest
+
+from serverapp.metrics import metrics
+
+
+@pytest.fixture(autouse=True)
+def django_settings(monkeypatch):
+    monkeypatch.setenv('DJANGO_SETTINGS_MODULE', 'serverdb.settings')
+    metrics.reset()
+
+
+@pytest.fixture(scope='session')
+def _database(tmp_path_factory):
+    """Sets Django up with a fresh, migrated SQLite database (and blobs
+      directory) for the whole session."""
+    import django
+
+    if django.VERSION < (3, 2) and sys.version_info >= (3, 10):
+        pytest.skip(f"Django {django.get_version()} does not run on Python "
+                    f"{sys.version_info.major}.{sys.version_info.minor}.")
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'serverdb.settings')
+    from django.conf import settings
+
+    db_dir = tmp_path_factory.mktemp('database')
+    settings.DATABASES['default']['NAME'] = str(db_dir / 'server.db')
+    settings.MESSAGEU_BLOB_DIR = str(db_dir / 'blobs')
+    django.setup()
+
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+
+
+@pytest.fixture
+def db(_database):
+    """The test database, emptied after the test. Its rows are committed, so
+      they are seen by other threads - e.g. a committer thread."""
+    yield
+    from serverapp.models import Client, Message
+
+    Message.objects.all().delete()
+    Client.objects.all().delete()
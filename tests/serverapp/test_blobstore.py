@@ -0,0 +1,79 @@
+import io
+import os
+import time
+import hashlib
+
+import pytest
+
+from serverapp.blobstore import BlobStore
+
+
+class _StaticBlobStore(BlobStore):
+    """Checks the references of blobs against a set, instead of the database.
+    """
+
+    def __init__(self, root):
+        super(_StaticBlobStore, self).__init__(root)
+        self.references = set()
+
+    def _referenced(self, digests):
+        return self.references & set(digests)
+
+
+@pytest.fixture
+def blobs(tmp_path):
+    return _StaticBlobStore(tmp_path)
+
+
+def _age(path, seconds):
+    mtime = time.time() - seconds
+    os.utime(path, (mtime, mtime))
+
+
+@pytest.mark.parametrize('content', (b'content' * 1000, b''))
+def test_put(blobs, content):
+    digest = blobs.put(content)
+    assert digest == hashlib.sha256(content).hexdigest()
+    assert blobs.read(digest) == content
+    assert blobs.path(digest).startswith(os.path.join(blobs.root, digest[:2]))
+
+
+def test_put_file(blobs, monkeypatch):
+    monkeypatch.setattr(BlobStore, 'CHUNK_SIZE', 7)
+    content = os.urandom(100)
+    file = io.BytesIO(content)
+    file.read()
+    assert blobs.read(blobs.put(file)) == content
+    assert os.listdir(blobs.root) == [blobs.put(content)[:2]]
+
+
+def test_ensure(blobs):
+    digest = blobs.put(b'content')
+    blobs.release([digest])
+    assert not os.path.exists(blobs.path(digest))
+    blobs.ensure(digest, io.BytesIO(b'content'))
+    assert blobs.read(digest) == b'content'
+
+
+def test_release_referenced(blobs):
+    kept, released = blobs.put(b'kept'), blobs.put(b'released')
+    blobs.references.add(kept)
+    blobs.release([kept, released])
+    assert os.path.exists(blobs.path(kept))
+    assert not os.path.exists(blobs.path(released))
+
+
+def test_collect_garbage(blobs):
+    kept, recent, deleted = \
+        blobs.put(b'kept'), blobs.put(b'recent'), blobs.put(b'deleted')
+    blobs.references.add(kept)
+    temp_path = os.path.join(blobs.root, BlobStore.TEMP_PREFIX + 'failed')
+    open(temp_path, 'wb').close()
+    for path in (blobs.path(kept), blobs.path(deleted), temp_path):
+        _age(path, BlobStore.GC_GRACE + 1)
+
+    assert blobs.collect_garbage() == 2
+    assert os.path.exists(blobs.path(kept))
+    assert os.path.exists(blobs.path(recent))
+    assert not os.path.exists(blobs.path(deleted))
+    assert not os.path.exists(temp_path)
@@ -0,0 +1,116 @@
+import time
+
+import pytest
+
+from common.packer import Packer
+from protocol.packets.response.responses import ListClientsResponse, \
+    PublicKeyResponse
+from serverapp.directory import ClientDirectory
+
+
+class _StaticDirectory(ClientDirectory):
+    """Fetches the clients from a dict instead of from the database."""
+
+    def __init__(self, clients):
+        super(_StaticDirectory, self).__init__()
+        self.registered = clients
+        self.fetches = 0
+        self.fetched_after = []
+
+    def _fetch(self, after_id):
+        self.fetches += 1
+        self.fetched_after.append(after_id)
+        return [(client_id, name, public_key)
+                for client_id, (name, public_key)
+                in sorted(self.registered.items()) if client_id > after_id]
+
+    def _fetch_ids(self):
+        return set(self.registered)
+
+
+@pytest.fixture
+def directory():
+    directory = _StaticDirectory(
+        {2: ('bob', 'B' * 160), 1: ('alice', 'A' * 160)})
+    directory.load()
+    return directory
+
+
+@pytest.mark.parametrize('version', (2, 3))
+def test_list_clients_response_cached(directory, version):
+    response = directory.list_clients_response(version)
+    assert response == Packer(ListClientsResponse(), version).pack(
+        clients=((1, 'alice'), (2, 'bob')))
+    assert directory.list_clients_response(version) is response
+
+
+def test_list_clients_response_after_add(directory):
+    response = directory.list_clients_response(2)
+    directory.add(3, 'carol', 'C' * 160)
+    assert directory.list_clients_response(2) == \
+        Packer(ListClientsResponse(), 2).pack(
+            clients=((1, 'alice'), (2, 'bob'), (3, 'carol')))
+    # adding a known client does not drop the packed responses
+    response = directory.list_clients_response(2)
+    directory.add(3, 'carol', 'C' * 160)
+    assert directory.list_clients_response(2) is response
+
+
+def test_public_key_response_cached(directory):
+    response = directory.public_key_response(2, 3)
+    assert response == Packer(PublicKeyResponse(), 3).pack(
+        requested_client_id=2, public_key='B' * 160)
+    assert directory.public_key_response(2, 3) is response
+
+
+def test_public_key_response_loads_unknown_client(directory):
+    assert directory.public_key_response(3, 2) is None
+    directory.registered[3] = ('carol', 'C' * 160)
+    assert directory.public_key_response(3, 2) == \
+        Packer(PublicKeyResponse(), 2).pack(
+            requested_client_id=3, public_key='C' * 160)
+    assert directory.fetches == 3
+
+
+def test_refresh_drops_deleted_clients(directory):
+    assert directory.public_key_response(2, 2) is not None
+    directory.list_clients_response(2)
+    del directory.registered[2]
+    directory.registered[3] = ('carol', 'C' * 160)
+    directory.refresh()
+    assert directory.list_clients_response(2) == \
+        Packer(ListClientsResponse(), 2).pack(
+            clients=((1, 'alice'), (3, 'carol')))
+    # only the clients registered since were fetched
+    assert directory.fetched_after == [0, 2]
+    assert directory.public_key_response(2, 2) is None
+    assert directory.get(2) is None
+
+
+def test_refresh_in_background(directory):
+    directory.start(0.01)
+    directory.registered[3] = ('carol', 'C' * 160)
+    time.sleep(0.1)
+    directory.stop()
+    fetches = directory.fetches
+    time.sleep(0.05)
+    assert directory.fetches == fetches
+    assert directory.list_clients_response(2) == \
+        Packer(ListClientsResponse(), 2).pack(
+            clients=((1, 'alice'), (2, 'bob'), (3, 'carol')))
+
+
+def test_refresh_from_database(db):
+    from serverapp.models import Client
+
+    alice = Client.objects.create(name='alice', public_key='A' * 160)
+    bob = Client.objects.create(name='bob', public_key='B' * 160)
+    directory = ClientDirectory()
+    directory.load()
+    assert directory.get(bob.id) == ('bob', 'B' * 160)
+    bob.delete()
+    carol = Client.objects.create(name='carol', public_key='C' * 160)
+    directory.refresh()
+    assert directory.get(bob.id) is None
+    assert directory.get(carol.id) == ('carol', 'C' * 160)
+    assert directory.get(alice.id) == ('alice', 'A' * 160)
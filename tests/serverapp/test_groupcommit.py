@@ -0,0 +1,142 @@
+import threading
+
+import pytest
+
+from common.exceptions import ServerAppException
+from serverapp.groupcommit import GroupCommitter
+from serverapp.metrics import metrics
+
+
+class _RecordingInsert:
+    """Records the inserted batches instead of inserting them to the database,
+      and fails batches holding a row in `failing`."""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.batches = []
+        self.last_id = 0
+
+    def __call__(self, rows):
+        if self.failing.intersection(rows):
+            raise ValueError("invalid message")
+        self.batches.append(list(rows))
+        first_id, self.last_id = self.last_id + 1, self.last_id + len(rows)
+        return list(range(first_id, self.last_id + 1))
+
+
+class _Crash(BaseException):
+    """Not caught by the committer's retries, like SystemExit."""
+
+
+def _push_concurrently(committer, rows):
+    results = {}
+
+    def push(row):
+        try:
+            results[row] = committer.push(row)
+        except (ValueError, ServerAppException) as e:
+            results[row] = e
+
+    threads = [threading.Thread(target=push, args=(row, )) for row in rows]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_inserts_before_start_and_after_stop():
+    insert = _RecordingInsert()
+    committer = GroupCommitter(insert, interval=0, batch_size=8)
+    assert committer.push('a') == 1
+    committer.start()
+    committer.stop()
+    assert committer.push('b') == 2
+    assert insert.batches == [['a'], ['b']]
+
+
+def test_batches_concurrent_pushes():
+    insert = _RecordingInsert()
+    committer = GroupCommitter(insert, interval=0.5, batch_size=4)
+    committer.start()
+    results = _push_concurrently(committer, list(range(8)))
+    committer.stop()
+    assert sorted(map(len, insert.batches)) == [4, 4]
+    # each push gets the ID of its own row
+    inserted = [row for batch in insert.batches for row in batch]
+    assert results == {row: idx + 1 for idx, row in enumerate(inserted)}
+    assert metrics.snapshot()['group_commit_count'] == 2
+    assert metrics.snapshot()['group_commit_messages'] == 8
+
+
+def test_failed_batch_is_retried_by_row():
+    insert = _RecordingInsert(failing=[2])
+    committer = GroupCommitter(insert, interval=0.5, batch_size=4)
+    committer.start()
+    results = _push_concurrently(committer, list(range(4)))
+    committer.stop()
+    assert isinstance(results.pop(2), ValueError)
+    assert sorted(results) == [0, 1, 3]
+    assert all(len(batch) == 1 for batch in insert.batches)
+    assert metrics.snapshot()['group_commit_errors'] == 1
+
+
+def test_push_times_out():
+    unblocked = threading.Event()
+
+    def insert(rows):
+        unblocked.wait()
+        return list(range(len(rows)))
+
+    committer = GroupCommitter(insert, interval=0, batch_size=4, timeout=0.1)
+    committer.start()
+    results = _push_concurrently(committer, list(range(2)))
+    unblocked.set()
+    committer.stop()
+    assert all(isinstance(result, ServerAppException)
+               for result in results.values())
+    assert metrics.snapshot()['group_commit_timeouts'] == 2
+
+
+@pytest.mark.filterwarnings(
+    'ignore::pytest.PytestUnhandledThreadExceptionWarning')
+def test_failed_committer_fails_pending_pushes():
+    def insert(rows):
+        if len(rows) > 1:
+            raise _Crash()
+        return [1]
+
+    committer = GroupCommitter(insert, interval=0.5, batch_size=4, timeout=5)
+    committer.start()
+    results = _push_concurrently(committer, list(range(4)))
+    assert all(isinstance(result, ServerAppException)
+               for result in results.values())
+    # later pushes are inserted by their own threads
+    assert committer.push(4) == 1
+    committer.stop()
+
+
+def test_message_ids_read_back(db):
+    from serverapp.messagestore import DjangoMessageStore
+    from serverapp.models import Client, Message
+
+    sender_id, receiver_id = (
+        Client.objects.create(name=name, public_key=name * 160).id
+        for name in ('a', 'b'))
+    # bulk_create inserts up to 166 messages a statement on SQLite
+    store = DjangoMessageStore(commit_interval=5, commit_batch_size=400)
+    message_ids = {}
+
+    def push(content):
+        message_ids[content] = store.push(
+            sender_id, receiver_id, 3, content, len(content))
+
+    threads = [threading.Thread(target=push, args=(str(idx).encode(), ))
+               for idx in range(400)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    store.close()
+    assert metrics.snapshot()['group_commit_count'] == 1
+    assert dict(Message.objects.values_list('content', 'id')) == message_ids
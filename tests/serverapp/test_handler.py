@@ -0,0 +1,215 @@
+import time
+import threading
+
+import pytest
+
+from clientapp.handler import ClientHandler
+from protocol.packets.request.requests import RegisterRequest, \
+    PopMessagesRequest
+from protocol.packets.request.messages import SendMessageRequest
+from protocol.packets.response.responses import PopMessagesPageResponse
+from serverapp.messagestore import MemoryMessageStore, DjangoMessageStore
+
+ROW_LENGTH = PopMessagesPageResponse.payload_fields[-1].compound_length
+
+
+@pytest.fixture(params=('memory', 'django'))
+def store(request, db, monkeypatch):
+    """The message store serving the handler, with clients 1 and 2."""
+    from serverapp import handler
+    from serverapp.models import Client
+
+    for name in ('a', 'b'):
+        Client.objects.create(name=name, public_key=name * 160)
+    store = MemoryMessageStore() if request.param == 'memory' \
+        else DjangoMessageStore()
+    monkeypatch.setattr(handler, 'message_store', lambda: store)
+    return store
+
+
+def _push(store, sizes):
+    from serverapp.models import Client
+
+    sender_id, receiver_id = Client.objects.order_by('id').values_list(
+        'id', flat=True)
+    for size in sizes:
+        store.push(sender_id, receiver_id, 3, b'x' * size, size)
+    return receiver_id
+
+
+def _pop_page(client_id, max_messages, max_messages_size):
+    """Returns whether more messages wait, and the sizes of the popped
+      contents."""
+    from serverapp.handler import ServerHandler
+
+    # a handler without a connection
+    handler = ServerHandler.__new__(ServerHandler)
+    fields = handler._pop_messages_page({
+        'sender_client_id': client_id,
+        'max_messages': max_messages,
+        'max_messages_size': max_messages_size,
+    })
+    rows = list(fields['messages'])
+    assert fields['messages_size'] == sum(
+        ROW_LENGTH + content_size for *_, content_size, _ in rows)
+    return fields['has_more_messages'], [len(row[-1]) for row in rows]
+
+
+def test_pop_page_count_budget(store):
+    client_id = _push(store, (1, 2, 3))
+    assert _pop_page(client_id, 2, 0) == (1, [1, 2])
+    assert _pop_page(client_id, 2, 0) == (0, [3])
+    assert _pop_page(client_id, 2, 0) == (0, [])
+
+
+def test_pop_page_size_budget(store):
+    client_id = _push(store, (10, 10, 10))
+    assert _pop_page(client_id, 0, 2 * (ROW_LENGTH + 10) + 5) == (1, [10, 10])
+    assert _pop_page(client_id, 0, 2 * (ROW_LENGTH + 10) + 5) == (0, [10])
+
+
+def test_pop_page_oversized_first_message(store):
+    client_id = _push(store, (100, 1))
+    assert _pop_page(client_id, 0, 10) == (1, [100])
+    assert _pop_page(client_id, 0, 10) == (0, [1])
+
+
+def test_pop_page_unlimited(store):
+    client_id = _push(store, (5, ) * 20)
+    assert _pop_page(client_id, 0, 0) == (0, [5] * 20)
+
+
+def test_methods_resolved_per_handler_class(db):
+    from protocol.packets.request.requests import VersionRequest
+    from serverapp.handler import ServerHandler
+
+    class _Handler(ServerHandler):
+        def _version(self, fields):
+            return {'max_version': 2}
+
+    class _Message(SendMessageRequest):
+        """Defined after the handler classes."""
+
+    assert ServerHandler._request_type_to_method(VersionRequest) \
+        is ServerHandler._version
+    assert _Handler._request_type_to_method(VersionRequest) \
+        is _Handler._version
+    assert ServerHandler._methods[SendMessageRequest] \
+        is ServerHandler._push_message
+    assert _Handler._request_type_to_method(_Message) is _Handler._push_message
+
+
+def _start_threading():
+    from serverapp.handler import ServerHandler
+    from serverapp.poolserver import PooledTCPServer
+
+    server = PooledTCPServer(
+        ('127.0.0.1', 0), ServerHandler, workers=2, queue_size=2)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+
+    def stop():
+        server.shutdown()
+        server.server_close()
+        thread.join()
+    return server.server_address[1], stop
+
+
+def _start_asyncio():
+    from serverapp.asyncserver import AsyncServer
+
+    server = AsyncServer(('127.0.0.1', 0), executor_workers=2)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    server.started.wait()
+
+    def stop():
+        server.shutdown()
+        thread.join()
+    return server.server_address[1], stop
+
+
+@pytest.fixture(
+    params=(_start_threading, _start_asyncio), ids=('threading', 'asyncio'))
+def server_port(request, db, monkeypatch):
+    """Serves on a free port with the engine, from a fresh directory and
+      message store. Returns the port."""
+    from serverapp import handler
+    from serverapp.directory import ClientDirectory
+
+    store = DjangoMessageStore(commit_interval=0, commit_batch_size=16)
+    monkeypatch.setattr(handler, 'message_store', lambda: store)
+    monkeypatch.setattr(handler, 'directory', ClientDirectory())
+    port, stop = request.param()
+    yield port
+    stop()
+    store.close()
+
+
+def _register(client_handler, name):
+    return client_handler.handle(RegisterRequest(), {
+        'client_name': name, 'public_key': name[0] * 160,
+    })['new_client_id']
+
+
+def test_connection_serves_requests(server_port):
+    from serverapp.metrics import metrics
+
+    client_handler = ClientHandler('127.0.0.1', server_port)
+    sender_id = _register(client_handler, 'alice')
+    connection = client_handler._socket
+    receiver_id = _register(client_handler, 'bob')
+    client_handler.handle(SendMessageRequest(), {
+        'sender_client_id': sender_id,
+        'receiver_client_id': receiver_id,
+        'content': b'hello',
+    })
+    fields = client_handler.handle(
+        PopMessagesRequest(), {'sender_client_id': receiver_id})
+    assert [row[-1] for row in fields['messages']] == [b'hello']
+    # the version probe and all requests were served over one connection
+    assert client_handler._socket is connection
+    client_handler.close()
+    # recorded once the last response was sent
+    deadline = time.monotonic() + 5
+    while metrics.snapshot().get('request_count') != 5:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    # by connection for the threading engine, by request for asyncio
+    assert metrics.snapshot()['queue_wait_count'] >= 1
+
+
+def test_idle_connection_closed(server_port, monkeypatch):
+    from django.conf import settings
+    from serverapp.metrics import metrics
+
+    monkeypatch.setattr(settings, 'MESSAGEU_IDLE_TIMEOUT', 0.1)
+    client_handler = ClientHandler('127.0.0.1', server_port)
+    _register(client_handler, 'alice')
+    connection = client_handler._socket
+    time.sleep(0.3)
+    # resent over a new connection
+    _register(client_handler, 'bob')
+    assert client_handler._socket is not connection
+    assert metrics.snapshot()['timeouts_idle'] == 1
+    client_handler.close()
+
+
+def test_idle_connections_released(server_port, request):
+    from serverapp.metrics import metrics
+
+    # idle connections that were served a request - one for each worker
+    idle_handlers = [ClientHandler('127.0.0.1', server_port) for _ in range(2)]
+    for idx, client_handler in enumerate(idle_handlers):
+        _register(client_handler, f'idle{idx}')
+    # the workers wait for the next requests
+    time.sleep(0.2)
+    # waits for a worker
+    client_handler = ClientHandler('127.0.0.1', server_port)
+    started = time.monotonic()
+    _register(client_handler, 'alice')
+    assert time.monotonic() - started < 1
+    if 'threading' in request.node.callspec.id:
+        assert metrics.snapshot()['connections_released'] >= 1
+    for each in idle_handlers + [client_handler]:
+        each.close()
@@ -0,0 +1,68 @@
+import threading
+
+from serverapp.lastseen import LastSeenTracker
+from serverapp.metrics import metrics
+
+
+class _RecordingTracker(LastSeenTracker):
+    """Records the written times instead of writing them to the database."""
+
+    def __init__(self, fail: bool = False):
+        super(_RecordingTracker, self).__init__()
+        self.fail = fail
+        self.writes = []
+        self.written = threading.Event()
+
+    def _write(self, pending):
+        if self.fail:
+            raise RuntimeError("database is locked")
+        self.writes.append(dict(pending))
+        self.written.set()
+
+
+def test_flush_coalesces_times():
+    tracker = _RecordingTracker()
+    tracker.touch(1)
+    tracker.touch(2)
+    tracker.touch(1)
+    latest = tracker._pending[1]
+    tracker.flush()
+    tracker.flush()
+    assert tracker.writes == [{1: latest, 2: tracker.writes[0][2]}]
+    assert metrics.snapshot()['last_seen_flush_count'] == 1
+
+
+def test_failed_flush_is_retried():
+    tracker = _RecordingTracker(fail=True)
+    tracker.touch(1)
+    tracker.touch(2)
+    failed = dict(tracker._pending)
+    tracker.flush()
+    tracker.touch(2)
+    tracker.fail = False
+    tracker.flush()
+    assert tracker.writes == [{1: failed[1], 2: tracker.writes[0][2]}]
+    assert tracker.writes[0][2] > failed[2]
+    assert metrics.snapshot()['last_seen_flush_errors'] == 1
+
+
+def test_flushes_in_background_and_on_stop():
+    tracker = _RecordingTracker()
+    tracker.start(interval=0.01)
+    tracker.touch(1)
+    assert tracker.written.wait(timeout=5)
+    tracker.touch(2)
+    tracker.stop()
+    assert [set(times) for times in tracker.writes] == [{1}, {2}]
+
+
+def test_flush_writes_to_database(db):
+    from serverapp.models import Client
+
+    client = Client.objects.create(name='alice', public_key='A' * 160)
+    tracker = LastSeenTracker()
+    tracker.touch(client.id)
+    seen = tracker._pending[client.id]
+    tracker.flush()
+    client.refresh_from_db()
+    assert client.last_seen == seen
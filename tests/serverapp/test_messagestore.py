@@ -0,0 +1,137 @@
+import io
+import os
+
+import pytest
+
+from serverapp.messagestore import MemoryMessageStore, DjangoMessageStore
+
+
+def _push(store, to_client_id, content, from_client_id=1):
+    return store.push(from_client_id, to_client_id, 3, content, len(content))
+
+
+def _pop_all(store, client_id, limit=None):
+    return list(store.pop(
+        client_id, list(store.messages_sizes(client_id, limit))))
+
+
+@pytest.fixture
+def log_path(tmp_path):
+    return str(tmp_path / 'messages.log')
+
+
+@pytest.fixture
+def client_ids(db):
+    from serverapp.models import Client
+
+    return [Client.objects.create(name=name, public_key=name * 160).id
+            for name in ('a', 'b')]
+
+
+def _limit_query_params(limit):
+    """Fails queries of more parameters than SQLite allows by default, as
+      builds of a higher SQLITE_MAX_VARIABLE_NUMBER would not."""
+    from django.db import OperationalError
+
+    def execute(execute, sql, params, many, context):
+        if not many and len(params or ()) > limit:
+            raise OperationalError("too many SQL variables")
+        return execute(sql, params, many, context)
+    return execute
+
+
+def test_push_pop():
+    store = MemoryMessageStore()
+    first = _push(store, 2, b'first')
+    _push(store, 3, b'other')
+    second = store.push(1, 2, 3, io.BytesIO(b'spooled'), 7)
+    assert list(store.messages_sizes(2)) == [(first, 5), (second, 7)]
+    assert _pop_all(store, 2) == [
+        (1, first, 3, 5, b'first'), (1, second, 3, 7, b'spooled')]
+    assert _pop_all(store, 2) == []
+    assert len(_pop_all(store, 3)) == 1
+
+
+def test_pop_limit():
+    store = MemoryMessageStore()
+    message_ids = [_push(store, 2, b'content') for _ in range(3)]
+    assert [row[1] for row in _pop_all(store, 2, limit=2)] == message_ids[:2]
+    assert [row[1] for row in _pop_all(store, 2)] == message_ids[2:]
+
+
+def test_pop_leaves_messages_pushed_meanwhile():
+    store = MemoryMessageStore()
+    first = _push(store, 2, b'first')
+    rows = store.pop(2, list(store.messages_sizes(2)))
+    assert next(rows)[1] == first
+    second = _push(store, 2, b'second')
+    assert list(rows) == []
+    assert list(store.messages_sizes(2)) == [(second, 6)]
+
+
+def test_log_replay(log_path):
+    store = MemoryMessageStore(log_path)
+    _push(store, 2, b'popped')
+    kept = _push(store, 2, b'kept')
+    _pop_all(store, 2, limit=1)
+    _push(store, 3, b'')
+    store.close()
+
+    store = MemoryMessageStore(log_path)
+    assert list(store.messages_sizes(2)) == [(kept, 4)]
+    assert len(list(store.messages_sizes(3))) == 1
+    # message IDs are not reused
+    assert _push(store, 2, b'new') > kept
+    store.close()
+
+
+def test_log_compacted(log_path):
+    store = MemoryMessageStore(log_path)
+    for _ in range(10):
+        _push(store, 2, b'x' * 100)
+    _pop_all(store, 2)
+    store.close()
+    assert os.path.getsize(log_path) > 1000
+
+    MemoryMessageStore(log_path).close()
+    assert os.path.getsize(log_path) == 0
+
+
+def test_log_record_cut_short(log_path):
+    store = MemoryMessageStore(log_path)
+    kept = _push(store, 2, b'kept')
+    _push(store, 2, b'cut short')
+    store.close()
+    with open(log_path, 'r+b') as log:
+        log.truncate(os.path.getsize(log_path) - 1)
+
+    store = MemoryMessageStore(log_path)
+    assert list(store.messages_sizes(2)) == [(kept, 4)]
+    store.close()
+
+
+def test_django_pop_many_messages(client_ids):
+    from django.db import connection
+    from serverapp.models import Message
+
+    sender_id, receiver_id = client_ids
+    Message.objects.bulk_create([
+        Message(from_client_id=sender_id, to_client_id=receiver_id,
+                message_type=1, content_size=0)
+        for _ in range(1200)])
+    store = DjangoMessageStore()
+    with connection.execute_wrapper(_limit_query_params(999)):
+        rows = _pop_all(store, receiver_id)
+    assert len(rows) == 1200
+    assert list(store.messages_sizes(receiver_id)) == []
+
+
+def test_django_pop_leaves_messages_pushed_meanwhile(client_ids):
+    sender_id, receiver_id = client_ids
+    store = DjangoMessageStore()
+    first = _push(store, receiver_id, b'first', sender_id)
+    rows = store.pop(receiver_id, list(store.messages_sizes(receiver_id)))
+    assert next(rows) == (sender_id, first, 3, 5, b'first')
+    second = _push(store, receiver_id, b'second', sender_id)
+    assert list(rows) == []
+    assert list(store.messages_sizes(receiver_id)) == [(second, 6)]
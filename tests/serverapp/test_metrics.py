@@ -0,0 +1,27 @@
+import time
+import logging
+
+from serverapp.metrics import metrics
+
+
+def test_snapshot():
+    metrics.increment('connections_rejected')
+    metrics.increment('connections_rejected', 2)
+    metrics.observe('queue_wait', 1)
+    metrics.observe('queue_wait', 3)
+    assert metrics.snapshot() == {
+        'connections_rejected': 3,
+        'queue_wait_count': 2, 'queue_wait_mean': 2, 'queue_wait_max': 3,
+    }
+
+
+def test_logged_while_started(caplog):
+    caplog.set_level(logging.INFO, logger='serverapp.metrics')
+    metrics.increment('connections_rejected')
+    metrics.start(0.01)
+    time.sleep(0.1)
+    metrics.increment('connections_rejected')
+    metrics.stop()
+    assert len(caplog.records) >= 3
+    # and once more when stopped
+    assert "'connections_rejected': 2" in caplog.records[-1].getMessage()
@@ -0,0 +1,95 @@
+import time
+import socket
+import threading
+import socketserver
+
+import pytest
+
+from common.packer import Packer
+from protocol.packets.response.responses import ErrorResponse
+from serverapp.metrics import metrics
+from serverapp.poolserver import PooledTCPServer, PooledUnixListener
+
+
+class _BlockingHandler(socketserver.BaseRequestHandler):
+    """Echoes a single byte once released."""
+
+    release = threading.Event()
+    client_addresses = []
+
+    def handle(self) -> None:
+        _BlockingHandler.client_addresses.append(self.client_address)
+        _BlockingHandler.release.wait(timeout=5)
+        self.request.sendall(self.request.recv(1))
+
+
+@pytest.fixture
+def server():
+    _BlockingHandler.release.clear()
+    metrics.reset()
+    server = PooledTCPServer(
+        ('127.0.0.1', 0), _BlockingHandler, workers=1, queue_size=1)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield server
+    _BlockingHandler.release.set()
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def _connect(server: PooledTCPServer) -> socket.socket:
+    return socket.create_connection(server.server_address, timeout=5)
+
+
+def _wait_for(condition) -> None:
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_rejects_connections_beyond_queue(server):
+    served = _connect(server)
+    served.sendall(b'a')
+    # the worker takes the first connection, the second waits in the queue
+    _wait_for(lambda: metrics.snapshot().get('queue_wait_count') == 1)
+    queued = _connect(server)
+    queued.sendall(b'b')
+    _wait_for(lambda: server.busy)
+    rejected = _connect(server)
+    assert rejected.recv(64) == Packer(ErrorResponse()).pack()
+    assert rejected.recv(64) == b''
+
+    _BlockingHandler.release.set()
+    assert served.recv(1) == b'a'
+    assert queued.recv(1) == b'b'
+    snapshot = metrics.snapshot()
+    assert snapshot['connections_rejected'] == 1
+    assert snapshot['queue_wait_count'] == 2
+    for sock in (served, queued, rejected):
+        sock.close()
+
+
+def test_unix_listener_shares_pool(server, tmp_path):
+    path = str(tmp_path / 'server.sock')
+    unix_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    unix_socket.bind(path)
+    unix_socket.listen()
+    listener = PooledUnixListener(unix_socket, server)
+    thread = threading.Thread(target=listener.serve_forever)
+    thread.start()
+    _BlockingHandler.client_addresses.clear()
+    _BlockingHandler.release.set()
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(5)
+            client.connect(path)
+            client.sendall(b'u')
+            assert client.recv(1) == b'u'
+        assert metrics.snapshot()['queue_wait_count'] == 1
+        assert _BlockingHandler.client_addresses == [(f'unix:{path}', 0)]
+    finally:
+        listener.shutdown()
+        listener.server_close()
+        thread.join()
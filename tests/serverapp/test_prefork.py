@@ -0,0 +1,111 @@
+import os
+import sys
+import time
+import signal
+import threading
+
+import pytest
+
+from serverapp.prefork import PreforkSupervisor
+
+
+@pytest.fixture
+def started_pipe(monkeypatch):
+    """A pipe each worker writes its pid to, upon starting."""
+    monkeypatch.setattr(PreforkSupervisor, 'RESTART_DELAY', 0)
+    handlers = {signum: signal.getsignal(signum)
+                for signum in (signal.SIGTERM, signal.SIGINT)}
+    read_fd, write_fd = os.pipe()
+    yield read_fd, write_fd
+    os.close(read_fd)
+    os.close(write_fd)
+    for signum, handler in handlers.items():
+        signal.signal(signum, handler)
+
+
+def _read_pid(read_fd: int) -> int:
+    return int.from_bytes(os.read(read_fd, 4), 'little')
+
+
+def test_restarts_dead_workers(started_pipe):
+    read_fd, write_fd = started_pipe
+
+    def serve() -> None:
+        os.write(write_fd, os.getpid().to_bytes(4, 'little'))
+        time.sleep(60)
+
+    supervisor = PreforkSupervisor(serve, processes=2)
+    pids = []
+
+    def kill_one_and_shutdown() -> None:
+        pids.extend((_read_pid(read_fd), _read_pid(read_fd)))
+        os.kill(pids[0], signal.SIGKILL)
+        pids.append(_read_pid(read_fd))
+        supervisor.shutdown()
+
+    thread = threading.Thread(target=kill_one_and_shutdown)
+    thread.start()
+    supervisor.serve_forever()
+    thread.join()
+    assert len(set(pids)) == 3
+    assert supervisor._workers == {}
+
+
+def test_terminated_workers_unwind(started_pipe):
+    read_fd, write_fd = started_pipe
+
+    def serve() -> None:
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        try:
+            os.write(write_fd, os.getpid().to_bytes(4, 'little'))
+            time.sleep(60)
+        finally:
+            os.write(write_fd, b'done')
+
+    supervisor = PreforkSupervisor(serve, processes=1)
+
+    def shutdown() -> None:
+        pid = _read_pid(read_fd)
+        while pid not in supervisor._workers:
+            time.sleep(0.01)
+        supervisor.shutdown()
+
+    thread = threading.Thread(target=shutdown)
+    thread.start()
+    supervisor.serve_forever()
+    thread.join()
+    assert os.read(read_fd, 4) == b'done'
+
+
+def test_interrupted_workers_unwind(started_pipe):
+    read_fd, write_fd = started_pipe
+
+    def serve() -> None:
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        try:
+            os.write(write_fd, os.getpid().to_bytes(4, 'little'))
+            time.sleep(60)
+        finally:
+            os.write(write_fd, b'done')
+
+    supervisor = PreforkSupervisor(serve, processes=1)
+
+    def interrupt() -> None:
+        pid = _read_pid(read_fd)
+        while pid not in supervisor._workers:
+            time.sleep(0.01)
+        # as Ctrl+C does, to the whole process group
+        os.kill(pid, signal.SIGINT)
+        # a signal arriving just before the supervisor blocks in os.wait()
+        #  is handled only once it returns, so repeat until handled
+        while not supervisor._stopping:
+            signal.pthread_kill(threading.main_thread().ident, signal.SIGINT)
+            time.sleep(0.05)
+
+    thread = threading.Thread(target=interrupt)
+    thread.start()
+    supervisor.serve_forever()
+    thread.join()
+    # the worker exited already
+    os.set_blocking(read_fd, False)
+    assert os.read(read_fd, 4) == b'done'
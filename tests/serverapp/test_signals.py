@@ -0,0 +1,37 @@
+import sqlite3
+import contextlib
+
+from serverapp.signals import configure_sqlite
+
+
+class _Connection:
+    """A Django database connection wrapping an sqlite3 connection."""
+
+    def __init__(self, path, vendor='sqlite'):
+        self.vendor = vendor
+        self.connection = sqlite3.connect(path)
+
+    @contextlib.contextmanager
+    def cursor(self):
+        cursor = self.connection.cursor()
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+
+    def pragma(self, name):
+        return self.connection.execute(f'PRAGMA {name}').fetchone()[0]
+
+
+def test_configure_sqlite(tmp_path):
+    connection = _Connection(str(tmp_path / 'server.db'))
+    configure_sqlite(sender=None, connection=connection)
+    assert connection.pragma('journal_mode') == 'wal'
+    assert connection.pragma('synchronous') == 1  # NORMAL
+    assert connection.pragma('cache_size') == -2 ** 16
+
+
+def test_configure_other_vendors(tmp_path):
+    connection = _Connection(str(tmp_path / 'server.db'), vendor='postgresql')
+    configure_sqlite(sender=None, connection=connection)
+    assert connection.pragma('journal_mode') == 'delete'